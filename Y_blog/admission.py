@@ -0,0 +1,225 @@
+"""
+Модуль для контроля нагрузки (admission control) перед endpoint`ами `/api`.
+
+Одновременно обрабатывается не больше `ADMISSION_MAX_CONCURRENCY` запросов (и не больше
+лимита из `ADMISSION_ROUTE_LIMITS` для отдельных endpoint`ов). Остальные ждут в очереди
+длиной не больше `ADMISSION_MAX_QUEUE` не дольше `ADMISSION_QUEUE_TIMEOUT` секунд.
+Если очередь заполнена или время ожидания вышло, клиент сразу получает `503` с
+`Retry-After`, а не ждёт подключения к медленной БД вместе со всеми.
+Освободившееся место отдаётся сначала изменяющим запросам (POST/DELETE и т.п.),
+а потом чтению: опрос ленты не задерживает публикацию твитов.
+Служебные endpoint`ы (`/api/service/`) не ограничиваются.
+"""
+
+import asyncio
+from collections import Counter, deque
+
+import orjson
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import (
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_RETRY_AFTER,
+    ADMISSION_ROUTE_LIMITS,
+)
+
+
+WRITE_PRIORITY = 0
+READ_PRIORITY = 1
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+UNMATCHED_ROUTE = "unmatched"
+
+
+class AdmissionController:
+    """
+    Ограничитель одновременно выполняемых запросов с очередью по приоритетам.
+    Запрос занимает одно место в общем лимите и одно - в лимите своего endpoint`а.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        route_limits: dict[tuple[str, str], int] | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.route_limits = dict(route_limits or {})
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed: Counter[str] = Counter()
+        self._route_in_flight: Counter[tuple[str, str]] = Counter()
+        self._queues: tuple[deque, deque] = (deque(), deque())
+
+    @property
+    def queued(self) -> int:
+        """Кол-во запросов, ожидающих в очереди"""
+        return sum(len(queue) for queue in self._queues)
+
+    async def acquire(self, route: tuple[str, str], priority: int) -> bool:
+        """
+        Получение места для выполнения запроса
+        :param route: `(метод, шаблон пути)` endpoint`а
+        :param priority: `WRITE_PRIORITY` или `READ_PRIORITY`
+        :return: True - запрос можно выполнять (потом вызвать `release`),
+            False - запрос отклонён
+        """
+        if self._can_admit(route):
+            self._admit(route)
+            return True
+        if self.queued >= self.max_queue:
+            self.shed["queue_full"] += 1
+            return False
+
+        waiter = (route, asyncio.get_running_loop().create_future())
+        self._queues[priority].append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], self.queue_timeout)
+        # до Python 3.11 `wait_for` бросает `asyncio.TimeoutError`, а не встроенный
+        # `TimeoutError`
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            granted = waiter[1].done() and not waiter[1].cancelled()
+            if not granted and waiter in self._queues[priority]:
+                self._queues[priority].remove(waiter)
+            if isinstance(error, asyncio.CancelledError):
+                if granted:
+                    self.release(route)
+                raise
+            if not granted:
+                self.shed["timeout"] += 1
+                return False
+        return True
+
+    def release(self, route: tuple[str, str]) -> None:
+        """
+        Освобождение места после выполнения запроса и запуск ожидающих
+        :param route: `(метод, шаблон пути)` endpoint`а
+        """
+        self.in_flight -= 1
+        self._route_in_flight[route] -= 1
+        for queue in self._queues:
+            for waiter in list(queue):
+                if self.in_flight >= self.max_concurrency:
+                    return
+                waiter_route, future = waiter
+                if future.done():
+                    queue.remove(waiter)
+                elif self._can_admit(waiter_route):
+                    queue.remove(waiter)
+                    self._admit(waiter_route)
+                    future.set_result(None)
+
+    def stats(self) -> dict:
+        """Текущая загрузка, длина очереди и кол-во отклонённых запросов"""
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": {
+                "write": len(self._queues[WRITE_PRIORITY]),
+                "read": len(self._queues[READ_PRIORITY]),
+            },
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": {
+                "queue_full": self.shed["queue_full"],
+                "timeout": self.shed["timeout"],
+            },
+            "routes": {
+                f"{method} {path}": in_flight
+                for (method, path), in_flight in self._route_in_flight.items()
+                if in_flight
+            },
+        }
+
+    def _can_admit(self, route: tuple[str, str]) -> bool:
+        route_limit = self.route_limits.get(route)
+        return self.in_flight < self.max_concurrency and (
+            route_limit is None or self._route_in_flight[route] < route_limit
+        )
+
+    def _admit(self, route: tuple[str, str]) -> None:
+        self.in_flight += 1
+        self._route_in_flight[route] += 1
+        self.admitted += 1
+
+
+admission_controller = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    route_limits=ADMISSION_ROUTE_LIMITS,
+)
+
+
+class AdmissionMiddleware:
+    """ASGI-middleware, пропускающее запросы к `/api` через `AdmissionController`"""
+
+    def __init__(
+        self, app: ASGIApp, controller: AdmissionController = admission_controller
+    ):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not path.startswith("/api/")
+            or path.startswith("/api/service/")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        route = (scope["method"], route_path(scope))
+        priority = READ_PRIORITY if scope["method"] in READ_METHODS else WRITE_PRIORITY
+        if not await self.controller.acquire(route, priority):
+            await _send_overloaded(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route)
+
+
+def route_path(scope: Scope) -> str:
+    """
+    Шаблон пути endpoint`а, на который придёт запрос (например `/api/tweets/{tweet_id}/`),
+    или `UNMATCHED_ROUTE`, чтобы произвольные пути не раздували статистику.
+    Результат запоминается в `scope`
+    :param scope: ASGI scope запроса
+    """
+    if "route_path" not in scope:
+        scope["route_path"] = UNMATCHED_ROUTE
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                scope["route_path"] = route.path
+                break
+    return scope["route_path"]
+
+
+async def _send_overloaded(send: Send) -> None:
+    """
+    Ответ `503` отклонённому запросу
+    :param send: ASGI send
+    """
+    body = orjson.dumps(
+        {"result": False, "message": "Server is overloaded, retry later."}
+    )
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(ADMISSION_RETRY_AFTER).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -1,30 +1,131 @@
 """Модуль для создания декоратора, который проверяет пользовательский `api_key`"""
 
+from collections import OrderedDict
 from functools import wraps
+from time import monotonic
 
 from fastapi import status
 from fastapi.responses import JSONResponse
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import TOKEN_CACHE_NEGATIVE_TTL, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL
 from models.user import UserModel
 
 
+class TokenCache:
+    """
+    LRU-кэш `api_key -> id пользователя` с ограниченным временем жизни записей.
+    Несуществующие токены тоже кэшируются (со своим, более коротким TTL),
+    чтобы запросы с неверным `api_key` не ходили в БД каждый раз.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[int | None, float]] = OrderedDict()
+
+    def get(self, token: str) -> tuple[bool, int | None]:
+        """
+        Получение id пользователя из кэша
+        :param token: api_key пользователя
+        :return: (есть ли актуальная запись в кэше, id пользователя или None)
+        """
+        entry = self._entries.get(token)
+        if entry is not None:
+            user_id, expires_at = entry
+            if expires_at > monotonic():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return True, user_id
+            del self._entries[token]
+
+        self.misses += 1
+        return False, None
+
+    def set(self, token: str, user_id: int | None) -> None:
+        """
+        Сохранение в кэш результата проверки токена
+        :param token: api_key пользователя
+        :param user_id: id пользователя или None, если такого токена нет
+        """
+        ttl = self.ttl if user_id is not None else self.negative_ttl
+        self._entries[token] = (user_id, monotonic() + ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, token: str) -> None:
+        """
+        Удаление токена из кэша (после создания/изменения/удаления пользователя)
+        :param token: api_key пользователя
+        """
+        self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        """Полная очистка кэша"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Статистика работы кэша"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+token_cache = TokenCache(
+    maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL, negative_ttl=TOKEN_CACHE_NEGATIVE_TTL
+)
+
+
+async def read_token_user_id(session: AsyncSession, api_key: str) -> int | None:
+    """
+    Получение id пользователя по `api_key` (сначала из `token_cache`).
+    Отсутствие токена на реплике не кэшируется: реплика может отставать
+    и ещё не видеть только что созданного пользователя
+    :param session: объект сессии
+    :param api_key: api_key пользователя
+    :return: id пользователя или None, если такого токена нет
+    """
+    cached, user_id = token_cache.get(api_key)
+    if not cached:
+        query = select(UserModel.id).where(UserModel.token == api_key)
+        user_id = await session.scalar(query)
+        if user_id is not None or not session.info.get("replica"):
+            token_cache.set(api_key, user_id)
+    return user_id
+
+
+def wrong_token_response() -> JSONResponse:
+    """Ответ `401` на запрос с несуществующим `api_key`"""
+    return JSONResponse(
+        content={
+            "result": False,
+            "message": "Wrong api-key token. This user does not exist.",
+        },
+        status_code=status.HTTP_401_UNAUTHORIZED,
+    )
+
+
 def token_required(func):
 
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        query = select(UserModel).where(UserModel.token == kwargs["api_key"])
-        user: UserModel | None = await kwargs["session"].scalar(query)
-        if user is not None:
-            kwargs["user_id"] = user.id
+        user_id = await read_token_user_id(kwargs["session"], kwargs["api_key"])
+
+        if user_id is not None:
+            kwargs["user_id"] = user_id
             return await func(*args, **kwargs)
 
-        return JSONResponse(
-            content={
-                "result": False,
-                "message": "Wrong api-key token. This user does not exist.",
-            },
-            status_code=status.HTTP_401_UNAUTHORIZED,
-        )
+        return wrong_token_response()
 
     return wrapper
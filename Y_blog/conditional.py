@@ -0,0 +1,53 @@
+"""
+Модуль для условных GET-запросов (`ETag`/`If-None-Match`) к часто опрашиваемым endpoint`ам.
+
+`ETag` строится не из тела ответа, а из дешёвого валидатора - версий данных
+(см. `models/versions.py`), которые читаются одним запросом только по индексам.
+Версия профиля читается по первичному ключу, а версия ленты - это агрегат: суммы
+`content_version` авторов, на которых подписан пользователь, и `likes_version` их
+твитов (index only scan по `idx_tweets_author_likes_version`). Её стоимость растёт
+с кол-вом твитов этих авторов, но строки твитов не читаются и не сериализуются.
+Если у клиента актуальная копия, endpoint отвечает `304` без тела и не выполняет
+основной запрос.
+"""
+
+import hashlib
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """
+    Слабый `ETag` из частей валидатора (версий данных и параметров запроса)
+    :param parts: части валидатора
+    """
+    raw = ":".join(str(part) for part in parts).encode()
+    return f'W/"{hashlib.blake2b(raw, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Слабое сравнение `ETag` с заголовком `If-None-Match` (RFC 9110, 13.1.2)
+    :param if_none_match: значение заголовка или None
+    :param etag: текущий `ETag` ответа
+    """
+    if if_none_match is None:
+        return False
+    etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in etags or etag.removeprefix("W/") in etags
+
+
+def not_modified(request: Request, response: Response, *parts) -> Response | None:
+    """
+    Проверка условного запроса.
+    Если `If-None-Match` совпадает с текущим `ETag`, возвращается ответ `304`,
+    иначе `ETag` добавляется в заголовки будущего ответа и возвращается None
+    :param request: запрос клиента
+    :param response: ответ endpoint`а (для заголовков)
+    :param parts: части валидатора (см. `make_etag`)
+    """
+    headers = {"etag": make_etag(*parts), "cache-control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,173 @@
+"""
+Модуль для удаления ненужных файлов картинок.
+
+Файлы, на которые после удаления твита больше никто не ссылается, ставятся
+в очередь `deletion_queue` уже после commit и удаляются фоновой задачей, поэтому
+запрос не ждёт работы с диском. Очередь хранится в памяти процесса: файлы,
+не удалённые из-за перезапуска, а также файлы прерванных загрузок находит
+периодическая сверка `MEDIA_PATH` с БД (`sweep_media`).
+"""
+
+import asyncio
+import logging
+import os
+from time import time
+
+from sqlalchemy import String, func, literal, select, union_all
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import (
+    MEDIA_GC_BATCH_SIZE,
+    MEDIA_GC_GRACE_PERIOD,
+    MEDIA_GC_SWEEP_INTERVAL,
+    MEDIA_PATH,
+)
+from models.base import DBConnect
+from models.image_derivative import ImageDerivativeModel
+from models.media_file import MediaFileModel
+from models.media_img import ImageModel
+from .crud import delete_img, file_lock
+
+
+logger = logging.getLogger(__name__)
+
+deletion_queue: asyncio.Queue[str] = asyncio.Queue()
+
+
+def schedule_deletion(filepaths: list[str]) -> None:
+    """
+    Постановка файлов в очередь на удаление (вызывается после commit)
+    :param filepaths: пути до файлов
+    """
+    for filepath in filepaths:
+        deletion_queue.put_nowait(filepath)
+
+
+async def delete_queued_files(
+    session: AsyncSession, filepaths: list[str] | None = None
+) -> list[str]:
+    """
+    Удаление всех файлов, уже стоящих в очереди.
+    Перед удалением файлы ещё раз сверяются с БД: пока файл ждал в очереди,
+    та же картинка могла быть загружена снова.
+    :param session: объект сессии
+    :param filepaths: уже взятые из очереди пути до файлов
+    :return: пути удалённых файлов
+    """
+    filepaths = list(filepaths or [])
+    while not deletion_queue.empty():
+        filepaths.append(deletion_queue.get_nowait())
+    return await delete_unreferenced(session, filepaths)
+
+
+async def delete_queued_files_forever(db: DBConnect) -> None:
+    """
+    Фоновая задача, удаляющая файлы по мере появления их в очереди
+    :param db: подключение к БД
+    """
+    while True:
+        filepath = await deletion_queue.get()
+        try:
+            async with db.async_session() as session:
+                await delete_queued_files(session, [filepath])
+        except Exception:
+            logger.exception("Failed to delete queued media files")
+
+
+async def sweep_media(
+    session: AsyncSession, grace_period: float = MEDIA_GC_GRACE_PERIOD
+) -> list[str]:
+    """
+    Удаление файлов из `MEDIA_PATH`, на которые не ссылается ни одна запись БД.
+    Файлы моложе `grace_period` не трогаются: это могут быть ещё не завершённые загрузки.
+    :param session: объект сессии
+    :param grace_period: минимальный возраст удаляемого файла в секундах
+    :return: пути удалённых файлов
+    """
+    candidates = await asyncio.to_thread(_list_old_files, MEDIA_PATH, grace_period)
+    return await delete_unreferenced(session, candidates)
+
+
+async def delete_unreferenced(session: AsyncSession, filepaths: list[str]) -> list[str]:
+    """
+    Удаление файлов, на которые не ссылается ни одна запись `images`,
+    `media_files` или `image_derivatives` (сверка с БД пачками по `MEDIA_GC_BATCH_SIZE`).
+    Файлы пачки блокируются (`crud.file_lock`) до конца её транзакции: загрузка той же
+    картинки либо дождётся удаления и сохранит файл заново, либо будет видна при сверке
+    :param session: объект сессии
+    :param filepaths: пути до файлов
+    :return: пути удалённых файлов
+    """
+    known_paths = union_all(
+        select(ImageModel.filepath.label("filepath")),
+        select(MediaFileModel.filepath),
+        select(ImageDerivativeModel.filepath),
+    ).subquery()
+
+    deleted = []
+    for start in range(0, len(filepaths), MEDIA_GC_BATCH_SIZE):
+        batch = sorted(set(filepaths[start : start + MEDIA_GC_BATCH_SIZE]))
+        # загрузки тех же картинок ждут, пока файлы не будут проверены и удалены
+        locked = (
+            func.unnest(literal(batch, ARRAY(String)))
+            .table_valued("filepath")
+            .render_derived()
+        )
+        await session.execute(select(file_lock(locked.c.filepath)).select_from(locked))
+        referenced = set(
+            await session.scalars(
+                select(known_paths.c.filepath).where(known_paths.c.filepath.in_(batch))
+            )
+        )
+        for filepath in batch:
+            if filepath in referenced:
+                continue
+            try:
+                await delete_img(filepath)
+            except OSError:
+                logger.exception("Failed to delete media file %s", filepath)
+                continue
+            deleted.append(filepath)
+        await session.commit()
+    return deleted
+
+
+def _list_old_files(root: str, grace_period: float) -> list[str]:
+    """
+    Список файлов в папке `root` (рекурсивно), изменённых раньше `grace_period` секунд назад
+    :param root: папка
+    :param grace_period: минимальный возраст файла в секундах
+    """
+    threshold = time() - grace_period
+    old_files = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            if filename.startswith("."):
+                continue
+            try:
+                if os.stat(filepath).st_mtime < threshold:
+                    old_files.append(filepath)
+            except FileNotFoundError:
+                continue
+    return old_files
+
+
+async def sweep_media_forever(
+    db: DBConnect, interval: float = MEDIA_GC_SWEEP_INTERVAL
+) -> None:
+    """
+    Фоновая задача, периодически удаляющая осиротевшие файлы картинок
+    :param db: подключение к БД
+    :param interval: период сверки в секундах
+    """
+    while True:
+        try:
+            async with db.async_session() as session:
+                swept = await sweep_media(session)
+            if swept:
+                logger.info("Swept %s orphan media files", len(swept))
+        except Exception:
+            logger.exception("Failed to sweep media files")
+        await asyncio.sleep(interval)
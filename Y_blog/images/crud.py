@@ -1,31 +1,61 @@
 """Модуль для описания CRUD-действий модели `Image`"""
 
+import hashlib
+import mimetypes
 import os
+from collections import Counter
+from uuid import uuid4
 
 import aiofiles
-from fastapi import HTTPException, UploadFile, status
-from sqlalchemy import select
+import aiofiles.os
+from fastapi import BackgroundTasks, HTTPException, UploadFile, status
+from sqlalchemy import (
+    ColumnElement,
+    Integer,
+    column,
+    delete,
+    func,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
-from config import MEDIA_PATH, AllOWED_IMG_EXTENSIONS
+from config import (
+    MAX_UPLOAD_SIZE,
+    MEDIA_PATH,
+    UPLOAD_CHUNK_SIZE,
+    AllOWED_IMG_EXTENSIONS,
+)
+from models.image_derivative import ImageDerivativeModel
+from models.media_file import MediaFileModel
 from models.media_img import ImageModel
 from models.tweet import TweetModel
+from models.versions import bump_content_version_query
+from . import derivatives
 
 
 async def save_image(
     session: AsyncSession,
     user_image: UploadFile,
-    token: str,
     tweet_id: int,
     user_id: int,
+    background_tasks: BackgroundTasks | None = None,
 ) -> dict:
     """
     Сохранение картинки.
+    Картинка не читается в память целиком: хэш считается кусками по временному файлу
+    формы, а в хранилище файл копируется, только если такого содержимого там ещё нет.
+    Файлы хранятся по хэшу содержимого (см. `content_path`), поэтому повторная загрузка
+    той же картинки не создаёт новую запись, а увеличивает `ref_count` уже сохранённой.
     :param session объект сессии
     :param user_image: Загружаемая картинка пользователя
-    :param token: api_key пользователя
     :param tweet_id: id твита
     :param user_id: id пользователя
+    :param background_tasks: фоновые задачи запроса, в которых создаются уменьшенные
+        копии картинки (см. `derivatives.create_derivatives`)
     """
     query_tweet = select(TweetModel).where(
         TweetModel.id == tweet_id, TweetModel.author_id == user_id
@@ -46,30 +76,221 @@ async def save_image(
             detail=f"Invalid extension of the uploaded image!",
         )
 
+    if user_image.size is not None and user_image.size > MAX_UPLOAD_SIZE:
+        await user_image.close()
+        raise _too_large()
+
+    filename = os.path.basename(user_image.filename)
+    tmp_path = None
     try:
-        contents = await user_image.read()
-        if not os.path.exists(MEDIA_PATH + f"{token}"):
-            os.chdir(MEDIA_PATH)
-            os.mkdir(f"{token}")
-        img_path = MEDIA_PATH + f"{token}/" + user_image.filename
-        async with aiofiles.open(img_path, "wb") as file:
-            await file.write(contents)
+        size, sha256 = await _hash_upload(user_image)
+        filepath = content_path(sha256, filename.rsplit(".", 1)[1])
+        # та же картинка уже в хранилище - файл не копируется ещё раз
+        if not await aiofiles.os.path.exists(filepath):
+            tmp_path = await _copy_to_tmp_file(user_image, filepath)
+        # удаление файлов (`cleanup.delete_unreferenced`) ждёт commit загрузки
+        await session.execute(select(file_lock(filepath)))
+        query_file = (
+            insert(MediaFileModel)
+            .values(
+                sha256=sha256,
+                filepath=filepath,
+                size=size,
+                ref_count=1,
+            )
+            .on_conflict_do_update(
+                index_elements=["sha256"],
+                set_={"ref_count": MediaFileModel.ref_count + 1},
+            )
+            .returning(MediaFileModel.id, MediaFileModel.filepath)
+        )
+        file_id, img_path = (await session.execute(query_file)).one()
+
+        # файл мог быть удалён до блокировки, если на него уже никто не ссылался
+        if tmp_path is None and not await aiofiles.os.path.exists(img_path):
+            tmp_path = await _copy_to_tmp_file(user_image, img_path)
+        if tmp_path is not None:
+            await aiofiles.os.replace(tmp_path, img_path)
+            tmp_path = None
 
         img_info = ImageModel(
             tweet_id=tweet_id,
-            filename=user_image.filename,
+            filename=filename,
             filepath=img_path,
+            file_id=file_id,
         )
         session.add(img_info)
+        await session.execute(bump_content_version_query([user_id]))
         await session.commit()
         await session.refresh(img_info)
+        if background_tasks is not None:
+            background_tasks.add_task(
+                derivatives.create_derivatives, session.bind, file_id
+            )
         return {"result": True, "media_id": img_info.id}
 
-    except Exception as e:
-        return {"ERROR": e.args}
-
     finally:
         await user_image.close()
+        if tmp_path is not None and await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+
+
+def content_path(sha256: str, extension: str) -> str:
+    """
+    Путь до файла в хранилище: `<MEDIA_PATH>/store/ab/cd/abcd...<sha256>.<расширение>`.
+    Файлы разложены по вложенным папкам по первым символам хэша, чтобы ни в одной
+    папке не накапливалось слишком много файлов.
+    :param sha256: хэш содержимого файла
+    :param extension: расширение файла
+    """
+    return os.path.join(
+        MEDIA_PATH, "store", sha256[:2], sha256[2:4], f"{sha256}.{extension}"
+    )
+
+
+def file_lock(filepath: str) -> ColumnElement:
+    """
+    Блокировка файла хранилища до конца транзакции (advisory lock по хэшу пути).
+    Её берут загрузка картинки и удаление файлов, поэтому файл не удаляется между
+    проверкой ссылок на него и commit загрузки той же картинки
+    :param filepath: путь до файла
+    """
+    return func.pg_advisory_xact_lock(func.hashtext(filepath))
+
+
+async def _hash_upload(user_image: UploadFile) -> tuple[int, str]:
+    """
+    Подсчёт размера и sha256 загружаемой картинки кусками по `UPLOAD_CHUNK_SIZE` байт.
+    Читается временный файл, в который Starlette уже сохранил картинку при разборе формы.
+    Если картинка больше `MAX_UPLOAD_SIZE`, чтение прерывается, не дочитав файл.
+    :param user_image: Загружаемая картинка пользователя
+    :return: размер картинки и sha256 содержимого
+    """
+    size = 0
+    content_hash = hashlib.sha256()
+    while chunk := await user_image.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_UPLOAD_SIZE:
+            raise _too_large()
+        content_hash.update(chunk)
+    return size, content_hash.hexdigest()
+
+
+async def _copy_to_tmp_file(user_image: UploadFile, filepath: str) -> str:
+    """
+    Копирование загружаемой картинки во временный файл рядом с `filepath`,
+    чтобы потом атомарно переименовать его в `filepath`.
+    Недописанные файлы (например, после перезапуска) удаляет `cleanup.sweep_media`.
+    :param user_image: Загружаемая картинка пользователя
+    :param filepath: путь до файла в хранилище
+    :return: путь до временного файла
+    """
+    await aiofiles.os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_path = f"{filepath}.{uuid4().hex}.part"
+    await user_image.seek(0)
+    try:
+        async with aiofiles.open(tmp_path, "wb") as file:
+            while chunk := await user_image.read(UPLOAD_CHUNK_SIZE):
+                await file.write(chunk)
+    except BaseException:
+        await aiofiles.os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+async def release_images(session: AsyncSession, images: list[ImageModel]) -> list[str]:
+    """
+    Уменьшение `ref_count` файлов удаляемых картинок (без commit).
+    Файлы, на которые больше никто не ссылается, удаляются из БД.
+    :param session: объект сессии
+    :param images: удаляемые картинки
+    :return: пути файлов, которые нужно удалить с диска после commit
+    """
+    released = Counter(img.file_id for img in images if img.file_id is not None)
+    # картинки, загруженные до появления хранилища, лежат в отдельных файлах
+    unused_paths = [img.filepath for img in images if img.file_id is None]
+
+    if released:
+        counts = values(
+            column("id", Integer), column("count", Integer), name="released"
+        ).data(list(released.items()))
+        await session.execute(
+            update(MediaFileModel)
+            .where(MediaFileModel.id == counts.c.id)
+            .values(ref_count=MediaFileModel.ref_count - counts.c.count)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            update(ImageModel)
+            .where(ImageModel.id.in_([img.id for img in images]))
+            .values(file_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        unused_files = (
+            select(MediaFileModel.id)
+            .where(MediaFileModel.id.in_(released), MediaFileModel.ref_count <= 0)
+            .scalar_subquery()
+        )
+        unused_derivatives = await session.scalars(
+            delete(ImageDerivativeModel)
+            .where(ImageDerivativeModel.file_id.in_(unused_files))
+            .returning(ImageDerivativeModel.filepath)
+        )
+        unused_paths.extend(unused_derivatives)
+        unused_files = await session.scalars(
+            delete(MediaFileModel)
+            .where(MediaFileModel.id.in_(unused_files))
+            .returning(MediaFileModel.filepath)
+        )
+        unused_paths.extend(unused_files)
+
+    return unused_paths
+
+
+async def read_media(session: AsyncSession, media_id: int, kind: str | None) -> dict:
+    """
+    Получение файла картинки (или её уменьшенной копии) для отдачи клиенту
+    :param session: объект сессии
+    :param media_id: id картинки
+    :param kind: название уменьшенной копии (см. `IMAGE_DERIVATIVES`), None - исходный файл
+    :return: путь до файла, его MIME-тип и ETag
+    """
+    image: ImageModel | None = await session.get(
+        ImageModel, media_id, options=[joinedload(ImageModel.file)]
+    )
+    if image is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Media id=`{media_id}` not found!",
+        )
+
+    if kind is None:
+        filepath, mime_type = image.filepath, mimetypes.guess_type(image.filepath)[0]
+        # файлы хранилища не меняются, поэтому хэш содержимого - готовый ETag
+        etag = image.file.sha256 if image.file is not None else None
+    else:
+        derivative: ImageDerivativeModel | None = await session.scalar(
+            select(ImageDerivativeModel).where(
+                ImageDerivativeModel.file_id == image.file_id,
+                ImageDerivativeModel.kind == kind,
+            )
+        )
+        if derivative is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Media id=`{media_id}` has no `{kind}` derivative!",
+            )
+        filepath, mime_type = derivative.filepath, derivative.mime_type
+        etag = f"{image.file.sha256}.{kind}"
+
+    return {"filepath": filepath, "mime_type": mime_type, "etag": etag}
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"The uploaded image is larger than {MAX_UPLOAD_SIZE} bytes!",
+    )
 
 
 async def delete_img(filepath: str):
@@ -77,5 +298,5 @@ async def delete_img(filepath: str):
     Удаление картинки
     :param filepath: Путь до картинки
     """
-    if os.path.exists(filepath):
-        return os.remove(filepath)
+    if await aiofiles.os.path.exists(filepath):
+        return await aiofiles.os.remove(filepath)
@@ -0,0 +1,155 @@
+"""
+Модуль для фоновой обработки загруженных картинок.
+
+После того как `save_image` сохранил файл, для него создаются уменьшенные копии
+(см. `IMAGE_DERIVATIVES`), чтобы лента не отдавала клиентам исходные файлы.
+Изменение размера выполняется в пуле процессов и не блокирует event loop.
+Размеры, вес и MIME-тип копий сохраняются в `image_derivatives`.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from config import IMAGE_DERIVATIVE_QUALITY, IMAGE_DERIVATIVES, IMAGE_PROCESSING_WORKERS
+from models.image_derivative import ImageDerivativeModel
+from models.media_file import MediaFileModel
+from models.media_img import ImageModel
+from models.tweet import TweetModel
+from models.versions import bump_content_version_query
+from . import crud
+
+
+logger = logging.getLogger(__name__)
+
+_process_pool: ProcessPoolExecutor | None = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Пул процессов для обработки картинок (создаётся при первой загрузке)"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=IMAGE_PROCESSING_WORKERS)
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """Остановка пула процессов при завершении приложения"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
+
+def render_derivatives(source_path: str, targets: list[tuple]) -> list[dict]:
+    """
+    Создание уменьшенных копий картинки (выполняется в отдельном процессе).
+    Картинки меньше максимального размера не увеличиваются.
+    :param source_path: путь до исходного файла
+    :param targets: список `(название, максимальная сторона, формат, путь до копии)`
+    :return: описание созданных копий
+    """
+    rendered = []
+    with Image.open(source_path) as source:
+        source = ImageOps.exif_transpose(source)
+        for kind, max_side, image_format, filepath in targets:
+            image = source.copy()
+            image.thumbnail((max_side, max_side))
+            if image_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            image.save(filepath, image_format, quality=IMAGE_DERIVATIVE_QUALITY)
+            rendered.append(
+                {
+                    "kind": kind,
+                    "filepath": filepath,
+                    "width": image.width,
+                    "height": image.height,
+                    "size": os.path.getsize(filepath),
+                    "mime_type": Image.MIME[image_format],
+                }
+            )
+    return rendered
+
+
+async def create_derivatives(engine: AsyncEngine, file_id: int) -> None:
+    """
+    Создание недостающих уменьшенных копий файла картинки.
+    Вызывается фоновой задачей после commit загрузки, поэтому открывает свою сессию.
+    Исходный файл блокируется (`crud.file_lock`) до commit копий: пока они создаются,
+    твит с картинкой могут удалить, и копии не должны пережить исходный файл.
+    :param engine: движок БД, через который была сохранена картинка
+    :param file_id: id файла картинки (`MediaFileModel`)
+    """
+    async with AsyncSession(engine) as session:
+        media_file = await session.get(MediaFileModel, file_id)
+        if media_file is None:
+            return
+        # удаление файла (`cleanup.delete_unreferenced`) ждёт commit копий
+        await session.execute(select(crud.file_lock(media_file.filepath)))
+        still_exists = await session.scalar(
+            select(MediaFileModel.id).where(MediaFileModel.id == file_id)
+        )
+        if still_exists is None:
+            return
+
+        existing = set(
+            await session.scalars(
+                select(ImageDerivativeModel.kind).where(
+                    ImageDerivativeModel.file_id == file_id
+                )
+            )
+        )
+        targets = [
+            (
+                kind,
+                max_side,
+                image_format,
+                derivative_path(media_file, kind, image_format),
+            )
+            for kind, max_side, image_format in IMAGE_DERIVATIVES
+            if kind not in existing
+        ]
+        if not targets:
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            rendered = await loop.run_in_executor(
+                get_process_pool(), render_derivatives, media_file.filepath, targets
+            )
+            await session.execute(
+                insert(ImageDerivativeModel)
+                .values([{"file_id": file_id, **derivative} for derivative in rendered])
+                .on_conflict_do_nothing()
+            )
+            # ссылки на картинки в ленте меняются на уменьшенные копии
+            await session.execute(
+                bump_content_version_query(
+                    select(TweetModel.author_id)
+                    .join(ImageModel, ImageModel.tweet_id == TweetModel.id)
+                    .where(ImageModel.file_id == file_id)
+                )
+            )
+            await session.commit()
+        except Exception:
+            # файл мог быть удалён вместе с твитом, пока шла обработка
+            logger.exception("Failed to process image file id=%s", file_id)
+
+
+def derivative_path(media_file: MediaFileModel, kind: str, image_format: str) -> str:
+    """
+    Путь до уменьшенной копии: рядом с исходным файлом, `<sha256>.<название>.<формат>`
+    :param media_file: файл картинки
+    :param kind: название копии
+    :param image_format: формат копии
+    """
+    source_path, _ = os.path.splitext(media_file.filepath)
+    return f"{source_path}.{kind}.{image_format.lower()}"
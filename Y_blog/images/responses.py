@@ -0,0 +1,155 @@
+"""
+Модуль для отдачи файлов картинок клиенту.
+
+Файлы хранилища не меняются (имя файла - хэш содержимого), поэтому ответы
+кэшируются браузером надолго, а повторные запросы с `If-None-Match`/`If-Modified-Since`
+получают `304` без тела. Поддерживается запрос одного диапазона байт (`Range`).
+
+Если задан `MEDIA_ACCEL_REDIRECT_PREFIX`, сам файл отдаёт nginx по заголовку
+`X-Accel-Redirect` (см. `client/nginx.conf`), а приложение только проверяет запрос.
+"""
+
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.datastructures import Headers
+
+from config import MEDIA_ACCEL_REDIRECT_PREFIX, MEDIA_CACHE_MAX_AGE, MEDIA_PATH
+from Y_blog.conditional import etag_matches
+
+
+async def media_response(request: Request, media: dict) -> Response:
+    """
+    Ответ с файлом картинки
+    :param request: запрос клиента
+    :param media: путь до файла, его MIME-тип и ETag (см. `crud.read_media`)
+    """
+    filepath = media["filepath"]
+    try:
+        stat_result = await aiofiles.os.stat(filepath)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Media file not found!"
+        )
+
+    etag = media["etag"] or f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+    headers = {
+        "etag": f'"{etag}"',
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": f"public, max-age={MEDIA_CACHE_MAX_AGE}, immutable",
+        "accept-ranges": "bytes",
+    }
+    if is_not_modified(request.headers, headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if MEDIA_ACCEL_REDIRECT_PREFIX:
+        # nginx сам обработает `Range` для внутреннего перенаправления
+        headers["x-accel-redirect"] = MEDIA_ACCEL_REDIRECT_PREFIX + os.path.relpath(
+            filepath, MEDIA_PATH
+        )
+        return Response(headers=headers, media_type=media["mime_type"])
+
+    byte_range = requested_range(request.headers, headers, stat_result.st_size)
+    if byte_range is None:
+        return FileResponse(
+            filepath,
+            headers=headers,
+            media_type=media["mime_type"],
+            stat_result=stat_result,
+        )
+
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+    headers["content-length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_range(filepath, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=media["mime_type"],
+    )
+
+
+def is_not_modified(request_headers: Headers, response_headers: dict) -> bool:
+    """
+    Проверка условного запроса: есть ли у клиента актуальная копия файла.
+    `If-None-Match` важнее `If-Modified-Since` (RFC 9110, 13.2.2)
+    :param request_headers: заголовки запроса
+    :param response_headers: заголовки ответа с `etag` и `last-modified`
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, response_headers["etag"])
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return parsedate_to_datetime(
+                response_headers["last-modified"]
+            ) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def requested_range(
+    request_headers: Headers, response_headers: dict, size: int
+) -> tuple[int, int] | None:
+    """
+    Разбор заголовка `Range` (поддерживается один диапазон, иначе отдаётся весь файл)
+    :param request_headers: заголовки запроса
+    :param response_headers: заголовки ответа с `etag` и `last-modified`
+    :param size: размер файла
+    :return: первый и последний байт диапазона или None
+    """
+    range_header = request_headers.get("range")
+    if range_header is None or not range_header.startswith("bytes="):
+        return None
+    if_range = request_headers.get("if-range")
+    if if_range is not None and if_range not in (
+        response_headers["etag"],
+        response_headers["last-modified"],
+    ):
+        return None
+
+    ranges = range_header.removeprefix("bytes=").split(",")
+    if len(ranges) != 1 or "-" not in ranges[0]:
+        return None
+    first, last = (value.strip() for value in ranges[0].split("-", 1))
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable!",
+            headers={"content-range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+async def _read_range(filepath: str, start: int, end: int):
+    """
+    Чтение диапазона байт файла кусками
+    :param filepath: путь до файла
+    :param start: первый байт
+    :param end: последний байт
+    """
+    remaining = end - start + 1
+    async with aiofiles.open(filepath, "rb") as file:
+        await file.seek(start)
+        while remaining > 0:
+            chunk = await file.read(min(FileResponse.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -1,19 +1,10 @@
 """Модуль для описания схем `Image`"""
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel
 
 
-class ImageBase(BaseModel):
-    tweet_id: int
+class MediaCreated(BaseModel):
+    """Результат загрузки картинки"""
 
-
-class Image(ImageBase):
-    model_config = ConfigDict(from_attributes=True)
-
-    id: int
-    filename: str
-    filepath: str
-
-
-class ImageSave(ImageBase):
-    pass
+    result: bool
+    media_id: int
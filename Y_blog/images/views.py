@@ -2,23 +2,39 @@
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Query, UploadFile, status
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.base import y_blog_db
 from Y_blog.check_user_token import token_required
 from . import crud
+from .responses import media_response
+from .schemas import MediaCreated
 
 
 router = APIRouter(prefix="/api/medias", tags=["Medias"])
 
 
-@router.post("/", response_model=dict, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/",
+    response_model=MediaCreated,
+    status_code=status.HTTP_201_CREATED,
+)
 @token_required
 async def save_img(
     tweet_id: int,
     image_file: UploadFile,
     api_key: str,
+    background_tasks: BackgroundTasks,
     user_id: Annotated[int | None, Query(include_in_schema=False)] = None,
     session: AsyncSession = Depends(y_blog_db.session_dependency),
 ):
@@ -27,6 +43,7 @@ async def save_img(
     :param tweet_id: id твита
     :param image_file: загружаемая картинка
     :param api_key: api_key автора
+    :param background_tasks: фоновые задачи (обработка картинки после ответа)
     :param user_id: id автора
     :param session: объект сессии
     """
@@ -34,6 +51,24 @@ async def save_img(
         session=session,
         user_image=image_file,
         tweet_id=tweet_id,
-        token=api_key,
         user_id=user_id,
+        background_tasks=background_tasks,
     )
+
+
+@router.get("/{media_id}", response_class=Response)
+async def get_media(
+    media_id: int,
+    request: Request,
+    kind: str | None = None,
+    session: AsyncSession = Depends(y_blog_db.read_session_dependency),
+):
+    """
+    Endpoint для получения файла картинки с поддержкой кэширования и `Range`
+    :param media_id: id картинки
+    :param request: запрос клиента
+    :param kind: название уменьшенной копии, по умолчанию - исходный файл
+    :param session: объект сессии
+    """
+    media = await crud.read_media(session=session, media_id=media_id, kind=kind)
+    return await media_response(request, media)
@@ -0,0 +1,210 @@
+"""
+Модуль для сбора метрик приложения и их выдачи в текстовом формате Prometheus (`/metrics`).
+
+Для каждого endpoint`а (по шаблону пути, например `/api/tweets/{tweet_id}/`) считаются:
+время ответа, кол-во одновременно выполняемых запросов, коды ответов, кол-во
+SQL-запросов и время в БД на один запрос (их записывает `query_budget.QueryLog`,
+который middleware создаёт для каждого запроса). Запросы фоновых задач, выполняемых
+после отправки ответа, в метрики запроса не попадают.
+
+Метрики хранятся в памяти процесса: при нескольких worker`ах каждый отдаёт свои.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from time import perf_counter
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from Y_blog.admission import route_path
+from Y_blog.query_budget import QueryLog, current_queries
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин (как `histogram` в Prometheus)"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Пары `(граница корзины, кол-во значений не больше неё)`, последняя - `+Inf`"""
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """Хранилище метрик endpoint`ов"""
+
+    def __init__(self):
+        self.in_flight: defaultdict[tuple[str, str], int] = defaultdict(int)
+        self.responses: defaultdict[tuple[str, str, int], int] = defaultdict(int)
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.db_queries: dict[tuple[str, str], Histogram] = {}
+        self.db_time: dict[tuple[str, str], Histogram] = {}
+
+    def observe(
+        self, route: tuple[str, str], status: int, latency: float, query_log: QueryLog
+    ) -> None:
+        """
+        Учёт выполненного запроса
+        :param route: `(метод, шаблон пути)` endpoint`а
+        :param status: код ответа
+        :param latency: время ответа в секундах
+        :param query_log: SQL-запросы запроса
+        """
+        if route not in self.latency:
+            self.latency[route] = Histogram(LATENCY_BUCKETS)
+            self.db_queries[route] = Histogram(QUERIES_BUCKETS)
+            self.db_time[route] = Histogram(LATENCY_BUCKETS)
+        self.responses[(*route, status)] += 1
+        self.latency[route].observe(latency)
+        self.db_queries[route].observe(query_log.queries)
+        self.db_time[route].observe(query_log.db_time)
+
+    def render(
+        self,
+        gauges: dict[str, tuple[str, dict]] | None = None,
+        counters: dict[str, tuple[str, dict]] | None = None,
+    ) -> str:
+        """
+        Метрики в текстовом формате Prometheus
+        :param gauges: дополнительные метрики `имя -> (описание, {метки: значение})`
+        :param counters: дополнительные счётчики в том же виде (имя с `_total`)
+        """
+        lines = []
+        _render_histograms(
+            lines,
+            "yblog_http_request_duration_seconds",
+            "HTTP request latency",
+            self.latency,
+        )
+        _render_values(
+            lines,
+            "gauge",
+            "yblog_http_requests_in_flight",
+            "HTTP requests being processed",
+            {_route_labels(route): count for route, count in self.in_flight.items()},
+        )
+        lines.append("# HELP yblog_http_responses_total HTTP responses by status code")
+        lines.append("# TYPE yblog_http_responses_total counter")
+        for (method, path, status), count in self.responses.items():
+            labels = _route_labels((method, path)) + f',status="{status}"'
+            lines.append(f"yblog_http_responses_total{{{labels}}} {count}")
+        _render_histograms(
+            lines,
+            "yblog_db_queries_per_request",
+            "SQL statements per HTTP request",
+            self.db_queries,
+        )
+        _render_histograms(
+            lines,
+            "yblog_db_time_per_request_seconds",
+            "Time spent in SQL statements per HTTP request",
+            self.db_time,
+        )
+        for name, (description, values) in (gauges or {}).items():
+            _render_values(lines, "gauge", name, description, values)
+        for name, (description, values) in (counters or {}).items():
+            _render_values(lines, "counter", name, description, values)
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """ASGI-middleware, собирающее метрики HTTP-запросов"""
+
+    def __init__(self, app: ASGIApp, registry: Metrics = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = (scope["method"], route_path(scope))
+        query_log = QueryLog(route)
+        token = current_queries.set(query_log)
+        started = perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                self._finish(route, status, started, query_log)
+
+        self.registry.in_flight[route] += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._finish(route, status, started, query_log)
+            current_queries.reset(token)
+
+    def _finish(
+        self, route: tuple[str, str], status: int, started: float, query_log: QueryLog
+    ) -> None:
+        """Учёт запроса после отправки ответа (фоновые задачи уже не учитываются)"""
+        if query_log.finished:
+            return
+        query_log.finish()
+        self.registry.in_flight[route] -= 1
+        self.registry.observe(route, status, perf_counter() - started, query_log)
+
+
+def _route_labels(route: tuple[str, str]) -> str:
+    method, path = route
+    return f'method="{method}",route="{_escape(path)}"'
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_histograms(
+    lines: list[str],
+    name: str,
+    description: str,
+    histograms: dict[tuple[str, str], Histogram],
+) -> None:
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} histogram")
+    for route, histogram in histograms.items():
+        labels = _route_labels(route)
+        for bound, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+def _render_values(
+    lines: list[str],
+    metric_type: str,
+    name: str,
+    description: str,
+    values: dict[str, float],
+) -> None:
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in values.items():
+        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
@@ -0,0 +1,37 @@
+"""Модуль для описания keyset-пагинации (курсоров) в списочных endpoint`ах"""
+
+import base64
+import binascii
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*values: int) -> str:
+    """
+    Кодирование ключа последней записи страницы в непрозрачный курсор
+    :param values: значения ключа сортировки (например `likes_count`, `id`)
+    """
+    raw = ":".join(str(value) for value in values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> tuple[int, ...]:
+    """
+    Декодирование курсора, полученного от клиента
+    :param cursor: курсор из параметра запроса
+    :param size: ожидаемое кол-во значений в ключе
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = tuple(
+            int(value)
+            for value in base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        )
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = ()
+
+    if len(values) != size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor!"
+        )
+    return values
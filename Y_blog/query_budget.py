@@ -0,0 +1,138 @@
+"""
+Модуль для учёта SQL-запросов каждого HTTP-запроса: бюджет запросов и поиск N+1.
+
+События движков SQLAlchemy (`instrument_engine`) записывают каждый выполненный
+запрос в `QueryLog` текущего HTTP-запроса (`current_queries`, его создаёт
+`MetricsMiddleware`). У каждого endpoint`а есть бюджет - максимальное кол-во
+SQL-запросов (`QUERY_BUDGETS`), а повторение запроса одного вида (текст без значений
+параметров) `N_PLUS_ONE_THRESHOLD` раз и больше считается N+1 - например, ленивой
+загрузкой связи в цикле.
+
+При `QUERY_BUDGET_MODE = "raise"` (тесты) нарушение сразу прерывает запрос
+исключением `QueryBudgetExceeded`, при `"log"` (по умолчанию) - пишется в лог
+после ответа.
+"""
+
+import logging
+import re
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import (
+    N_PLUS_ONE_THRESHOLD,
+    QUERY_BUDGET_DEFAULT,
+    QUERY_BUDGET_MODE,
+    QUERY_BUDGETS,
+)
+
+logger = logging.getLogger(__name__)
+
+_PARAMETERS = re.compile(r"\$\d+(?:\s*,\s*\$\d+)*")
+_SPACES = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Endpoint выполнил больше SQL-запросов, чем позволяет бюджет, или запросы N+1"""
+
+
+class QueryLog:
+    """SQL-запросы одного HTTP-запроса"""
+
+    __slots__ = ("route", "budget", "queries", "db_time", "shapes", "finished")
+
+    def __init__(self, route: tuple[str, str]):
+        """
+        :param route: `(метод, шаблон пути)` endpoint`а
+        """
+        self.route = route
+        self.budget = QUERY_BUDGETS.get(route, QUERY_BUDGET_DEFAULT)
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes: Counter[str] = Counter()
+        self.finished = False
+
+    def record(self, statement: str, elapsed: float) -> None:
+        """
+        Учёт выполненного SQL-запроса
+        :param statement: текст запроса
+        :param elapsed: время выполнения в секундах
+        """
+        self.queries += 1
+        self.db_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+        if QUERY_BUDGET_MODE == "raise":
+            problems = self.problems()
+            if problems:
+                raise QueryBudgetExceeded("; ".join(problems))
+
+    def problems(self) -> list[str]:
+        """Описание нарушений бюджета и найденных N+1"""
+        method, path = self.route
+        problems = []
+        if self.queries > self.budget:
+            problems.append(
+                f"{method} {path}: {self.queries} SQL statements, budget is {self.budget}"
+            )
+        for shape, count in self.shapes.items():
+            if count >= N_PLUS_ONE_THRESHOLD:
+                problems.append(
+                    f"{method} {path}: possible N+1, {count} x {shape[:200]}"
+                )
+        return problems
+
+    def finish(self) -> None:
+        """Завершение учёта после отправки ответа: нарушения пишутся в лог"""
+        if self.finished:
+            return
+        self.finished = True
+        for problem in self.problems():
+            logger.warning("Query budget: %s", problem)
+
+
+current_queries: ContextVar[QueryLog | None] = ContextVar(
+    "current_queries", default=None
+)
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Вид SQL-запроса: текст без лишних пробелов, где списки параметров `$1, $2, ...`
+    (например, в `IN (...)` разной длины) заменены на `?`
+    :param statement: текст запроса
+    """
+    return _PARAMETERS.sub("?", _SPACES.sub(" ", statement).strip())
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Подписка на события движка для учёта SQL-запросов HTTP-запросов
+    :param engine: движок БД
+    """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_queries.get() is not None:
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    query_log = current_queries.get()
+    if query_log is None or not conn.info.get("query_started"):
+        return
+    elapsed = perf_counter() - conn.info["query_started"].pop()
+    # запросы фоновых задач, выполняемых после ответа, не относятся к endpoint`у
+    if not query_log.finished:
+        query_log.record(statement, elapsed)
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
@@ -0,0 +1,37 @@
+"""
+Модуль для описания лёгких записей, в которые читаются строки ленты и профиля.
+
+Запросы чтения выполняются без ORM (SQLAlchemy Core): лайки, картинки и подписки
+собираются в JSON на стороне БД, а каждая строка результата превращается в одну
+запись со `__slots__` вместо графа ORM-объектов в identity map. Схемы ответов
+читают записи через `from_attributes`.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class TweetRecord:
+    id: int
+    content: str
+    author: dict
+    likes: list[dict]
+    likes_count: int
+    attachments_info: list[dict]
+
+    @property
+    def attachments(self) -> list[str]:
+        return [attachment["url"] for attachment in self.attachments_info]
+
+
+@dataclass(slots=True)
+class ProfileRecord:
+    id: int
+    name: str
+    followers_count: int
+    following_count: int
+    followers: list[dict]
+    following: list[dict]
+    followers_next_cursor: str | None
+    following_next_cursor: str | None
+    is_following: bool
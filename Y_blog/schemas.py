@@ -0,0 +1,14 @@
+"""Модуль для описания общих схем ответов endpoint`ов"""
+
+from pydantic import BaseModel
+
+
+class OperationResult(BaseModel):
+    """
+    Результат изменения данных. `message`/`ERROR` передаются только вместе с
+    `result = False` (в ответ попадают только заданные поля)
+    """
+
+    result: bool
+    message: str | None = None
+    ERROR: str | None = None
@@ -0,0 +1,85 @@
+"""Модуль для описания служебных endpoint`ов (состояние приложения)"""
+
+from fastapi import APIRouter, Response, status
+
+from models.base import y_blog_db
+from Y_blog.admission import admission_controller
+from Y_blog.check_user_token import token_cache
+from Y_blog.metrics import metrics
+
+
+router = APIRouter(prefix="/api/service", tags=["Service"])
+metrics_router = APIRouter(tags=["Service"])
+
+
+@router.get("/pool", response_model=dict, status_code=status.HTTP_200_OK)
+async def get_pool_stats():
+    """
+    Endpoint для получения состояния пула подключений к БД: занятые и свободные
+    подключения, время ожидания подключения, переполнения пула и таймауты
+    """
+    return {"result": True, "pool": y_blog_db.pool_stats()}
+
+
+@router.get("/admission", response_model=dict, status_code=status.HTTP_200_OK)
+async def get_admission_stats():
+    """
+    Endpoint для получения состояния контроля нагрузки: выполняемые запросы,
+    длина очереди (отдельно для изменений и чтения) и кол-во отклонённых запросов
+    """
+    return {"result": True, "admission": admission_controller.stats()}
+
+
+@metrics_router.get("/metrics", response_class=Response, include_in_schema=False)
+async def get_metrics():
+    """
+    Endpoint для сбора метрик Prometheus: время ответа, коды ответов, SQL-запросы
+    и время в БД по endpoint`ам, а также состояние контроля нагрузки, пула подключений
+    и кэша `api_key`
+    """
+    admission = admission_controller.stats()
+    pool = y_blog_db.pool_stats()
+    tokens = token_cache.stats()
+    gauges = {
+        "yblog_admission_in_flight": (
+            "Requests admitted by admission control",
+            {"": admission["in_flight"]},
+        ),
+        "yblog_admission_queued": (
+            "Requests waiting in the admission queue",
+            {
+                f'priority="{name}"': count
+                for name, count in admission["queued"].items()
+            },
+        ),
+        "yblog_db_pool_connections": (
+            "Database pool connections",
+            {
+                'state="checked_out"': pool["checked_out"],
+                'state="idle"': pool["idle"],
+                'state="waiting"': pool["waiting"],
+            },
+        ),
+        "yblog_token_cache_entries": (
+            "Entries in the api_key cache",
+            {"": tokens["size"]},
+        ),
+    }
+    counters = {
+        "yblog_admission_shed_total": (
+            "Requests rejected by admission control",
+            {f'reason="{name}"': count for name, count in admission["shed"].items()},
+        ),
+        "yblog_token_cache_lookups_total": (
+            "api_key lookups by cache result",
+            {'result="hit"': tokens["hits"], 'result="miss"': tokens["misses"]},
+        ),
+        "yblog_token_cache_evictions_total": (
+            "Entries evicted from the full api_key cache",
+            {"": tokens["evictions"]},
+        ),
+    }
+    return Response(
+        metrics.render(gauges, counters),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,113 @@
+"""
+Модуль для описания счётчиков лайков твитов.
+
+По умолчанию лайк сразу меняет `tweets.likes_count`. Если `LIKES_COUNTER_SHARDS > 0`,
+лайк меняет один из `LIKES_COUNTER_SHARDS` шардов счётчика (выбирается случайно),
+чтобы одновременные лайки популярного твита не ждали блокировку одной строки.
+Накопленные в шардах значения периодически переносятся в `tweets.likes_count`,
+по которому сортируется лента.
+
+Вместе со счётчиком увеличивается `tweets.likes_version` (из неё строится `ETag` ленты).
+Версия лежит в уже заблокированной строке твита, поэтому лайки не блокируют строки
+авторов в `users`. С шардами версия меняется только при переносе, поэтому лайкнувшие
+в ленте клиента, приславшего `If-None-Match`, могут отставать на
+`LIKES_COUNTER_FOLD_INTERVAL`.
+"""
+
+import asyncio
+import logging
+import random
+
+from sqlalchemy import CTE, Insert, Select, delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import LIKES_COUNTER_FOLD_INTERVAL, LIKES_COUNTER_SHARDS
+from models.base import DBConnect
+from models.like_counter import LikeCounterShardModel
+from models.tweet import TweetModel
+
+
+logger = logging.getLogger(__name__)
+
+
+def change_likes_count_query(changed_likes: CTE, delta: int) -> Insert | Select:
+    """
+    Запрос на изменение счётчика лайков твитов, попавших в `changed_likes`
+    :param changed_likes: CTE со столбцом `tweet_id` добавленных/удалённых лайков
+    :param delta: на сколько изменить счётчик (+1 или -1)
+    :return: запрос, возвращающий id твитов, чей счётчик изменён
+    """
+    if LIKES_COUNTER_SHARDS > 0:
+        shard = random.randrange(LIKES_COUNTER_SHARDS)
+        query = insert(LikeCounterShardModel).from_select(
+            ["tweet_id", "shard", "delta"],
+            select(changed_likes.c.tweet_id, literal(shard), literal(delta)),
+        )
+        return query.on_conflict_do_update(
+            index_elements=["tweet_id", "shard"],
+            set_={"delta": LikeCounterShardModel.delta + query.excluded.delta},
+        ).returning(LikeCounterShardModel.tweet_id)
+
+    changed_tweets = (
+        update(TweetModel)
+        .where(TweetModel.id.in_(select(changed_likes.c.tweet_id)))
+        .values(
+            likes_count=TweetModel.likes_count + delta,
+            likes_version=TweetModel.likes_version + 1,
+        )
+        .returning(TweetModel.id)
+        .cte("changed_tweets")
+    )
+    return select(changed_tweets.c.id)
+
+
+async def fold_like_counters(session: AsyncSession) -> int:
+    """
+    Перенос накопленных в шардах значений в `tweets.likes_count`.
+    Шарды удаляются и их сумма прибавляется к твитам одним запросом,
+    поэтому лайки, поставленные во время переноса, не теряются.
+    :param session: объект сессии
+    :return: кол-во обновлённых твитов
+    """
+    folded = (
+        delete(LikeCounterShardModel)
+        .returning(LikeCounterShardModel.tweet_id, LikeCounterShardModel.delta)
+        .cte("folded")
+    )
+    totals = (
+        select(folded.c.tweet_id, func.sum(folded.c.delta).label("delta"))
+        .group_by(folded.c.tweet_id)
+        .subquery()
+    )
+    updated = (
+        update(TweetModel)
+        .where(TweetModel.id == totals.c.tweet_id)
+        .values(
+            likes_count=TweetModel.likes_count + totals.c.delta,
+            likes_version=TweetModel.likes_version + 1,
+        )
+        .returning(TweetModel.id)
+        .cte("updated")
+    )
+    query = select(func.count()).select_from(updated)
+    folded_count: int = await session.scalar(query)
+    await session.commit()
+    return folded_count
+
+
+async def fold_like_counters_forever(
+    db: DBConnect, interval: float = LIKES_COUNTER_FOLD_INTERVAL
+) -> None:
+    """
+    Фоновая задача, периодически переносящая шарды в `tweets.likes_count`
+    :param db: подключение к БД
+    :param interval: период переноса в секундах
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with db.async_session() as session:
+                await fold_like_counters(session)
+        except Exception:
+            logger.exception("Failed to fold like counters")
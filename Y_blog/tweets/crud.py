@@ -1,81 +1,342 @@
 """Модуль для описания CRUD-действий модели `Tweet`"""
 
+import mimetypes
+
 from fastapi import HTTPException, status
-from sqlalchemy import desc, select
+from sqlalchemy import (
+    JSON,
+    ColumnElement,
+    CompoundSelect,
+    Select,
+    delete,
+    desc,
+    func,
+    literal,
+    literal_column,
+    select,
+    true,
+    tuple_,
+    union,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from sqlalchemy.engine import Result
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import aliased, selectinload
 
+from config import (
+    LIKES_PAGE_LIMIT,
+    TIMELINE_IMAGE_DERIVATIVE,
+    TIMELINE_LIKERS_LIMIT,
+    TWEETS_PAGE_LIMIT,
+)
 from models.followers import FollowerModel
+from models.image_derivative import ImageDerivativeModel
 from models.likes import LikeModel
+from models.media_file import MediaFileModel
+from models.media_img import ImageModel
+from models.timeline import TimelineModel
 from models.tweet import TweetModel
-from Y_blog.images import crud
-from .schemas import TweetCreate, TweetInList
+from models.user import UserModel
+from Y_blog.images import cleanup, crud
+from Y_blog.pagination import decode_cursor, encode_cursor
+from Y_blog.records import TweetRecord
+from . import counters
+from .schemas import TweetCreate
+
+
+def _timeline_tweet_ids(user_id: int) -> CompoundSelect:
+    """
+    Запрос id твитов ленты пользователя: твиты из материализованной ленты
+    плюс твиты авторов с `fanout_on_read`, на которых он подписан
+    :param user_id: id пользователя
+    """
+    inbox = select(TimelineModel.tweet_id).where(TimelineModel.user_id == user_id)
+    pulled = (
+        select(TweetModel.id)
+        .join(FollowerModel, FollowerModel.following_id == TweetModel.author_id)
+        .join(UserModel, UserModel.id == TweetModel.author_id)
+        .where(FollowerModel.followers_id == user_id, UserModel.fanout_on_read)
+    )
+    return union_all(inbox, pulled)
 
 
-async def read_user_tweets_list(session: AsyncSession, user_id: int) -> dict | None:
+async def read_user_tweets_list(
+    session: AsyncSession,
+    user_id: int,
+    limit: int = TWEETS_PAGE_LIMIT,
+    cursor: str | None = None,
+) -> dict | None:
     """
-    Получение ленты твитов из БД от тех, на кого подписан пользователь.
+    Получение страницы ленты твитов из БД от тех, на кого подписан пользователь.
+    Твиты отсортированы по `(likes_count, id)` в порядке убывания, следующая
+    страница начинается строго после ключа из `cursor` (без OFFSET).
+    `likes_count` меняется между запросами страниц, поэтому твит, который лайкнули
+    или разлайкнули после чтения страницы, может перейти через ключ курсора: он не
+    попадёт в следующие страницы или попадёт в них второй раз. Лента упорядочена по
+    популярности, поэтому это допускается, а не лечится сортировкой по `id`.
+    Страница читается одним запросом без ORM: автор, лайкнувшие и картинки каждого
+    твита собираются в JSON на стороне БД (см. `_timeline_page_query`).
     :param session объект сессии
     :param user_id: id пользователя
+    :param limit: максимальное кол-во твитов на странице
+    :param cursor: курсор из `next_cursor` предыдущей страницы
     """
+    keyset = None
+    if cursor is not None:
+        keyset = decode_cursor(cursor, size=2)
+
+    result: Result = await session.execute(
+        _timeline_page_query(user_id=user_id, limit=limit, keyset=keyset)
+    )
+    tweets = [
+        TweetRecord(
+            id=row.id,
+            content=row.content,
+            author={"id": row.author_id, "name": row.author_name},
+            likes=row.likes,
+            likes_count=row.likes_count,
+            attachments_info=[_attachment_info(img) for img in row.attachments],
+        )
+        for row in result
+    ]
+    next_cursor = None
+    if len(tweets) > limit:
+        tweets = tweets[:limit]
+        next_cursor = encode_cursor(tweets[-1].likes_count, tweets[-1].id)
+
+    return {
+        "result": True,
+        "tweets": tweets,
+        "next_cursor": next_cursor,
+    }
+
+
+async def read_timeline_version(
+    session: AsyncSession, user_id: int
+) -> tuple[int, int, int]:
+    """
+    Получение версии ленты пользователя для `ETag` (см. `models/versions.py`):
+    его `follow_version`, сумма `content_version` авторов, на которых он подписан,
+    и сумма `likes_version` их твитов. Строки твитов не читаются: `likes_version`
+    берётся из индекса `idx_tweets_author_likes_version`
+    :param session: объект сессии
+    :param user_id: id пользователя
+    """
+    authors = aliased(UserModel)
+    likes_version = (
+        select(func.coalesce(func.sum(TweetModel.likes_version), 0))
+        .join(FollowerModel, FollowerModel.following_id == TweetModel.author_id)
+        .where(FollowerModel.followers_id == user_id)
+        .scalar_subquery()
+    )
     query = (
-        select(TweetModel)
-        .options(
-            selectinload(TweetModel.images),
-            joinedload(TweetModel.user),
-            selectinload(TweetModel.all_likes).joinedload(LikeModel.user),
+        select(
+            UserModel.follow_version,
+            func.coalesce(func.sum(authors.content_version), 0),
+            likes_version,
+        )
+        .outerjoin(FollowerModel, FollowerModel.followers_id == UserModel.id)
+        .outerjoin(authors, authors.id == FollowerModel.following_id)
+        .where(UserModel.id == user_id)
+        .group_by(UserModel.id)
+    )
+    follow_version, content_version, likes_version = (
+        await session.execute(query)
+    ).one()
+    return follow_version, content_version, likes_version
+
+
+def _timeline_page_query(
+    user_id: int, limit: int, keyset: tuple[int, int] | None
+) -> Select:
+    """
+    Запрос страницы ленты: по строке на твит с автором, последними
+    `TIMELINE_LIKERS_LIMIT` лайкнувшими (плюс лайк самого пользователя, чтобы клиент
+    знал, что твит им уже лайкнут) и картинками в виде JSON-массивов
+    :param user_id: id пользователя, читающего ленту
+    :param limit: кол-во твитов на странице
+    :param keyset: `(likes_count, id)` последнего твита предыдущей страницы
+    """
+    page = (
+        select(
+            TweetModel.id,
+            TweetModel.content,
+            TweetModel.likes_count,
+            TweetModel.author_id,
         )
-        .filter(
-            TweetModel.author_id.in_(
-                select(FollowerModel.following_id).where(
-                    FollowerModel.followers_id == user_id
-                )
+        .where(TweetModel.id.in_(_timeline_tweet_ids(user_id=user_id)))
+        .order_by(desc(TweetModel.likes_count), desc(TweetModel.id))
+        .limit(limit + 1)
+    )
+    if keyset is not None:
+        page = page.where(tuple_(TweetModel.likes_count, TweetModel.id) < keyset)
+    page = page.cte("page")
+
+    top_likers = (
+        select(LikeModel.id, LikeModel.user_id)
+        .where(LikeModel.tweet_id == page.c.id)
+        .order_by(desc(LikeModel.id))
+        .limit(TIMELINE_LIKERS_LIMIT)
+        .correlate(page)
+    )
+    own_like = (
+        select(LikeModel.id, LikeModel.user_id)
+        .where(LikeModel.tweet_id == page.c.id, LikeModel.user_id == user_id)
+        .correlate(page)
+    )
+    likers = union(top_likers, own_like).subquery("likers")
+    likes = (
+        select(
+            _json_array(
+                func.json_build_object(
+                    "user_id", likers.c.user_id, "name", UserModel.nickname
+                ),
+                order_by=desc(likers.c.id),
             )
         )
-        .order_by(desc(TweetModel.likes_count))
-    )
-    result: Result = await session.execute(query)
-    tweets = result.scalars().all()
-
-    if tweets is not None:
-        all_user_tweets = []
-
-        for i_tweet in tweets:
-            img_links = []
-            tweet_likes = []
-            author_info = {"id": i_tweet.user.id, "name": i_tweet.user.nickname}
-
-            if i_tweet.all_likes is not None:
-                for i_like in i_tweet.all_likes:
-                    like_info = {
-                        "user_id": i_like.user_id,
-                        "name": i_like.user.nickname,
-                    }
-                    tweet_likes.append(like_info)
-
-            if i_tweet.images is not None:
-                for img_path in i_tweet.images:
-                    img_links.append(img_path.filepath)
-
-            all_user_tweets.append(
-                TweetInList(
-                    id=i_tweet.id,
-                    content=i_tweet.content,
-                    attachments=img_links,
-                    author=author_info,
-                    likes=tweet_likes,
-                )
+        .select_from(likers)
+        .join(UserModel, UserModel.id == likers.c.user_id)
+        .scalar_subquery()
+    )
+
+    # LIMIT не даёт Postgres развернуть подзапрос в обычное соединение, поэтому копия
+    # ищется по уникальному индексу `(file_id, kind)` для каждой картинки
+    derivative = (
+        select(ImageDerivativeModel)
+        .where(
+            ImageDerivativeModel.file_id == ImageModel.file_id,
+            ImageDerivativeModel.kind == TIMELINE_IMAGE_DERIVATIVE,
+        )
+        .limit(1)
+        .lateral("derivative")
+    )
+    attachments = (
+        select(
+            _json_array(
+                func.json_build_object(
+                    "id",
+                    ImageModel.id,
+                    "filepath",
+                    ImageModel.filepath,
+                    "file_size",
+                    MediaFileModel.size,
+                    "kind",
+                    derivative.c.kind,
+                    "width",
+                    derivative.c.width,
+                    "height",
+                    derivative.c.height,
+                    "size",
+                    derivative.c.size,
+                    "mime_type",
+                    derivative.c.mime_type,
+                ),
+                order_by=ImageModel.id,
             )
+        )
+        .select_from(ImageModel)
+        .outerjoin(MediaFileModel, MediaFileModel.id == ImageModel.file_id)
+        .outerjoin(derivative, true())
+        .where(ImageModel.tweet_id == page.c.id)
+        .scalar_subquery()
+    )
 
+    return (
+        select(
+            page.c.id,
+            page.c.content,
+            page.c.likes_count,
+            page.c.author_id,
+            UserModel.nickname.label("author_name"),
+            likes.label("likes"),
+            attachments.label("attachments"),
+        )
+        .join(UserModel, UserModel.id == page.c.author_id)
+        .order_by(desc(page.c.likes_count), desc(page.c.id))
+    )
+
+
+def _json_array(element: ColumnElement, order_by: ColumnElement) -> ColumnElement:
+    """
+    `json_agg` с сортировкой элементов, возвращающий пустой массив вместо NULL
+    :param element: элемент массива
+    :param order_by: порядок элементов
+    """
+    return func.coalesce(
+        func.json_agg(aggregate_order_by(element, order_by)),
+        literal_column("'[]'::json"),
+        type_=JSON,
+    )
+
+
+def _attachment_info(image: dict) -> dict:
+    """
+    Описание картинки для ленты: уменьшенная копия `TIMELINE_IMAGE_DERIVATIVE` с её
+    размерами, а пока копия не готова (или картинка загружена до появления копий) -
+    исходный файл без размеров. Ссылки ведут на `GET /api/medias/{id}`
+    :param image: картинка твита из `_timeline_page_query`
+    """
+    if image["kind"] is not None:
         return {
-            "result": True,
-            "tweets": all_user_tweets,
+            "url": f"/api/medias/{image['id']}?kind={image['kind']}",
+            "width": image["width"],
+            "height": image["height"],
+            "size": image["size"],
+            "mime_type": image["mime_type"],
         }
+    return {
+        "url": f"/api/medias/{image['id']}",
+        "width": None,
+        "height": None,
+        "size": image["file_size"],
+        "mime_type": mimetypes.guess_type(image["filepath"])[0],
+    }
 
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND, detail="Tweets not found!"
+
+async def read_tweet_likes(
+    session: AsyncSession,
+    tweet_id: int,
+    limit: int = LIKES_PAGE_LIMIT,
+    cursor: str | None = None,
+) -> dict:
+    """
+    Получение из БД страницы списка лайкнувших твит, от новых лайков к старым
+    :param session: объект сессии
+    :param tweet_id: id твита
+    :param limit: максимальное кол-во лайков на странице
+    :param cursor: курсор из `next_cursor` предыдущей страницы
+    """
+    query = (
+        select(LikeModel.id, LikeModel.user_id, UserModel.nickname)
+        .join(UserModel, UserModel.id == LikeModel.user_id)
+        .where(LikeModel.tweet_id == tweet_id)
+        .order_by(desc(LikeModel.id))
+        .limit(limit + 1)
     )
+    if cursor is not None:
+        (last_id,) = decode_cursor(cursor, size=1)
+        query = query.where(LikeModel.id < last_id)
+
+    likes = (await session.execute(query)).all()
+    if not likes and cursor is None:
+        query_tweet = select(TweetModel.id).where(TweetModel.id == tweet_id)
+        if await session.scalar(query_tweet) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Tweet id=`{tweet_id}` not found !",
+            )
+
+    next_cursor = None
+    if len(likes) > limit:
+        likes = likes[:limit]
+        next_cursor = encode_cursor(likes[-1].id)
+
+    return {
+        "result": True,
+        "likes": [{"user_id": like.user_id, "name": like.nickname} for like in likes],
+        "next_cursor": next_cursor,
+    }
 
 
 async def create_tweet(
@@ -110,13 +371,13 @@ async def delete_tweet(session: AsyncSession, user_id: int, tweet_id: int) -> di
     cur_tweet: TweetModel | None = await session.scalar(query)
 
     if cur_tweet is not None:
-        if cur_tweet.images is not None:
-            for img in cur_tweet.images:
-                await crud.delete_img(img.filepath)
-
+        unused_paths = await crud.release_images(session, cur_tweet.images)
         await session.delete(cur_tweet)
         await session.commit()
         await session.close()
+
+        # файлы удаляются только после commit, чтобы не потерять их при откате
+        cleanup.schedule_deletion(unused_paths)
         return {
             "result": True,
         }
@@ -129,69 +390,121 @@ async def delete_tweet(session: AsyncSession, user_id: int, tweet_id: int) -> di
 
 async def create_like(session: AsyncSession, user_id: int, tweet_id: int) -> dict:
     """
-    Создание в БД отметки `лайк` для твита
+    Создание в БД отметки `лайк` для твита.
+    Вставка лайка и увеличение счётчика выполняются одним запросом:
+    `INSERT ... ON CONFLICT DO NOTHING RETURNING` в CTE и изменение счётчика на стороне БД
+    (см. `counters.change_likes_count_query`).
     :param session: объект сессии
     :param user_id: id того кто ставит `лайк`
     :param tweet_id: id понравившегося твита
     """
-    query_like = select(LikeModel).where(
-        LikeModel.user_id == user_id, LikeModel.tweet_id == tweet_id
+    new_like = (
+        insert(LikeModel)
+        .from_select(
+            ["user_id", "tweet_id"],
+            select(literal(user_id), TweetModel.id).where(TweetModel.id == tweet_id),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+        .returning(LikeModel.tweet_id)
+        .cte("new_like")
     )
-    like_result: LikeModel | None = await session.scalar(query_like)
-
-    if like_result is None:
-        query_tweet = select(TweetModel).where(TweetModel.id == tweet_id)
-        tweet_result: TweetModel | None = await session.scalar(query_tweet)
-
-        if tweet_result is not None:
-            tweet_result.likes_count = tweet_result.likes_count + 1
-            await session.flush()  # для тестов
-            new_like = LikeModel(user_id=user_id, tweet_id=tweet_id)
-            session.add(new_like)
-            await session.commit()
+    query = counters.change_likes_count_query(new_like, delta=1)
+    liked_tweet_id: int | None = await session.scalar(query)
+    await session.commit()
 
-            return {
-                "result": True,
-            }
+    if liked_tweet_id is not None:
+        return {
+            "result": True,
+        }
 
+    query_tweet = select(TweetModel.id).where(TweetModel.id == tweet_id)
+    if await session.scalar(query_tweet) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Tweet id=`{tweet_id}` not found !",
         )
 
-    else:
-        return {"result": False, "message": "You have already liked this tweet!"}
+    return {"result": False, "message": "You have already liked this tweet!"}
+
+
+async def create_likes(
+    session: AsyncSession, user_id: int, tweet_ids: list[int]
+) -> dict:
+    """
+    Создание в БД отметок `лайк` сразу для нескольких твитов.
+    Лайки вставляются и счётчики меняются одним запросом (как в `create_like`),
+    всё выполняется в одной транзакции.
+    :param session: объект сессии
+    :param user_id: id того кто ставит `лайк`
+    :param tweet_ids: id понравившихся твитов
+    :return: результат для каждого id (в порядке запроса, без повторов)
+    """
+    tweet_ids = list(dict.fromkeys(tweet_ids))
+    new_likes = (
+        insert(LikeModel)
+        .from_select(
+            ["user_id", "tweet_id"],
+            select(literal(user_id), TweetModel.id).where(TweetModel.id.in_(tweet_ids)),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+        .returning(LikeModel.tweet_id)
+        .cte("new_likes")
+    )
+    query = counters.change_likes_count_query(new_likes, delta=1)
+    liked = set(await session.scalars(query))
+
+    existing = set()
+    if len(liked) < len(tweet_ids):
+        query_tweets = select(TweetModel.id).where(
+            TweetModel.id.in_(set(tweet_ids) - liked)
+        )
+        existing = set(await session.scalars(query_tweets))
+    await session.commit()
+
+    results = []
+    for tweet_id in tweet_ids:
+        if tweet_id in liked:
+            results.append({"tweet_id": tweet_id, "result": True})
+        elif tweet_id in existing:
+            results.append(
+                {
+                    "tweet_id": tweet_id,
+                    "result": False,
+                    "message": "You have already liked this tweet!",
+                }
+            )
+        else:
+            results.append(
+                {
+                    "tweet_id": tweet_id,
+                    "result": False,
+                    "ERROR": f"Tweet id=`{tweet_id}` not found !",
+                }
+            )
+    return {"result": True, "likes": results}
 
 
 async def delete_like(session: AsyncSession, user_id: int, tweet_id: int) -> dict:
     """
-    Удаление в БД отметки `лайк` для твита
+    Удаление в БД отметки `лайк` для твита.
+    Удаление лайка и уменьшение `likes_count` выполняются одним запросом.
     :param session: объект сессии
     :param user_id: id того кто убирает `лайк`
     :param tweet_id: id твита который разонравился
     """
-    query_like = select(LikeModel).where(
-        LikeModel.user_id == user_id, LikeModel.tweet_id == tweet_id
+    old_like = (
+        delete(LikeModel)
+        .where(LikeModel.user_id == user_id, LikeModel.tweet_id == tweet_id)
+        .returning(LikeModel.tweet_id)
+        .cte("old_like")
     )
-    like_result: LikeModel | None = await session.scalar(query_like)
-
-    if like_result is not None:
-        query_tweet = select(TweetModel).where(TweetModel.id == tweet_id)
-        tweet_result: TweetModel | None = await session.scalar(query_tweet)
-
-        if tweet_result is not None:
-            tweet_result.likes_count = tweet_result.likes_count - 1
-            await session.delete(like_result)
-            await session.commit()
-            await session.close()
-            return {
-                "result": True,
-            }
+    query = counters.change_likes_count_query(old_like, delta=-1)
+    disliked_tweet_id: int | None = await session.scalar(query)
+    await session.commit()
 
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Tweet id=`{tweet_id}` not found for this user!",
-        )
+    if disliked_tweet_id is not None:
+        return {
+            "result": True,
+        }
 
-    else:
-        return {"result": False, "message": "This tweet doesn't have your like!"}
+    return {"result": False, "message": "This tweet doesn't have your like!"}
@@ -1,9 +1,14 @@
 """Модуль для описания схем `Tweet`"""
 
 from datetime import datetime
+from typing import Annotated
 
+from annotated_types import MaxLen, MinLen
 from pydantic import BaseModel, ConfigDict
 
+from config import BULK_MAX_IDS
+from Y_blog.schemas import OperationResult
+
 
 class TweetBase(BaseModel):
     content: str
@@ -22,8 +27,60 @@ class TweetCreate(TweetBase):
     tweet_media_ids: list[int] | None
 
 
+class Author(BaseModel):
+    id: int
+    name: str
+
+
+class Liker(BaseModel):
+    user_id: int
+    name: str
+
+
+class Attachment(BaseModel):
+    url: str
+    width: int | None
+    height: int | None
+    size: int | None
+    mime_type: str | None
+
+
 class TweetInList(TweetBase):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
-    attachments: list
-    author: dict
-    likes: list
+    attachments: list[str]
+    attachments_info: list[Attachment] = []
+    author: Author
+    likes: list[Liker]
+    likes_count: int
+
+
+class TweetsPage(BaseModel):
+    result: bool
+    tweets: list[TweetInList]
+    next_cursor: str | None
+
+
+class TweetLikesPage(BaseModel):
+    result: bool
+    likes: list[Liker]
+    next_cursor: str | None
+
+
+class TweetCreated(BaseModel):
+    result: bool
+    tweet_id: int
+
+
+class LikesBulk(BaseModel):
+    tweet_ids: Annotated[list[int], MinLen(1), MaxLen(BULK_MAX_IDS)]
+
+
+class LikeResult(OperationResult):
+    tweet_id: int
+
+
+class LikesBulkResult(BaseModel):
+    result: bool
+    likes: list[LikeResult]
@@ -2,35 +2,66 @@
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Path, Query, status
+from fastapi import APIRouter, Depends, Path, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import (
+    LIKES_PAGE_LIMIT,
+    LIKES_PAGE_MAX_LIMIT,
+    TWEETS_PAGE_LIMIT,
+    TWEETS_PAGE_MAX_LIMIT,
+)
 from models.base import y_blog_db
 from Y_blog.check_user_token import token_required
+from Y_blog.conditional import not_modified
 from . import crud
-from .schemas import TweetCreate
+from Y_blog.schemas import OperationResult
+from .schemas import (
+    LikesBulk,
+    LikesBulkResult,
+    TweetCreate,
+    TweetCreated,
+    TweetLikesPage,
+    TweetsPage,
+)
 
 
 router = APIRouter(prefix="/api/tweets", tags=["Tweets"])
 
 
-@router.get("/", response_model=dict, status_code=status.HTTP_200_OK)
+@router.get("/", response_model=TweetsPage, status_code=status.HTTP_200_OK)
 @token_required
 async def get_tweets(
+    request: Request,
+    response: Response,
     api_key: str,
+    limit: Annotated[int, Query(ge=1, le=TWEETS_PAGE_MAX_LIMIT)] = TWEETS_PAGE_LIMIT,
+    cursor: str | None = None,
     user_id: Annotated[int | None, Query(include_in_schema=False)] = None,
-    session: AsyncSession = Depends(y_blog_db.session_dependency),
+    session: AsyncSession = Depends(y_blog_db.read_session_dependency),
 ):
     """
-    Endpoint для получения списка твитов тех, на кого подписан пользователь
+    Endpoint для получения списка твитов тех, на кого подписан пользователь.
+    Отвечает `304`, если лента не менялась с ответа с `ETag` из `If-None-Match`
+    :param request: запрос клиента
+    :param response: ответ (для заголовков `ETag`)
     :param api_key: api_key пользователя
+    :param limit: кол-во твитов на странице
+    :param cursor: курсор следующей страницы (`next_cursor` из прошлого ответа)
     :param user_id: id пользователя
     :param session: объект сессии
     """
-    return await crud.read_user_tweets_list(session=session, user_id=user_id)
+    version = await crud.read_timeline_version(session=session, user_id=user_id)
+    cached = not_modified(request, response, "tweets", user_id, *version, limit, cursor)
+    if cached is not None:
+        return cached
+
+    return await crud.read_user_tweets_list(
+        session=session, user_id=user_id, limit=limit, cursor=cursor
+    )
 
 
-@router.post("/", response_model=dict, status_code=status.HTTP_201_CREATED)
+@router.post("/", response_model=TweetCreated, status_code=status.HTTP_201_CREATED)
 @token_required
 async def post_tweet(
     new_tweet: TweetCreate,
@@ -50,7 +81,12 @@ async def post_tweet(
     )
 
 
-@router.delete("/{tweet_id}/", response_model=dict, status_code=status.HTTP_200_OK)
+@router.delete(
+    "/{tweet_id}/",
+    response_model=OperationResult,
+    response_model_exclude_unset=True,
+    status_code=status.HTTP_200_OK,
+)
 @token_required
 async def del_tweet(
     tweet_id: Annotated[int, Path(..., ge=1)],
@@ -72,8 +108,64 @@ async def del_tweet(
     )
 
 
+@router.get(
+    "/{tweet_id}/likes/", response_model=TweetLikesPage, status_code=status.HTTP_200_OK
+)
+@token_required
+async def get_tweet_likes(
+    tweet_id: Annotated[int, Path(..., ge=1)],
+    api_key: str,
+    limit: Annotated[int, Query(ge=1, le=LIKES_PAGE_MAX_LIMIT)] = LIKES_PAGE_LIMIT,
+    cursor: str | None = None,
+    user_id: Annotated[int | None, Query(include_in_schema=False)] = None,
+    session: AsyncSession = Depends(y_blog_db.read_session_dependency),
+):
+    """
+    Endpoint для получения списка лайкнувших твит
+    :param tweet_id: id твита
+    :param api_key: api_key пользователя
+    :param limit: кол-во лайков на странице
+    :param cursor: курсор следующей страницы (`next_cursor` из прошлого ответа)
+    :param user_id: id пользователя
+    :param session: объект сессии
+    """
+    return await crud.read_tweet_likes(
+        session=session, tweet_id=tweet_id, limit=limit, cursor=cursor
+    )
+
+
+@router.post(
+    "/likes/",
+    response_model=LikesBulkResult,
+    response_model_exclude_unset=True,
+    status_code=status.HTTP_201_CREATED,
+)
+@token_required
+async def like_tweets(
+    likes: LikesBulk,
+    api_key: str,
+    user_id: Annotated[int | None, Query(include_in_schema=False)] = None,
+    session: AsyncSession = Depends(y_blog_db.session_dependency),
+):
+    """
+    Endpoint чтобы лайкнуть сразу несколько твитов (не больше `BULK_MAX_IDS`)
+    :param likes: id понравившихся твитов
+    :param api_key: api_key пользователя
+    :param user_id: id пользователя
+    :param session: объект сессии
+    """
+    return await crud.create_likes(
+        session=session,
+        user_id=user_id,
+        tweet_ids=likes.tweet_ids,
+    )
+
+
 @router.post(
-    "/{tweet_id}/likes/", response_model=dict, status_code=status.HTTP_201_CREATED
+    "/{tweet_id}/likes/",
+    response_model=OperationResult,
+    response_model_exclude_unset=True,
+    status_code=status.HTTP_201_CREATED,
 )
 @token_required
 async def like_tweet(
@@ -97,7 +189,10 @@ async def like_tweet(
 
 
 @router.delete(
-    "/{tweet_id}/likes/", response_model=dict, status_code=status.HTTP_200_OK
+    "/{tweet_id}/likes/",
+    response_model=OperationResult,
+    response_model_exclude_unset=True,
+    status_code=status.HTTP_200_OK,
 )
 @token_required
 async def dislike_tweet(
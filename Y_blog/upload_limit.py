@@ -0,0 +1,78 @@
+"""
+Модуль для ограничения размера тела запросов загрузки файлов (`UPLOAD_PATHS`).
+
+FastAPI разбирает multipart-форму (и сохраняет файл во временный файл Starlette)
+до вызова endpoint`а, поэтому проверить `MAX_UPLOAD_SIZE` в самом endpoint`е можно
+только после того, как клиент передал файл целиком. Middleware отклоняет запрос
+с `413` сразу по заголовку `Content-Length`, а тело без него (chunked) перестаёт
+читать, как только оно превысит `MAX_UPLOAD_BODY_SIZE`.
+"""
+
+import orjson
+from fastapi import HTTPException, status
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import MAX_UPLOAD_BODY_SIZE, UPLOAD_PATHS
+
+
+class UploadLimitMiddleware:
+    """ASGI-middleware, ограничивающее размер тела POST-запросов к `UPLOAD_PATHS`"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(UPLOAD_PATHS)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        max_size = MAX_UPLOAD_BODY_SIZE
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and int(content_length) > max_size:
+            await _send_too_large(send, max_size)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > max_size:
+                # HTTPException из разбора тела FastAPI превращает в ответ как есть
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=_too_large_detail(max_size),
+                )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _too_large_detail(max_size: int) -> str:
+    return f"The request body is larger than {max_size} bytes!"
+
+
+async def _send_too_large(send: Send, max_size: int) -> None:
+    """
+    Ответ `413` без чтения тела запроса
+    :param send: ASGI send
+    :param max_size: максимальный размер тела запроса
+    """
+    body = orjson.dumps({"detail": _too_large_detail(max_size)})
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
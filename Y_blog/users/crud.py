@@ -1,13 +1,31 @@
 """Модуль для описания CRUD-действий модели `User`"""
 
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import (
+    JSON,
+    ScalarSelect,
+    Select,
+    desc,
+    exists,
+    false,
+    func,
+    literal,
+    literal_column,
+    select,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import InstrumentedAttribute, aliased, joinedload
 
+from config import FOLLOWS_PAGE_LIMIT, PROFILE_FOLLOWS_LIMIT
 from models.followers import FollowerModel
+from models.timeline import backfill_new_follows_query
 from models.user import UserModel
+from models.versions import change_follow_counts_query
+from Y_blog.check_user_token import token_cache
+from Y_blog.pagination import decode_cursor, encode_cursor
+from Y_blog.records import ProfileRecord
 from Y_blog.users.schemas import UserCreate
 
 
@@ -24,6 +42,7 @@ async def create_user(
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    token_cache.invalidate(token)
     return user
 
 
@@ -31,7 +50,9 @@ async def create_user_follower(
     session: AsyncSession, main_user_id: int, follower_id: int
 ) -> dict:
     """
-    Создание в БД новой записи подписчика
+    Создание в БД новой записи подписчика.
+    Счётчики подписок обоих пользователей меняются в той же транзакции
+    (событие модели, см. `models/versions.py`).
     :param session: объект сессии
     :param main_user_id: id пользователя на которого подписались
     :param follower_id: id подписчика
@@ -77,11 +98,83 @@ async def create_user_follower(
         }
 
 
+async def create_user_followers(
+    session: AsyncSession, user_ids: list[int], follower_id: int
+) -> dict:
+    """
+    Создание в БД подписок сразу на нескольких пользователей.
+    Подписки, счётчики подписок и доставка твитов авторов в ленту подписчика
+    выполняются одним запросом
+    (`INSERT ... ON CONFLICT DO NOTHING RETURNING` в CTE) в одной транзакции.
+    :param session: объект сессии
+    :param user_ids: id пользователей на которых подписываются
+    :param follower_id: id подписчика
+    :return: результат для каждого id (в порядке запроса, без повторов)
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    new_follows = (
+        insert(FollowerModel)
+        .from_select(
+            ["following_id", "followers_id"],
+            select(UserModel.id, literal(follower_id)).where(
+                UserModel.id.in_(user_ids), UserModel.id != follower_id
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["following_id", "followers_id"])
+        .returning(FollowerModel.following_id, FollowerModel.followers_id)
+        .cte("new_follows")
+    )
+    backfill = backfill_new_follows_query(new_follows).cte("backfill")
+    counts = change_follow_counts_query(new_follows, delta=1).cte("counts")
+    query = select(new_follows.c.following_id).add_cte(backfill, counts)
+    followed = set(await session.scalars(query))
+
+    existing = set()
+    if len(followed) < len(user_ids):
+        query_users = select(UserModel.id).where(
+            UserModel.id.in_(set(user_ids) - followed)
+        )
+        existing = set(await session.scalars(query_users))
+    await session.commit()
+
+    results = []
+    for user_id in user_ids:
+        if user_id in followed:
+            results.append({"user_id": user_id, "result": True})
+        elif user_id == follower_id:
+            results.append(
+                {
+                    "user_id": user_id,
+                    "result": False,
+                    "ERROR": "You can't follow yourself :(",
+                }
+            )
+        elif user_id in existing:
+            results.append(
+                {
+                    "user_id": user_id,
+                    "result": False,
+                    "message": "You have already follow this user!",
+                }
+            )
+        else:
+            results.append(
+                {
+                    "user_id": user_id,
+                    "result": False,
+                    "ERROR": f"You can't follow user with id={user_id}, because he doesn't exist.",
+                }
+            )
+    return {"result": True, "follows": results}
+
+
 async def delete_user_follower(
     session: AsyncSession, main_user_id: int, follower_id: int
 ) -> dict:
     """
-    Удаление из БД записи о подписчике
+    Удаление из БД записи о подписчике.
+    Счётчики подписок обоих пользователей меняются в той же транзакции
+    (событие модели, см. `models/versions.py`).
     :param session: объект сессии
     :param main_user_id: id пользователя на которого была подписка
     :param follower_id: id подписчика
@@ -110,53 +203,234 @@ async def delete_user_follower(
         return {"result": False, "message": f"You are not follow this user yet!"}
 
 
-async def read_user_profile(session: AsyncSession, user_id: int) -> dict:
+async def read_user_profile(
+    session: AsyncSession, user_id: int, viewer_id: int | None = None
+) -> dict:
     """
-    Получение из БД информации о пользователе
+    Получение из БД информации о пользователе.
+    Профиль читается одним запросом без ORM: кол-во подписчиков и подписок берётся
+    из счётчиков `users`, а в профиль встраиваются только первые
+    `PROFILE_FOLLOWS_LIMIT` подписчиков и подписок (остальные - через
+    `read_user_followers`/`read_user_following` по `next_cursor`).
+    Подписан ли на пользователя тот, кто смотрит профиль, отдаётся отдельным
+    полем `is_following`: его подписки может не быть среди встроенных.
     :param session: объект сессии
     :param user_id: id пользователя
+    :param viewer_id: id пользователя, который смотрит профиль (None - аноним)
     """
-    query = (
-        select(UserModel)
-        .options(
-            selectinload(UserModel.follower_list).joinedload(FollowerModel.follow_to),
-            selectinload(UserModel.following_list).joinedload(FollowerModel.follow_by),
-        )
-        .where(UserModel.id == user_id)
-    )
-    result: UserModel | None = await session.scalar(query)
-    all_user_subscriptions = []
-    all_user_subscribers = []
-
-    if result is not None:
-
-        if result.follower_list is not None:
-            for i_user in result.follower_list:
-                subscriptions_info = {
-                    "id": i_user.follow_to.id,
-                    "name": i_user.follow_to.nickname,
-                }
-                all_user_subscriptions.append(subscriptions_info)
-
-        if result.following_list is not None:
-            for i_user in result.following_list:
-                subscribers_info = {
-                    "id": i_user.follow_by.id,
-                    "name": i_user.follow_by.nickname,
-                }
-                all_user_subscribers.append(subscribers_info)
+    query = _profile_query(user_id=user_id, viewer_id=viewer_id)
+    row = (await session.execute(query)).one_or_none()
 
+    if row is not None:
+        followers, followers_next_cursor = _follows_page(
+            row.followers, PROFILE_FOLLOWS_LIMIT
+        )
+        following, following_next_cursor = _follows_page(
+            row.following, PROFILE_FOLLOWS_LIMIT
+        )
         return {
             "result": True,
-            "user": {
-                "id": result.id,
-                "name": result.nickname,
-                "followers": all_user_subscribers,
-                "following": all_user_subscriptions,
-            },
+            "user": ProfileRecord(
+                id=row.id,
+                name=row.nickname,
+                followers_count=row.followers_count,
+                following_count=row.following_count,
+                followers=followers,
+                following=following,
+                followers_next_cursor=followers_next_cursor,
+                following_next_cursor=following_next_cursor,
+                is_following=row.is_following,
+            ),
         }
     await session.close()
 
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND, detail=f"User id=`{user_id}` not found !"
     )
+
+
+async def read_profile_version(session: AsyncSession, user_id: int) -> int | None:
+    """
+    Получение версии профиля пользователя для `ETag` (`follow_version`)
+    :param session: объект сессии
+    :param user_id: id пользователя
+    :return: версия или None, если пользователя нет
+    """
+    query = select(UserModel.follow_version).where(UserModel.id == user_id)
+    return await session.scalar(query)
+
+
+async def read_user_followers(
+    session: AsyncSession,
+    user_id: int,
+    limit: int = FOLLOWS_PAGE_LIMIT,
+    cursor: str | None = None,
+) -> dict:
+    """
+    Получение из БД страницы списка подписчиков пользователя, от новых к старым
+    :param session: объект сессии
+    :param user_id: id пользователя
+    :param limit: максимальное кол-во подписчиков на странице
+    :param cursor: курсор из `next_cursor` предыдущей страницы
+    """
+    return await _read_follows(
+        session,
+        user_id=user_id,
+        user_column=FollowerModel.followers_id,
+        owner_column=FollowerModel.following_id,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
+async def read_user_following(
+    session: AsyncSession,
+    user_id: int,
+    limit: int = FOLLOWS_PAGE_LIMIT,
+    cursor: str | None = None,
+) -> dict:
+    """
+    Получение из БД страницы списка подписок пользователя, от новых к старым
+    :param session: объект сессии
+    :param user_id: id пользователя
+    :param limit: максимальное кол-во подписок на странице
+    :param cursor: курсор из `next_cursor` предыдущей страницы
+    """
+    return await _read_follows(
+        session,
+        user_id=user_id,
+        user_column=FollowerModel.following_id,
+        owner_column=FollowerModel.followers_id,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
+async def _read_follows(
+    session: AsyncSession,
+    user_id: int,
+    user_column: InstrumentedAttribute,
+    owner_column: InstrumentedAttribute,
+    limit: int,
+    cursor: str | None,
+) -> dict:
+    """
+    Страница подписчиков или подписок пользователя (keyset-пагинация по `followers.id`)
+    :param session: объект сессии
+    :param user_id: id пользователя
+    :param user_column: столбец `followers` с id пользователей списка
+    :param owner_column: столбец `followers` с id владельца списка
+    :param limit: максимальное кол-во пользователей на странице
+    :param cursor: курсор из `next_cursor` предыдущей страницы
+    """
+    query = (
+        select(
+            FollowerModel.id.label("follow_id"),
+            UserModel.id,
+            UserModel.nickname.label("name"),
+        )
+        .join(UserModel, UserModel.id == user_column)
+        .where(owner_column == user_id)
+        .order_by(desc(FollowerModel.id))
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        (last_id,) = decode_cursor(cursor, size=1)
+        query = query.where(FollowerModel.id < last_id)
+
+    rows = (await session.execute(query)).mappings().all()
+    if not rows and cursor is None:
+        query_user = select(UserModel.id).where(UserModel.id == user_id)
+        if await session.scalar(query_user) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"User id=`{user_id}` not found !",
+            )
+
+    users, next_cursor = _follows_page(rows, limit)
+    return {"result": True, "users": users, "next_cursor": next_cursor}
+
+
+def _follows_page(rows: list, limit: int) -> tuple[list[dict], str | None]:
+    """
+    Список пользователей страницы и курсор следующей страницы
+    :param rows: до `limit + 1` строк с `follow_id`, `id` и `name`, от новых к старым
+    :param limit: кол-во пользователей на странице
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["follow_id"])
+    return [{"id": row["id"], "name": row["name"]} for row in rows], next_cursor
+
+
+def _profile_query(user_id: int, viewer_id: int | None) -> Select:
+    """
+    Запрос профиля пользователя со счётчиками, первыми страницами подписчиков и подписок
+    и признаком подписки на него пользователя `viewer_id`
+    :param user_id: id пользователя
+    :param viewer_id: id пользователя, который смотрит профиль
+    """
+    if viewer_id is None:
+        is_following = false()
+    else:
+        # одна строка по уникальному индексу `idx_unique_following_followers`
+        is_following = exists().where(
+            FollowerModel.followers_id == viewer_id,
+            FollowerModel.following_id == UserModel.id,
+        )
+    return select(
+        UserModel.id,
+        UserModel.nickname,
+        UserModel.followers_count,
+        UserModel.following_count,
+        _users_json(FollowerModel.followers_id, FollowerModel.following_id).label(
+            "followers"
+        ),
+        _users_json(FollowerModel.following_id, FollowerModel.followers_id).label(
+            "following"
+        ),
+        is_following.label("is_following"),
+    ).where(UserModel.id == user_id)
+
+
+def _users_json(user_column, owner_column) -> ScalarSelect:
+    """
+    Подзапрос JSON-массива `[{"follow_id": ..., "id": ..., "name": ...}]` первых
+    `PROFILE_FOLLOWS_LIMIT + 1` пользователей из `followers`, от новых к старым
+    :param user_column: столбец `followers` с id нужных пользователей
+    :param owner_column: столбец `followers` с id владельца профиля
+    """
+    users = aliased(UserModel)
+    page = (
+        select(FollowerModel.id, users.id.label("user_id"), users.nickname)
+        .join(users, users.id == user_column)
+        .where(owner_column == UserModel.id)
+        .order_by(desc(FollowerModel.id))
+        .limit(PROFILE_FOLLOWS_LIMIT + 1)
+        .correlate(UserModel)
+        .subquery()
+    )
+    return (
+        select(
+            func.coalesce(
+                func.json_agg(
+                    aggregate_order_by(
+                        func.json_build_object(
+                            "follow_id",
+                            page.c.id,
+                            "id",
+                            page.c.user_id,
+                            "name",
+                            page.c.nickname,
+                        ),
+                        desc(page.c.id),
+                    )
+                ),
+                literal_column("'[]'::json"),
+                type_=JSON,
+            )
+        )
+        .select_from(page)
+        .scalar_subquery()
+    )
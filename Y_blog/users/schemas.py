@@ -5,6 +5,9 @@ from typing import Annotated
 from annotated_types import MaxLen, MinLen
 from pydantic import BaseModel, ConfigDict, EmailStr
 
+from config import BULK_MAX_IDS
+from Y_blog.schemas import OperationResult
+
 
 class UserBase(BaseModel):
     name: Annotated[str, MinLen(2), MaxLen(30)]
@@ -21,3 +24,44 @@ class User(UserBase):
 
 class UserCreate(UserBase):
     pass
+
+
+class FollowBulk(BaseModel):
+    user_ids: Annotated[list[int], MinLen(1), MaxLen(BULK_MAX_IDS)]
+
+
+class UserShort(BaseModel):
+    id: int
+    name: str
+
+
+class UserProfile(UserShort):
+    model_config = ConfigDict(from_attributes=True)
+
+    followers_count: int
+    following_count: int
+    followers: list[UserShort]
+    following: list[UserShort]
+    followers_next_cursor: str | None
+    following_next_cursor: str | None
+    is_following: bool
+
+
+class UserProfileResponse(BaseModel):
+    result: bool
+    user: UserProfile
+
+
+class UsersPage(BaseModel):
+    result: bool
+    users: list[UserShort]
+    next_cursor: str | None
+
+
+class FollowResult(OperationResult):
+    user_id: int
+
+
+class FollowBulkResult(BaseModel):
+    result: bool
+    follows: list[FollowResult]
@@ -2,48 +2,143 @@
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Path, Query, status
+from fastapi import APIRouter, Depends, Path, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import FOLLOWS_PAGE_LIMIT, FOLLOWS_PAGE_MAX_LIMIT
 from models.base import y_blog_db
-from Y_blog.check_user_token import token_required
+from Y_blog.check_user_token import (
+    read_token_user_id,
+    token_required,
+    wrong_token_response,
+)
+from Y_blog.conditional import not_modified
 from Y_blog.users import crud
-from Y_blog.users.schemas import User, UserCreate
+from Y_blog.schemas import OperationResult
+from Y_blog.users.schemas import (
+    FollowBulk,
+    FollowBulkResult,
+    User,
+    UserCreate,
+    UserProfileResponse,
+    UsersPage,
+)
 
 
 router = APIRouter(prefix="/api/users", tags=["Users"])
 
 
-@router.get("/me", response_model=dict, status_code=status.HTTP_200_OK)
+@router.get("/me", response_model=UserProfileResponse, status_code=status.HTTP_200_OK)
 @token_required
 async def get_user_info(
+    request: Request,
+    response: Response,
     api_key: str,
     user_id: Annotated[int | None, Query(include_in_schema=False)] = None,
-    session: AsyncSession = Depends(y_blog_db.session_dependency),
+    session: AsyncSession = Depends(y_blog_db.read_session_dependency),
 ):
     """
-    Endpoint для получения информации о пользователе по `api_key`
+    Endpoint для получения информации о пользователе по `api_key`.
+    Отвечает `304`, если профиль не менялся с ответа с `ETag` из `If-None-Match`
+    :param request: запрос клиента
+    :param response: ответ (для заголовков `ETag`)
     :param api_key: api_key пользователя
     :param user_id: id пользователя
     :param session: объект сессии
     """
+    version = await crud.read_profile_version(session=session, user_id=user_id)
+    if version is not None:
+        cached = not_modified(request, response, "profile", user_id, version, None)
+        if cached is not None:
+            return cached
+
     return await crud.read_user_profile(
         session=session,
         user_id=user_id,
     )
 
 
-@router.get("/{id}", response_model=dict, status_code=status.HTTP_200_OK)
+@router.get("/{id}", response_model=UserProfileResponse, status_code=status.HTTP_200_OK)
 async def get_user_info_by_id(
+    request: Request,
+    response: Response,
     id: Annotated[int, Path(..., ge=1)],
-    session: AsyncSession = Depends(y_blog_db.session_dependency),
+    api_key: str | None = None,
+    session: AsyncSession = Depends(y_blog_db.read_session_dependency),
+):
+    """
+    Endpoint для получения информации о пользователе по `id`.
+    С `api_key` в профиле есть `is_following` - подписан ли на пользователя
+    владелец `api_key`.
+    Отвечает `304`, если профиль не менялся с ответа с `ETag` из `If-None-Match`
+    :param request: запрос клиента
+    :param response: ответ (для заголовков `ETag`)
+    :param id: id пользователя
+    :param api_key: api_key пользователя, который смотрит профиль (необязательный)
+    :param session: объект сессии
+    """
+    viewer_id = None
+    if api_key is not None:
+        viewer_id = await read_token_user_id(session=session, api_key=api_key)
+        if viewer_id is None:
+            return wrong_token_response()
+        if viewer_id == id:
+            # на себя подписаться нельзя: ответ тот же, что и без `api_key`
+            viewer_id = None
+
+    # подписка смотрящего меняет `follow_version` пользователя, поэтому версия
+    # остаётся общей, а в `ETag` добавляется только id смотрящего
+    version = await crud.read_profile_version(session=session, user_id=id)
+    if version is not None:
+        cached = not_modified(request, response, "profile", id, version, viewer_id)
+        if cached is not None:
+            return cached
+
+    return await crud.read_user_profile(
+        session=session, user_id=id, viewer_id=viewer_id
+    )
+
+
+@router.get(
+    "/{id}/followers/", response_model=UsersPage, status_code=status.HTTP_200_OK
+)
+async def get_user_followers(
+    id: Annotated[int, Path(..., ge=1)],
+    limit: Annotated[int, Query(ge=1, le=FOLLOWS_PAGE_MAX_LIMIT)] = FOLLOWS_PAGE_LIMIT,
+    cursor: str | None = None,
+    session: AsyncSession = Depends(y_blog_db.read_session_dependency),
+):
+    """
+    Endpoint для получения списка подписчиков пользователя
+    :param id: id пользователя
+    :param limit: кол-во подписчиков на странице
+    :param cursor: курсор следующей страницы (`next_cursor` из прошлого ответа)
+    :param session: объект сессии
+    """
+    return await crud.read_user_followers(
+        session=session, user_id=id, limit=limit, cursor=cursor
+    )
+
+
+@router.get(
+    "/{id}/following/", response_model=UsersPage, status_code=status.HTTP_200_OK
+)
+async def get_user_following(
+    id: Annotated[int, Path(..., ge=1)],
+    limit: Annotated[int, Query(ge=1, le=FOLLOWS_PAGE_MAX_LIMIT)] = FOLLOWS_PAGE_LIMIT,
+    cursor: str | None = None,
+    session: AsyncSession = Depends(y_blog_db.read_session_dependency),
 ):
     """
-    Endpoint для получения информации о пользователе по `id`
+    Endpoint для получения списка подписок пользователя
     :param id: id пользователя
+    :param limit: кол-во подписок на странице
+    :param cursor: курсор следующей страницы (`next_cursor` из прошлого ответа)
     :param session: объект сессии
     """
-    return await crud.read_user_profile(session=session, user_id=id)
+    return await crud.read_user_following(
+        session=session, user_id=id, limit=limit, cursor=cursor
+    )
 
 
 @router.post("/", response_model=User, status_code=status.HTTP_201_CREATED)
@@ -61,7 +156,37 @@ async def create_user(
     return await crud.create_user(session=session, new_user=user, token=api_key)
 
 
-@router.post("/{id}/follow/", response_model=dict, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/follow/",
+    response_model=FollowBulkResult,
+    response_model_exclude_unset=True,
+    status_code=status.HTTP_201_CREATED,
+)
+@token_required
+async def follow_many(
+    follow: FollowBulk,
+    api_key: str,
+    user_id: Annotated[int | None, Query(include_in_schema=False)] = None,
+    session: AsyncSession = Depends(y_blog_db.session_dependency),
+):
+    """
+    Endpoint, чтобы подписаться сразу на нескольких пользователей (не больше `BULK_MAX_IDS`)
+    :param follow: id пользователей, на которых нужно подписаться
+    :param api_key: api_key подписчика
+    :param user_id: id подписчика
+    :param session: объект сессии
+    """
+    return await crud.create_user_followers(
+        session=session, user_ids=follow.user_ids, follower_id=user_id
+    )
+
+
+@router.post(
+    "/{id}/follow/",
+    response_model=OperationResult,
+    response_model_exclude_unset=True,
+    status_code=status.HTTP_201_CREATED,
+)
 @token_required
 async def follow(
     api_key: str,
@@ -81,7 +206,12 @@ async def follow(
     )
 
 
-@router.delete("/{id}/follow/", response_model=dict, status_code=status.HTTP_200_OK)
+@router.delete(
+    "/{id}/follow/",
+    response_model=OperationResult,
+    response_model_exclude_unset=True,
+    status_code=status.HTTP_200_OK,
+)
 @token_required
 async def unfollow(
     api_key: str,
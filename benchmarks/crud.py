@@ -0,0 +1,555 @@
+"""
+Бенчмарк CRUD-функций: время, кол-во SQL-запросов и пиковая память на один вызов.
+
+Запускает каждую функцию из `Y_blog/tweets/crud.py`, `Y_blog/users/crud.py` и
+`Y_blog/images/crud.py`, а также проверку `token_required`, на заполненной БД
+заданного размера (кол-во пользователей и среднее кол-во подписчиков у пользователя,
+твитов у автора и лайков у твита; данные генерирует `social_graph`). Каждый размер
+заполняется в отдельной схеме `bench_<размер>`, которая пересоздаётся при каждом
+запуске, поэтому результаты разных запусков сравнимы. Результаты можно сохранить
+в JSON (`--save`) и сравнить с сохранёнными ранее (`--compare`): запуск завершается
+с кодом 1, если какая-то функция стала медленнее, прожорливее или делает больше
+SQL-запросов. Запуск (по умолчанию используется тестовая БД):
+
+    python -m benchmarks.crud --sizes small medium --save benchmarks/baselines/crud.json
+    python -m benchmarks.crud --sizes small medium --compare benchmarks/baselines/crud.json
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+
+import orjson
+from fastapi import UploadFile
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from benchmarks import social_graph
+from benchmarks.social_graph import SocialGraph
+from config import TEST_DB_PATH
+from models import Base, ImageModel, TweetModel, UserModel
+from Y_blog import check_user_token, query_budget
+from Y_blog.images import cleanup
+from Y_blog.images import crud as images_crud
+from Y_blog.query_budget import QueryLog, current_queries
+from Y_blog.tweets import crud as tweets_crud
+from Y_blog.tweets.schemas import TweetCreate
+from Y_blog.users import crud as users_crud
+from Y_blog.users.schemas import UserCreate
+
+
+SIZES = {
+    "small": {"users": 200, "followers": 10, "tweets": 5, "likes": 5},
+    "medium": {"users": 2_000, "followers": 50, "tweets": 10, "likes": 20},
+    "large": {"users": 10_000, "followers": 200, "tweets": 20, "likes": 50},
+}
+BULK_IDS = 10
+# изменения меньше этих значений - шум, а не регрессия
+NOISE_FLOOR = {"p50_ms": 0.05, "peak_memory_kib": 4}
+
+Case = namedtuple("Case", ["name", "run", "prepare"], defaults=[None])
+
+
+async def seed(
+    engine: AsyncEngine, size: dict, spare_users: int, rng_seed: int
+) -> tuple[int, list[int]]:
+    """
+    Заполнение пустой схемы сгенерированной социальной сетью (см. `social_graph`)
+    и `spare_users` пользователями, которые ни на кого не подписаны и ничего не
+    лайкали: их используют изменяющие функции
+    :param engine: движок БД со схемой бенчмарка в `search_path`
+    :param size: размер БД (см. `SIZES`)
+    :param spare_users: кол-во "свободных" пользователей
+    :param rng_seed: seed генератора данных
+    :return: кол-во твитов и id "свободных" пользователей
+    """
+    graph = SocialGraph(
+        users=size["users"],
+        follows=size["followers"],
+        tweets=size["tweets"],
+        likes=size["likes"],
+        seed=rng_seed,
+    )
+    loaded = await social_graph.load(engine, graph)
+    users = UserModel.__table__
+    async with engine.begin() as conn:
+        spare_ids = await conn.scalars(
+            insert(users).returning(users.c.id, sort_by_parameter_order=True),
+            [
+                {
+                    "name": "spare",
+                    "nickname": f"spare{number}",
+                    "email": f"spare{number}@example.com",
+                    "token": f"spare{number}",
+                }
+                for number in range(spare_users)
+            ],
+        )
+        return loaded["tweets"], list(spare_ids)
+
+
+def build_cases(
+    sessions: async_sessionmaker,
+    size: dict,
+    tweets: int,
+    spare_ids: list[int],
+    media_dir: str,
+) -> list[Case]:
+    """
+    Функции для замера. Изменяющие функции на `i`-м вызове работают со своими
+    записями, поэтому каждый вызов делает одно и то же (например, лайк, которого ещё
+    нет), а парные функции (`create_like`/`delete_like`) отменяют изменения друг друга
+    :param sessions: фабрика сессий БД бенчмарка
+    :param size: размер БД (см. `SIZES`)
+    :param tweets: кол-во твитов в БД
+    :param spare_ids: id "свободных" пользователей (см. `seed`)
+    :param media_dir: папка для картинок, сохраняемых бенчмарком
+    """
+    users = size["users"]
+
+    def reader(i: int) -> int:
+        return i % users + 1
+
+    def spare(i: int) -> int:
+        return spare_ids[i]
+
+    def tweet_of(i: int) -> int:
+        return i % tweets + 1
+
+    def tweets_batch(i: int) -> list[int]:
+        return [(i * BULK_IDS + number) % tweets + 1 for number in range(BULK_IDS)]
+
+    def users_batch(i: int) -> list[int]:
+        return [(i * BULK_IDS + number) % users + 1 for number in range(BULK_IDS)]
+
+    created_tweets: dict[int, int] = {}
+    media_ids: dict[int, int] = {}
+    liked_tweets: list[tuple[int, int]] = []
+
+    async def new_tweet(i: int) -> dict:
+        async with sessions() as session:
+            result = await tweets_crud.create_tweet(
+                session=session,
+                new_tweet=TweetCreate(content="benchmark", tweet_media_ids=None),
+                user_id=reader(i),
+            )
+        created_tweets[i] = result["tweet_id"]
+        return {}
+
+    async def new_liked_tweet(i: int) -> tuple[int, int]:
+        await new_tweet(i)
+        async with sessions() as session:
+            await tweets_crud.create_like(
+                session=session, user_id=spare(i), tweet_id=created_tweets[i]
+            )
+        return created_tweets[i], reader(i)
+
+    async def liked_tweet_with_image(i: int) -> dict:
+        # твиты из `social_graph` с лайками (и у части - картинками без `file_id`);
+        # к каждому добавляется картинка из хранилища файлов
+        if not liked_tweets:
+            async with sessions() as session:
+                rows = await session.execute(
+                    select(TweetModel.id, TweetModel.author_id)
+                    .where(TweetModel.likes_count > 0)
+                    .order_by(TweetModel.id)
+                    .limit(len(spare_ids))
+                )
+                liked_tweets.extend(rows.all())
+        if i < len(liked_tweets):
+            tweet_id, author_id = liked_tweets[i]
+        else:
+            # в маленькой БД твитов с лайками меньше, чем вызовов: недостающие создаются
+            tweet_id, author_id = await new_liked_tweet(i)
+        upload = UploadFile(
+            file=io.BytesIO(f"liked image {i} ".encode() * 1024),
+            filename="bench.png",
+        )
+        async with sessions() as session:
+            await images_crud.save_image(
+                session=session, user_image=upload, tweet_id=tweet_id, user_id=author_id
+            )
+        return {"tweet_id": tweet_id, "author_id": author_id}
+
+    async def load_images(i: int) -> dict:
+        async with sessions() as session:
+            images = await session.scalars(
+                select(ImageModel).where(ImageModel.id == media_ids[i])
+            )
+            return {"images": list(images)}
+
+    async def write_file(i: int) -> dict:
+        filepath = os.path.join(media_dir, f"delete_{i}.png")
+        with open(filepath, "wb") as file:
+            file.write(b"benchmark")
+        return {"filepath": filepath}
+
+    async def clear_token_cache(i: int) -> dict:
+        check_user_token.token_cache.clear()
+        return {}
+
+    @check_user_token.token_required
+    async def endpoint(api_key: str, session, user_id: int | None = None):
+        return user_id
+
+    async def save_image(session, i):
+        upload = UploadFile(
+            file=io.BytesIO(f"image {i} ".encode() * 1024),
+            filename="bench.png",
+        )
+        result = await images_crud.save_image(
+            session=session,
+            user_image=upload,
+            tweet_id=created_tweets[i],
+            user_id=reader(i),
+        )
+        media_ids[i] = result["media_id"]
+
+    async def delete_liked_tweet(session, i, tweet_id, author_id):
+        await tweets_crud.delete_tweet(
+            session=session, user_id=author_id, tweet_id=tweet_id
+        )
+        # файлы удаляет фоновая задача после commit, её работа тоже входит в замер
+        await cleanup.delete_queued_files(session)
+
+    async def content_path(session, i):
+        images_crud.content_path(f"{i:064x}", "png")
+
+    return [
+        # tweets
+        Case(
+            "tweets.read_user_tweets_list",
+            lambda session, i: tweets_crud.read_user_tweets_list(session, reader(i)),
+        ),
+        Case(
+            "tweets.read_timeline_version",
+            lambda session, i: tweets_crud.read_timeline_version(session, reader(i)),
+        ),
+        Case(
+            "tweets.read_tweet_likes",
+            lambda session, i: tweets_crud.read_tweet_likes(session, tweet_of(i)),
+        ),
+        Case(
+            "tweets.create_tweet",
+            lambda session, i: tweets_crud.create_tweet(
+                session=session,
+                new_tweet=TweetCreate(content="benchmark", tweet_media_ids=None),
+                user_id=reader(i),
+            ),
+        ),
+        Case(
+            "tweets.delete_tweet",
+            lambda session, i: tweets_crud.delete_tweet(
+                session=session, user_id=reader(i), tweet_id=created_tweets[i]
+            ),
+            prepare=new_tweet,
+        ),
+        Case(
+            "tweets.create_like",
+            lambda session, i: tweets_crud.create_like(
+                session=session, user_id=spare(i), tweet_id=tweet_of(i)
+            ),
+        ),
+        Case(
+            "tweets.delete_like",
+            lambda session, i: tweets_crud.delete_like(
+                session=session, user_id=spare(i), tweet_id=tweet_of(i)
+            ),
+        ),
+        Case(
+            "tweets.create_likes",
+            lambda session, i: tweets_crud.create_likes(
+                session=session, user_id=spare(i), tweet_ids=tweets_batch(i)
+            ),
+        ),
+        # удаляет твиты из `social_graph`, поэтому идёт после функций, читающих их
+        Case(
+            "tweets.delete_tweet (likes, images)",
+            delete_liked_tweet,
+            prepare=liked_tweet_with_image,
+        ),
+        # users
+        Case(
+            "users.create_user",
+            lambda session, i: users_crud.create_user(
+                session=session,
+                new_user=UserCreate(
+                    name="benchmark", nickname=f"new{i}", email=f"new{i}@example.com"
+                ),
+                token=f"new{i}",
+            ),
+        ),
+        Case(
+            "users.read_user_profile",
+            lambda session, i: users_crud.read_user_profile(session, reader(i)),
+        ),
+        Case(
+            "users.read_profile_version",
+            lambda session, i: users_crud.read_profile_version(session, reader(i)),
+        ),
+        Case(
+            "users.read_user_followers",
+            lambda session, i: users_crud.read_user_followers(session, reader(i)),
+        ),
+        Case(
+            "users.read_user_following",
+            lambda session, i: users_crud.read_user_following(session, reader(i)),
+        ),
+        Case(
+            "users.create_user_follower",
+            lambda session, i: users_crud.create_user_follower(
+                session=session, main_user_id=reader(i), follower_id=spare(i)
+            ),
+        ),
+        Case(
+            "users.delete_user_follower",
+            lambda session, i: users_crud.delete_user_follower(
+                session=session, main_user_id=reader(i), follower_id=spare(i)
+            ),
+        ),
+        Case(
+            "users.create_user_followers",
+            lambda session, i: users_crud.create_user_followers(
+                session=session, user_ids=users_batch(i), follower_id=spare(i)
+            ),
+        ),
+        # images
+        Case("images.save_image", save_image, prepare=new_tweet),
+        Case(
+            "images.read_media",
+            lambda session, i: images_crud.read_media(session, media_ids[i], None),
+        ),
+        Case(
+            "images.release_images",
+            lambda session, i, images: images_crud.release_images(session, images),
+            prepare=load_images,
+        ),
+        Case("images.content_path", content_path),
+        Case(
+            "images.delete_img",
+            lambda session, i, filepath: images_crud.delete_img(filepath),
+            prepare=write_file,
+        ),
+        # token_required
+        Case(
+            "token_required (cache miss)",
+            lambda session, i: endpoint(api_key=f"bench{reader(i)}", session=session),
+            prepare=clear_token_cache,
+        ),
+        Case(
+            "token_required (cache hit)",
+            lambda session, i: endpoint(api_key="bench1", session=session),
+        ),
+    ]
+
+
+async def measure(
+    sessions: async_sessionmaker, case: Case, runs: int, warmup: int
+) -> dict:
+    """
+    Замер функции: `warmup` вызовов без учёта, потом `runs - warmup - 1` замеров
+    времени и кол-ва SQL-запросов, а последний вызов - под `tracemalloc` для пиковой
+    памяти (трассировка замедляет вызовы, поэтому время в нём не учитывается).
+    Каждый вызов получает новую сессию.
+    :param sessions: фабрика сессий БД бенчмарка
+    :param case: функция для замера
+    :param runs: общее кол-во вызовов
+    :param warmup: кол-во вызовов для прогрева (кэши подготовленных запросов и т.п.)
+    """
+    latencies, queries, repeats = [], [], []
+    peak_memory = 0
+    for i in range(runs):
+        kwargs = await case.prepare(i) if case.prepare is not None else {}
+        traced = i == runs - 1
+        async with sessions() as session:
+            query_log = QueryLog(("BENCH", case.name))
+            token = current_queries.set(query_log)
+            if traced:
+                tracemalloc.start()
+            started = perf_counter()
+            try:
+                await case.run(session, i, **kwargs)
+            finally:
+                elapsed = perf_counter() - started
+                if traced:
+                    peak_memory = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                current_queries.reset(token)
+        if warmup <= i < runs - 1:
+            latencies.append(elapsed)
+            queries.append(query_log.queries)
+            repeats.append(max(query_log.shapes.values(), default=0))
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(percentiles[49] * 1000, 3),
+        "p95_ms": round(percentiles[94] * 1000, 3),
+        "p99_ms": round(percentiles[98] * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "queries": max(queries),
+        "max_repeated_query": max(repeats),
+        "peak_memory_kib": round(peak_memory / 1024, 1),
+    }
+
+
+@contextmanager
+def media_path(path: str):
+    """
+    Временная замена `MEDIA_PATH` модулей картинок: файлы бенчмарка сохраняются
+    и удаляются только в папке `path`
+    :param path: папка для картинок бенчмарка
+    """
+    saved = images_crud.MEDIA_PATH, cleanup.MEDIA_PATH
+    images_crud.MEDIA_PATH = cleanup.MEDIA_PATH = path
+    try:
+        yield path
+    finally:
+        images_crud.MEDIA_PATH, cleanup.MEDIA_PATH = saved
+
+
+async def run_size(args: argparse.Namespace, name: str, size: dict) -> dict:
+    """
+    Заполнение схемы `bench_<name>` и замер всех функций на ней
+    :param args: аргументы командной строки
+    :param name: название размера
+    :param size: размер БД (см. `SIZES`)
+    """
+    schema = f"bench_{name}"
+    engine = create_async_engine(args.db_url)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {schema}"))
+    await engine.dispose()
+
+    engine = create_async_engine(
+        args.db_url,
+        connect_args={"server_settings": {"search_path": schema}},
+        json_deserializer=orjson.loads,
+    )
+    query_budget.instrument_engine(engine)
+    sessions = async_sessionmaker(
+        bind=engine, autoflush=False, autocommit=False, expire_on_commit=False
+    )
+    runs = args.warmup + args.repeat + 1
+
+    try:
+        with tempfile.TemporaryDirectory(
+            prefix="yblog-bench-", ignore_cleanup_errors=True
+        ) as media_dir, media_path(media_dir):
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            started = perf_counter()
+            tweets, spare_ids = await seed(
+                engine, size, spare_users=runs, rng_seed=args.seed
+            )
+            print(f"{name}: {size}, seeded in {perf_counter() - started:.1f}s")
+
+            results = {}
+            for case in build_cases(sessions, size, tweets, spare_ids, media_dir):
+                results[case.name] = await measure(sessions, case, runs, args.warmup)
+                print({"case": case.name, **results[case.name]})
+            return {"size": size, "results": results}
+    finally:
+        if not args.keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await engine.dispose()
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """
+    Сравнение результатов с сохранёнными: рост p50 или пиковой памяти больше чем
+    в `1 + threshold` раз (и больше `NOISE_FLOOR`), либо любой рост кол-ва
+    SQL-запросов - регрессия
+    :param baseline: сохранённые результаты
+    :param current: новые результаты
+    :param threshold: допустимый относительный рост
+    :return: описания регрессий
+    """
+    regressions = []
+    for name, size in current["sizes"].items():
+        old_size = baseline["sizes"].get(name)
+        if old_size is None or old_size["size"] != size["size"]:
+            print(f"{name}: no comparable baseline")
+            continue
+        for case, result in size["results"].items():
+            old = old_size["results"].get(case)
+            if old is None:
+                continue
+            print(
+                {
+                    "size": name,
+                    "case": case,
+                    "p50": f"{old['p50_ms']} -> {result['p50_ms']} ms",
+                    "queries": f"{old['queries']} -> {result['queries']}",
+                    "peak": f"{old['peak_memory_kib']} -> {result['peak_memory_kib']} KiB",
+                }
+            )
+            if result["queries"] > old["queries"]:
+                regressions.append(
+                    f"{name} {case}: {old['queries']} -> {result['queries']} queries"
+                )
+            for metric, noise in NOISE_FLOOR.items():
+                if result[metric] > max(
+                    old[metric] * (1 + threshold), old[metric] + noise
+                ):
+                    regressions.append(
+                        f"{name} {case}: {metric} {old[metric]} -> {result[metric]}"
+                    )
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> None:
+    # бенчмарк только считает запросы, бюджеты endpoint`ов к функциям не относятся
+    query_budget.QUERY_BUDGET_MODE = "log"
+    current = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "sizes": {},
+    }
+    for name in args.sizes:
+        size = {key: getattr(args, key) or value for key, value in SIZES[name].items()}
+        current["sizes"][name] = await run_size(args, name, size)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "wb") as file:
+            file.write(orjson.dumps(current, option=orjson.OPT_INDENT_2))
+
+    if args.compare:
+        with open(args.compare, "rb") as file:
+            regressions = compare(orjson.loads(file.read()), current, args.threshold)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", default=TEST_DB_PATH)
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=["small"])
+    parser.add_argument("--users", type=int, help="override users of every size")
+    parser.add_argument("--followers", type=int, help="override followers per user")
+    parser.add_argument("--tweets", type=int, help="override tweets per author")
+    parser.add_argument("--likes", type=int, help="override likes per tweet")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="save results to JSON baseline")
+    parser.add_argument("--compare", help="compare with JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--keep", action="store_true", help="keep seeded schemas")
+    asyncio.run(main(parser.parse_args()))
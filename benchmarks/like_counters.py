@@ -0,0 +1,124 @@
+"""
+Бенчмарк счётчиков лайков: много пользователей одновременно лайкают один твит.
+
+Сравнивает обычный режим (все лайки меняют одну строку `tweets`) с режимом
+шардированных счётчиков. Запуск (по умолчанию используется тестовая БД):
+
+    python -m benchmarks.like_counters --likes 2000 --concurrency 10 --shards 16
+"""
+
+import argparse
+import asyncio
+import statistics
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import delete, select
+
+from config import TEST_DB_PATH
+from models import Base, DBConnect, LikeModel, TweetModel, UserModel
+from Y_blog.tweets import counters, crud
+
+
+async def seed(db: DBConnect, likes: int) -> tuple[int, list[int]]:
+    """
+    Создание автора, одного твита и пользователей, которые будут его лайкать
+    :param db: подключение к БД
+    :param likes: кол-во пользователей (лайков)
+    :return: id твита и id пользователей
+    """
+    prefix = uuid4().hex[:8]
+    async with db.async_session() as session:
+        users = [
+            UserModel(
+                name="bench",
+                nickname=f"{prefix}{i}",
+                email=f"{prefix}{i}@bench.local",
+                token=f"{prefix}{i}",
+            )
+            for i in range(likes + 1)
+        ]
+        session.add_all(users)
+        await session.flush()
+        tweet = TweetModel(author_id=users[0].id, content="benchmark")
+        session.add(tweet)
+        await session.commit()
+        return tweet.id, [user.id for user in users]
+
+
+async def cleanup(db: DBConnect, tweet_id: int, user_ids: list[int]) -> None:
+    """Удаление созданных бенчмарком записей"""
+    async with db.async_session() as session:
+        await session.execute(delete(LikeModel).where(LikeModel.tweet_id == tweet_id))
+        await session.execute(delete(TweetModel).where(TweetModel.id == tweet_id))
+        await session.execute(delete(UserModel).where(UserModel.id.in_(user_ids)))
+        await session.commit()
+
+
+async def hammer(db: DBConnect, shards: int, likes: int, concurrency: int) -> dict:
+    """
+    Одновременные лайки одного твита
+    :param db: подключение к БД
+    :param shards: кол-во шардов счётчика (0 - обычный режим)
+    :param likes: общее кол-во лайков
+    :param concurrency: кол-во одновременных запросов
+    """
+    counters.LIKES_COUNTER_SHARDS = shards
+    tweet_id, user_ids = await seed(db, likes)
+    fans = asyncio.Queue()
+    for user_id in user_ids[1:]:
+        fans.put_nowait(user_id)
+    latencies = []
+
+    async def worker():
+        while not fans.empty():
+            user_id = fans.get_nowait()
+            async with db.async_session() as session:
+                started = perf_counter()
+                await crud.create_like(
+                    session=session, user_id=user_id, tweet_id=tweet_id
+                )
+                latencies.append(perf_counter() - started)
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - started
+
+    async with db.async_session() as session:
+        if shards > 0:
+            await counters.fold_like_counters(session)
+        likes_count = await session.scalar(
+            select(TweetModel.likes_count).where(TweetModel.id == tweet_id)
+        )
+
+    await cleanup(db, tweet_id, user_ids)
+    latencies.sort()
+    return {
+        "mode": f"sharded({shards})" if shards > 0 else "single-row",
+        "likes/s": round(likes / elapsed),
+        "p50, ms": round(statistics.median(latencies) * 1000, 2),
+        "p99, ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "likes_count": likes_count,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    db = DBConnect(url=args.db_url)
+    async with db.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    for shards in (0, args.shards):
+        result = await hammer(db, shards, args.likes, args.concurrency)
+        assert result["likes_count"] == args.likes, "Lost updates!"
+        print(result)
+
+    await db.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", default=TEST_DB_PATH)
+    parser.add_argument("--likes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--shards", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
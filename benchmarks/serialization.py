@@ -0,0 +1,96 @@
+"""
+Бенчмарк сериализации ленты: сколько времени уходит на превращение ответа в JSON.
+
+Сравнивает прежний путь (`response_model=dict` и стандартный `JSONResponse`) с
+типизированной схемой `TweetsPage` и `ORJSONResponse`. Данные строятся в памяти,
+БД не нужна. Запуск:
+
+    python -m benchmarks.serialization --likes 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import statistics
+from time import perf_counter
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from config import TIMELINE_LIKERS_LIMIT
+from Y_blog.tweets.schemas import TweetInList, TweetsPage
+
+
+def build_page(likes: int, likes_per_tweet: int) -> dict:
+    """
+    Страница ленты, как её возвращает `crud.read_user_tweets_list`
+    :param likes: общее кол-во лайков, встроенных в ленту
+    :param likes_per_tweet: кол-во лайкнувших у каждого твита
+    """
+    tweets = [
+        TweetInList(
+            id=tweet_id,
+            content=f"Tweet #{tweet_id} " * 5,
+            attachments=[f"/api/medias/{tweet_id}?kind=medium"],
+            attachments_info=[
+                {
+                    "url": f"/api/medias/{tweet_id}?kind=medium",
+                    "width": 1280,
+                    "height": 720,
+                    "size": 123_456,
+                    "mime_type": "image/webp",
+                }
+            ],
+            author={"id": tweet_id % 100, "name": f"author_{tweet_id % 100}"},
+            likes=[
+                {"user_id": user_id, "name": f"fan_{user_id}"}
+                for user_id in range(likes_per_tweet)
+            ],
+            likes_count=likes_per_tweet,
+        )
+        for tweet_id in range(max(likes // likes_per_tweet, 1))
+    ]
+    return {"result": True, "tweets": tweets, "next_cursor": "MTAwOjUw"}
+
+
+async def measure(page: dict, response_model, response_class, repeat: int) -> dict:
+    """
+    Время сериализации страницы так же, как это делает FastAPI
+    :param page: страница ленты
+    :param response_model: схема ответа endpoint`а
+    :param response_class: класс ответа
+    :param repeat: кол-во повторов
+    """
+    field = create_response_field(name="response", type_=response_model)
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        content = await serialize_response(field=field, response_content=page)
+        body = response_class(content).body
+        timings.append(perf_counter() - started)
+    return {
+        "median, ms": round(statistics.median(timings) * 1000, 2),
+        "min, ms": round(min(timings) * 1000, 2),
+        "bytes": len(body),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    modes = {
+        "dict + JSONResponse": (dict, JSONResponse),
+        "TweetsPage + JSONResponse": (TweetsPage, JSONResponse),
+        "TweetsPage + ORJSONResponse": (TweetsPage, ORJSONResponse),
+    }
+    for likes in args.likes:
+        page = build_page(likes, args.likes_per_tweet)
+        for mode, (response_model, response_class) in modes.items():
+            result = await measure(page, response_model, response_class, args.repeat)
+            print({"likes": likes, "mode": mode, **result})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--likes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--likes-per-tweet", type=int, default=TIMELINE_LIKERS_LIMIT)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
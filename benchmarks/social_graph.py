@@ -0,0 +1,437 @@
+"""
+Генератор синтетической социальной сети и её загрузка в БД.
+
+Генерирует пользователей, подписки со степенным распределением популярности (на
+немногих пользователей подписано очень много, на большинство - почти никто),
+твиты с суточным ритмом публикаций, лайки (популярные авторы получают больше
+лайков) и картинки твитов. Строки не накапливаются в памяти, а потоком загружаются
+в `users`, `followers`, `tweets`, `likes` и `images` через `COPY` (или пачками
+`INSERT` с `--method insert`), после чего счётчики, флаги `fanout_on_read` и
+материализованные ленты пересчитываются запросами на стороне БД (`rebuild_derived`).
+Одинаковые параметры и `--seed` дают одинаковые данные.
+
+Данные загружаются в пустые таблицы схемы `--schema` (создаётся вместе с таблицами,
+`--reset` - пересоздать). `api_key` пользователя с id N - `token<N>`. Запуск
+(по умолчанию используется тестовая БД):
+
+    python -m benchmarks.social_graph --users 100000 --follows 50 --tweets 20 --likes 10
+"""
+
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+from time import perf_counter
+from typing import Iterator
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from config import MEDIA_PATH, TEST_DB_PATH, TIMELINE_FANOUT_LIMIT
+from models import Base, FollowerModel, ImageModel, LikeModel, TweetModel, UserModel
+
+
+BATCH_SIZE = 50_000
+LOADED_TABLES = ("users", "followers", "tweets", "likes", "images")
+# Доля публикаций по часам суток: ночью мало, пики в обед и вечером
+# fmt: off
+HOUR_WEIGHTS = (
+    3, 2, 1, 1, 1, 1, 2, 4, 6, 7, 7, 8,  # 00:00 - 11:59
+    9, 9, 8, 7, 7, 8, 9, 10, 10, 9, 7, 5,  # 12:00 - 23:59
+)
+# fmt: on
+WORDS = (
+    "the a new today just my our this that what why how love hate great good bad "
+    "coffee code deploy release bug fix python postgres weekend news music game "
+    "photo travel city friends work meeting lunch dinner morning night rain sun "
+    "idea question answer thread update launch team blog read watch"
+).split()
+IMAGE_EXTENSIONS = ("jpg", "png", "jpeg", "gif")
+# Показатели степенных распределений: кол-ва подписок пользователя и активности автора
+FOLLOWS_SHAPE = 1.5
+ACTIVITY_SHAPE = 1.5
+
+
+class SocialGraph:
+    """
+    Детерминированный генератор данных социальной сети.
+    Каждая таблица генерируется своим генератором случайных чисел (от общего seed),
+    поэтому строки любой таблицы можно сгенерировать заново независимо от остальных.
+    """
+
+    def __init__(
+        self,
+        users: int,
+        follows: float = 20,
+        tweets: float = 10,
+        likes: float = 5,
+        images: float = 0.1,
+        days: int = 365,
+        alpha: float = 1.0,
+        seed: int = 42,
+        end: datetime = datetime(2025, 1, 1),
+    ):
+        """
+        :param users: кол-во пользователей
+        :param follows: среднее кол-во подписок пользователя (= подписчиков)
+        :param tweets: среднее кол-во твитов пользователя
+        :param likes: среднее кол-во лайков твита
+        :param images: доля твитов с картинками
+        :param days: за сколько дней до `end` публикуются твиты
+        :param alpha: показатель закона Ципфа для популярности пользователей
+            (вес пользователя с местом k в рейтинге - `1 / k ** alpha`)
+        :param seed: seed генераторов случайных чисел
+        :param end: время последнего твита
+        """
+        self.users = users
+        self.follows = follows
+        self.tweets = tweets
+        self.likes = likes
+        self.images = images
+        self.days = days
+        self.seed = seed
+        self.end = end
+
+        rng = self._rng("popularity")
+        ranks = list(range(1, users + 1))
+        rng.shuffle(ranks)
+        self._user_ids = range(1, users + 1)
+        popularity = [1 / rank**alpha for rank in ranks]
+        self._popularity_cum = list(accumulate(popularity))
+        # ожидаемая доля подписок, которые достанутся пользователю
+        self._follow_share = [
+            weight / self._popularity_cum[-1] for weight in popularity
+        ]
+        activity = [rng.paretovariate(ACTIVITY_SHAPE) for _ in range(users)]
+        self._activity_cum = list(accumulate(activity))
+
+    def _rng(self, table: str) -> random.Random:
+        return random.Random(f"{self.seed}:{table}")
+
+    def tables(self) -> Iterator[tuple[str, tuple[str, ...], Iterator[tuple]]]:
+        """Таблицы в порядке загрузки: `(название, столбцы, строки)`"""
+        yield UserModel.__tablename__, (
+            "id",
+            "name",
+            "nickname",
+            "email",
+            "token",
+        ), self.user_rows()
+        yield FollowerModel.__tablename__, (
+            "following_id",
+            "followers_id",
+        ), self.follower_rows()
+        yield TweetModel.__tablename__, (
+            "id",
+            "author_id",
+            "content",
+            "created_at",
+        ), self.tweet_rows()
+        yield LikeModel.__tablename__, ("user_id", "tweet_id"), self.like_rows()
+        yield ImageModel.__tablename__, (
+            "tweet_id",
+            "filename",
+            "filepath",
+        ), self.image_rows()
+
+    def user_rows(self) -> Iterator[tuple]:
+        for user_id in self._user_ids:
+            yield (
+                user_id,
+                f"User {user_id}",
+                f"u{user_id}",
+                f"u{user_id}@example.com",
+                f"token{user_id}",
+            )
+
+    def follower_rows(self) -> Iterator[tuple]:
+        """
+        Подписки: кол-во подписок пользователя - степенное распределение со средним
+        `follows`, а на кого подписаться, выбирается пропорционально популярности
+        """
+        rng = self._rng("followers")
+        scale = self.follows * (FOLLOWS_SHAPE - 1) / FOLLOWS_SHAPE
+        for follower_id in self._user_ids:
+            degree = min(
+                round(scale * rng.paretovariate(FOLLOWS_SHAPE)), self.users - 1
+            )
+            followed = set()
+            # повторы выбираются заново, но не бесконечно: у пользователей, которые
+            # подписаны почти на всех, подписок может получиться чуть меньше
+            for _ in range(4):
+                followed.update(
+                    rng.choices(
+                        self._user_ids,
+                        cum_weights=self._popularity_cum,
+                        k=degree - len(followed),
+                    )
+                )
+                followed.discard(follower_id)
+                if len(followed) >= degree:
+                    break
+            for following_id in followed:
+                yield following_id, follower_id
+
+    def _tweets(self) -> Iterator[tuple[int, int, datetime]]:
+        """
+        Твиты в порядке публикации: `(id, id автора, время)`.
+        Авторы выбираются пропорционально активности, время - с учётом `HOUR_WEIGHTS`
+        """
+        rng = self._rng("tweets")
+        total = round(self.users * self.tweets)
+        started = self.end - timedelta(days=self.days)
+        hours = range(24)
+        tweet_id = 0
+        for day in range(self.days):
+            count = total * (day + 1) // self.days - total * day // self.days
+            authors = rng.choices(
+                self._user_ids, cum_weights=self._activity_cum, k=count
+            )
+            seconds = sorted(
+                hour * 3600 + rng.randrange(3600)
+                for hour in rng.choices(hours, weights=HOUR_WEIGHTS, k=count)
+            )
+            day_started = started + timedelta(days=day)
+            for author_id, second in zip(authors, seconds):
+                tweet_id += 1
+                yield tweet_id, author_id, day_started + timedelta(seconds=second)
+
+    def tweet_rows(self) -> Iterator[tuple]:
+        rng = self._rng("content")
+        for tweet_id, author_id, created_at in self._tweets():
+            content = " ".join(rng.choices(WORDS, k=rng.randint(3, 40)))
+            yield tweet_id, author_id, content, created_at
+
+    def like_rows(self) -> Iterator[tuple]:
+        """
+        Лайки: кол-во лайков твита пропорционально ожидаемому кол-ву подписчиков
+        автора (со случайным разбросом), в среднем около `likes` на твит
+        """
+        rng = self._rng("likes")
+        per_follower = self.likes / max(self.follows, 1)
+        edges = self.users * self.follows
+        for tweet_id, author_id, _ in self._tweets():
+            followers = edges * self._follow_share[author_id - 1]
+            count = min(
+                round(followers * per_follower * rng.lognormvariate(-0.5, 1)),
+                self.users,
+            )
+            for user_id in rng.sample(self._user_ids, count):
+                yield user_id, tweet_id
+
+    def image_rows(self) -> Iterator[tuple]:
+        """
+        Картинки твитов (1-4 у доли `images` твитов). Записи без `file_id`,
+        как у картинок, загруженных до появления хранилища файлов
+        """
+        rng = self._rng("images")
+        for tweet_id, _, _ in self._tweets():
+            if rng.random() >= self.images:
+                continue
+            for number in range(rng.choices((1, 2, 3, 4), weights=(6, 2, 1, 1))[0]):
+                filename = f"{tweet_id}_{number}.{rng.choice(IMAGE_EXTENSIONS)}"
+                yield tweet_id, filename, f"{MEDIA_PATH}generated/{filename}"
+
+
+def rebuild_derived(timelines: bool = True) -> list[str]:
+    """
+    Запросы, пересчитывающие денормализованные данные после загрузки строк без ORM
+    (события моделей не срабатывают): последовательности id, счётчики подписок и
+    лайков, флаги `fanout_on_read` и материализованные ленты
+    :param timelines: заполнять ли `timelines` (строк в ней примерно
+        подписки x твиты автора, на больших графах это дольше всей загрузки)
+    """
+    statements = [
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+        f"coalesce(max(id), 0) + 1, false) FROM {table}"
+        for table in LOADED_TABLES
+    ]
+    statements += [
+        f"""
+        UPDATE users SET
+            followers_count = coalesce(followers.count, 0),
+            following_count = coalesce(following.count, 0),
+            fanout_on_read = coalesce(followers.count, 0) > {TIMELINE_FANOUT_LIMIT}
+        FROM users AS u
+        LEFT JOIN (
+            SELECT following_id, count(*) FROM followers GROUP BY following_id
+        ) AS followers ON followers.following_id = u.id
+        LEFT JOIN (
+            SELECT followers_id, count(*) FROM followers GROUP BY followers_id
+        ) AS following ON following.followers_id = u.id
+        WHERE users.id = u.id
+        """,
+        """
+        UPDATE tweets SET likes_count = counts.count
+        FROM (SELECT tweet_id, count(*) FROM likes GROUP BY tweet_id) AS counts
+        WHERE tweets.id = counts.tweet_id
+        """,
+    ]
+    if timelines:
+        statements.append(
+            """
+            INSERT INTO timelines (user_id, tweet_id)
+            SELECT followers.followers_id, tweets.id
+            FROM followers
+            JOIN tweets ON tweets.author_id = followers.following_id
+            JOIN users ON users.id = tweets.author_id
+            WHERE NOT users.fanout_on_read
+            """
+        )
+    return statements
+
+
+async def load(
+    engine: AsyncEngine,
+    graph: SocialGraph,
+    method: str = "copy",
+    timelines: bool = True,
+) -> dict[str, int]:
+    """
+    Загрузка сгенерированных строк в пустые таблицы одной транзакцией.
+    Как советует документация Postgres для массовой загрузки, на время загрузки
+    удаляются внешние ключи и неуникальные индексы таблиц: потом они создаются
+    заново за один проход вместо обновления на каждой строке
+    :param engine: движок БД
+    :param graph: генератор данных
+    :param method: `copy` - `COPY ... FROM STDIN`, `insert` - пачки многострочных `INSERT`
+    :param timelines: заполнять ли материализованные ленты (см. `rebuild_derived`)
+    :return: кол-во загруженных строк по таблицам
+    """
+    loaded = {}
+    async with engine.begin() as conn:
+        if await conn.scalar(text("SELECT EXISTS (SELECT 1 FROM users)")):
+            raise RuntimeError("Table `users` is not empty, load into an empty schema!")
+        await conn.execute(text("SET LOCAL synchronous_commit = off"))
+        await conn.execute(text("SET LOCAL maintenance_work_mem = '256MB'"))
+        restore = await _drop_constraints(conn, (*LOADED_TABLES, "timelines"))
+
+        for table, columns, rows in graph.tables():
+            loaded[table] = 0
+            while batch := list(islice(rows, BATCH_SIZE)):
+                if method == "copy":
+                    await _copy(conn, table, columns, batch)
+                else:
+                    await conn.execute(
+                        insert(Base.metadata.tables[table]),
+                        [dict(zip(columns, row)) for row in batch],
+                    )
+                loaded[table] += len(batch)
+
+        for statement in rebuild_derived(timelines):
+            await conn.execute(text(statement))
+        if timelines:
+            loaded["timelines"] = await conn.scalar(
+                text("SELECT count(*) FROM timelines")
+            )
+        for statement in restore:
+            await conn.execute(text(statement))
+        await conn.execute(text("ANALYZE"))
+    return loaded
+
+
+async def _drop_constraints(
+    conn: AsyncConnection, tables: tuple[str, ...]
+) -> list[str]:
+    """
+    Удаление внешних ключей и неуникальных индексов таблиц
+    :param conn: подключение к БД
+    :param tables: названия таблиц
+    :return: запросы, которые создают их заново
+    """
+    foreign_keys = (
+        await conn.execute(
+            text(
+                """
+                SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+                FROM pg_constraint
+                WHERE contype = 'f' AND conrelid::regclass::text = ANY(:tables)
+                """
+            ),
+            {"tables": list(tables)},
+        )
+    ).all()
+    indexes = (
+        await conn.execute(
+            text(
+                """
+                SELECT indexname, indexdef FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = ANY(:tables)
+                    AND indexdef NOT LIKE 'CREATE UNIQUE INDEX%'
+                """
+            ),
+            {"tables": list(tables)},
+        )
+    ).all()
+
+    for table, name, _ in foreign_keys:
+        await conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+    for name, _ in indexes:
+        await conn.execute(text(f'DROP INDEX "{name}"'))
+    return [definition for _, definition in indexes] + [
+        f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'
+        for table, name, definition in foreign_keys
+    ]
+
+
+async def _copy(
+    conn: AsyncConnection, table: str, columns: tuple[str, ...], rows: list[tuple]
+) -> None:
+    raw_connection = await conn.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        table, records=rows, columns=columns
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(args.db_url)
+    async with engine.begin() as conn:
+        if args.reset:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {args.schema}"))
+    await engine.dispose()
+
+    engine = create_async_engine(
+        args.db_url, connect_args={"server_settings": {"search_path": args.schema}}
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    graph = SocialGraph(
+        users=args.users,
+        follows=args.follows,
+        tweets=args.tweets,
+        likes=args.likes,
+        images=args.images,
+        days=args.days,
+        alpha=args.alpha,
+        seed=args.seed,
+    )
+    started = perf_counter()
+    loaded = await load(engine, graph, args.method, timelines=not args.no_timelines)
+    elapsed = perf_counter() - started
+    await engine.dispose()
+
+    rows = sum(loaded.values())
+    print(
+        {**loaded, "seconds": round(elapsed, 1), "rows/min": round(rows / elapsed * 60)}
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", default=TEST_DB_PATH)
+    parser.add_argument("--schema", default="social_graph")
+    parser.add_argument("--reset", action="store_true", help="recreate the schema")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--follows", type=float, default=20)
+    parser.add_argument("--tweets", type=float, default=10)
+    parser.add_argument("--likes", type=float, default=5)
+    parser.add_argument("--images", type=float, default=0.1)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--alpha", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--method", choices=("copy", "insert"), default="copy")
+    parser.add_argument("--no-timelines", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -1,26 +1,66 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 # import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
+import migrations
+from config import LIKES_COUNTER_SHARDS, settings_db
 from models import Base, y_blog_db
+from Y_blog.admission import AdmissionMiddleware
+from Y_blog.images import cleanup
+from Y_blog.images.derivatives import shutdown_process_pool
 from Y_blog.images.views import router as medias_router
+from Y_blog.metrics import MetricsMiddleware
+from Y_blog.query_budget import instrument_engine
+from Y_blog.service.views import metrics_router
+from Y_blog.service.views import router as service_router
+from Y_blog.tweets.counters import fold_like_counters_forever
 from Y_blog.tweets.views import router as tweets_router
+from Y_blog.upload_limit import UploadLimitMiddleware
 from Y_blog.users.views import router as users_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with y_blog_db.engine.begin() as conn:
-        # await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
+    if settings_db.db_schema_mode == "upgrade":
+        await migrations.upgrade(y_blog_db.engine)
+    elif settings_db.db_schema_mode == "create_all":
+        async with y_blog_db.engine.begin() as conn:
+            # await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+    else:
+        await migrations.check_schema_version(y_blog_db.engine)
+
+    background_tasks = [
+        asyncio.create_task(cleanup.delete_queued_files_forever(y_blog_db)),
+        asyncio.create_task(cleanup.sweep_media_forever(y_blog_db)),
+    ]
+    if LIKES_COUNTER_SHARDS > 0:
+        background_tasks.append(
+            asyncio.create_task(fold_like_counters_forever(y_blog_db))
+        )
     yield
+    for task in background_tasks:
+        task.cancel()
+    shutdown_process_pool()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(AdmissionMiddleware)
+# слишком большие загрузки отклоняются, не занимая место в очереди
+app.add_middleware(UploadLimitMiddleware)
+# снаружи контроля нагрузки: в метрики попадают и отклонённые запросы
+app.add_middleware(MetricsMiddleware)
 app.include_router(users_router)
 app.include_router(tweets_router)
 app.include_router(medias_router)
+app.include_router(service_router)
+app.include_router(metrics_router)
+
+for engine in (y_blog_db.engine, *y_blog_db.replica_engines):
+    instrument_engine(engine)
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,166 @@
+"""
+Модуль для версионных миграций схемы БД.
+
+Каждая миграция - модуль `versions/vNNNN_<название>.py`, где `NNNN` - номер версии.
+В модуле описываются:
+    * `statements` - последовательность SQL-запросов;
+    * `transactional` (по умолчанию True) - выполнять ли запросы в одной транзакции
+      вместе с записью номера версии. Для `CREATE INDEX CONCURRENTLY` указывается False.
+Докстринг модуля сохраняется как описание версии.
+
+Применённые версии хранятся в таблице `schema_version`. Запуск:
+
+    python -m migrations upgrade    # применить все новые миграции
+    python -m migrations current    # показать текущую версию схемы
+"""
+
+import importlib
+import pkgutil
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from . import versions
+
+
+SCHEMA_VERSION_TABLE = "schema_version"
+# Произвольный ключ `pg_advisory_lock`, чтобы миграции не запускались параллельно
+MIGRATIONS_LOCK_ID = 745_003_812
+
+
+class Migration:
+    """Класс для описания одной миграции"""
+
+    def __init__(self, module_name: str):
+        module = importlib.import_module(f"{versions.__name__}.{module_name}")
+        self.version = int(module_name[1:5])
+        self.name = module_name
+        self.description = (module.__doc__ or "").strip()
+        self.statements: tuple[str, ...] = tuple(module.statements)
+        self.transactional: bool = getattr(module, "transactional", True)
+
+    def __repr__(self) -> str:
+        return f"<Migration {self.name}>"
+
+
+def load_migrations() -> list[Migration]:
+    """Получение списка всех миграций, отсортированных по номеру версии"""
+    migrations = [
+        Migration(module.name)
+        for module in pkgutil.iter_modules(versions.__path__)
+        if module.name.startswith("v")
+    ]
+    return sorted(migrations, key=lambda migration: migration.version)
+
+
+MIGRATIONS = load_migrations()
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def read_schema_version(conn: AsyncConnection) -> int:
+    """
+    Получение текущей версии схемы (0, если миграции ещё не применялись)
+    :param conn: подключение к БД
+    """
+    try:
+        version = await conn.scalar(
+            text(f"SELECT max(version) FROM {SCHEMA_VERSION_TABLE}")
+        )
+    except ProgrammingError:
+        await conn.rollback()
+        return 0
+    return version or 0
+
+
+async def check_schema_version(engine: AsyncEngine) -> int:
+    """
+    Проверка, что схема БД не отстаёт от кода (один запрос при старте приложения)
+    :param engine: движок БД
+    :return: текущая версия схемы
+    """
+    async with engine.connect() as conn:
+        version = await read_schema_version(conn)
+
+    if version < LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema version is {version}, application requires "
+            f"{LATEST_VERSION}. Run `python -m migrations upgrade`."
+        )
+    return version
+
+
+async def upgrade(engine: AsyncEngine, target: int | None = None) -> list[Migration]:
+    """
+    Применение всех ещё не применённых миграций до версии `target` включительно
+    :param engine: движок БД
+    :param target: номер версии (по умолчанию - последняя)
+    :return: список применённых миграций
+    """
+    target = LATEST_VERSION if target is None else target
+    applied = []
+
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await lock_conn.execute(text(f"SELECT pg_advisory_lock({MIGRATIONS_LOCK_ID})"))
+        try:
+            await lock_conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+                    "version INTEGER PRIMARY KEY, "
+                    "description TEXT NOT NULL, "
+                    "applied_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL)"
+                )
+            )
+            current = await read_schema_version(lock_conn)
+
+            for migration in MIGRATIONS:
+                if current < migration.version <= target:
+                    await _apply(engine, lock_conn, migration)
+                    applied.append(migration)
+        finally:
+            await lock_conn.execute(
+                text(f"SELECT pg_advisory_unlock({MIGRATIONS_LOCK_ID})")
+            )
+
+    return applied
+
+
+async def _apply(
+    engine: AsyncEngine, autocommit_conn: AsyncConnection, migration: Migration
+) -> None:
+    """
+    Применение одной миграции
+    :param engine: движок БД
+    :param autocommit_conn: подключение в режиме AUTOCOMMIT для нетранзакционных миграций
+    :param migration: миграция
+    """
+    record_version = text(
+        f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description) "
+        "VALUES (:version, :description)"
+    ).bindparams(version=migration.version, description=migration.description)
+
+    if migration.transactional:
+        async with engine.begin() as conn:
+            for statement in migration.statements:
+                await conn.exec_driver_sql(statement)
+            await conn.execute(record_version)
+        return
+
+    for statement in migration.statements:
+        await autocommit_conn.exec_driver_sql(statement)
+
+    # Прерванный `CREATE INDEX CONCURRENTLY` оставляет невалидный индекс,
+    # который `IF NOT EXISTS` при повторном запуске молча пропустит
+    invalid = await autocommit_conn.scalars(
+        text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE NOT i.indisvalid AND c.relnamespace = current_schema()::regnamespace"
+        )
+    )
+    invalid = list(invalid)
+    if invalid:
+        raise RuntimeError(
+            f"{migration.name}: invalid indexes {invalid}, drop them and run again."
+        )
+    await autocommit_conn.execute(record_version)
@@ -0,0 +1,25 @@
+"""Запуск миграций из консоли: `python -m migrations upgrade|current`"""
+
+import argparse
+import asyncio
+
+from models.base import y_blog_db
+from . import LATEST_VERSION, read_schema_version, upgrade
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.command == "upgrade":
+        for migration in await upgrade(y_blog_db.engine, target=args.target):
+            print(f"Applied {migration.name}: {migration.description}")
+
+    async with y_blog_db.engine.connect() as conn:
+        version = await read_schema_version(conn)
+    print(f"Schema version: {version} (latest: {LATEST_VERSION})")
+    await y_blog_db.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("command", choices=("upgrade", "current"))
+    parser.add_argument("--target", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
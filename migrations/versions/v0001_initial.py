@@ -0,0 +1,46 @@
+"""Начальная схема: пользователи, твиты, картинки, лайки и подписки"""
+
+statements = (
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(30) NOT NULL,
+        nickname VARCHAR(15) NOT NULL UNIQUE,
+        email VARCHAR NOT NULL UNIQUE,
+        token VARCHAR NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tweets (
+        id SERIAL PRIMARY KEY,
+        author_id INTEGER NOT NULL REFERENCES users (id),
+        content TEXT NOT NULL,
+        likes_count INTEGER DEFAULT '0' NOT NULL,
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now() NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS images (
+        id SERIAL PRIMARY KEY,
+        filename VARCHAR NOT NULL,
+        filepath VARCHAR NOT NULL,
+        tweet_id INTEGER NOT NULL REFERENCES tweets (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS likes (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users (id),
+        tweet_id INTEGER NOT NULL REFERENCES tweets (id),
+        CONSTRAINT idx_user_tweet UNIQUE (user_id, tweet_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS followers (
+        id SERIAL PRIMARY KEY,
+        following_id INTEGER NOT NULL REFERENCES users (id),
+        followers_id INTEGER NOT NULL REFERENCES users (id),
+        CONSTRAINT idx_unique_following_followers UNIQUE (following_id, followers_id)
+    )
+    """,
+)
@@ -0,0 +1,23 @@
+"""Материализованные ленты пользователей (fan-out-on-write)"""
+
+statements = (
+    # Начиная с Postgres 11 добавление столбца с константным DEFAULT не переписывает таблицу
+    """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS fanout_on_read BOOLEAN DEFAULT false NOT NULL
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS timelines (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        tweet_id INTEGER NOT NULL REFERENCES tweets (id) ON DELETE CASCADE,
+        CONSTRAINT idx_unique_timeline_user_tweet UNIQUE (user_id, tweet_id)
+    )
+    """,
+    # Лента заполняется из уже существующих подписок
+    """
+    INSERT INTO timelines (user_id, tweet_id)
+    SELECT followers.followers_id, tweets.id
+    FROM followers JOIN tweets ON tweets.author_id = followers.following_id
+    ON CONFLICT (user_id, tweet_id) DO NOTHING
+    """,
+)
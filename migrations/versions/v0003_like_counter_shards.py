@@ -0,0 +1,13 @@
+"""Шардированные счётчики лайков"""
+
+statements = (
+    """
+    CREATE TABLE IF NOT EXISTS like_counter_shards (
+        id SERIAL PRIMARY KEY,
+        tweet_id INTEGER NOT NULL REFERENCES tweets (id) ON DELETE CASCADE,
+        shard INTEGER NOT NULL,
+        delta INTEGER DEFAULT '0' NOT NULL,
+        CONSTRAINT idx_unique_tweet_shard UNIQUE (tweet_id, shard)
+    )
+    """,
+)
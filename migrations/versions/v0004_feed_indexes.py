@@ -0,0 +1,25 @@
+"""Индексы для ленты, лайков и подписок"""
+
+# `CREATE INDEX CONCURRENTLY` не блокирует запись в таблицу, но не может
+# выполняться внутри транзакции
+transactional = False
+
+statements = (
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tweets_author_likes
+    ON tweets (author_id, likes_count DESC, id DESC)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_followers_followers_following
+    ON followers (followers_id, following_id)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_likes_tweet_id ON likes (tweet_id, id)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_images_tweet_id ON images (tweet_id)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_timelines_tweet_id ON timelines (tweet_id)
+    """,
+)
@@ -0,0 +1,16 @@
+"""Хранилище картинок, адресуемое по содержимому (sha256) со счётчиком ссылок"""
+
+statements = (
+    """
+    CREATE TABLE IF NOT EXISTS media_files (
+        id SERIAL PRIMARY KEY,
+        sha256 VARCHAR(64) NOT NULL UNIQUE,
+        filepath VARCHAR NOT NULL,
+        size INTEGER NOT NULL,
+        ref_count INTEGER DEFAULT '0' NOT NULL
+    )
+    """,
+    """
+    ALTER TABLE images ADD COLUMN IF NOT EXISTS file_id INTEGER REFERENCES media_files (id)
+    """,
+)
@@ -0,0 +1,17 @@
+"""Уменьшенные копии картинок, создаваемые фоновой обработкой"""
+
+statements = (
+    """
+    CREATE TABLE IF NOT EXISTS image_derivatives (
+        id SERIAL PRIMARY KEY,
+        file_id INTEGER NOT NULL REFERENCES media_files (id) ON DELETE CASCADE,
+        kind VARCHAR(32) NOT NULL,
+        filepath VARCHAR NOT NULL,
+        width INTEGER NOT NULL,
+        height INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mime_type VARCHAR(32) NOT NULL,
+        CONSTRAINT idx_unique_derivative_file_kind UNIQUE (file_id, kind)
+    )
+    """,
+)
@@ -0,0 +1,18 @@
+"""Версии подписок и контента пользователей для условных запросов (`ETag`)"""
+
+# `CREATE INDEX CONCURRENTLY` не может выполняться внутри транзакции,
+# остальные запросы идемпотентны
+transactional = False
+
+statements = (
+    """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS follow_version INTEGER DEFAULT '0' NOT NULL
+    """,
+    """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS content_version INTEGER DEFAULT '0' NOT NULL
+    """,
+    # по нему ищутся авторы твитов, когда готовы уменьшенные копии картинки
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_images_file_id ON images (file_id)
+    """,
+)
@@ -0,0 +1,20 @@
+"""Денормализованные счётчики подписчиков и подписок пользователей"""
+
+statements = (
+    """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS followers_count INTEGER DEFAULT '0' NOT NULL
+    """,
+    """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS following_count INTEGER DEFAULT '0' NOT NULL
+    """,
+    # Счётчики заполняются из уже существующих подписок
+    """
+    UPDATE users SET
+        followers_count = (
+            SELECT count(*) FROM followers WHERE followers.following_id = users.id
+        ),
+        following_count = (
+            SELECT count(*) FROM followers WHERE followers.followers_id = users.id
+        )
+    """,
+)
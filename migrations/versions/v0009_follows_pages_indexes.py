@@ -0,0 +1,16 @@
+"""Индексы для постраничных списков подписчиков и подписок"""
+
+# `CREATE INDEX CONCURRENTLY` не блокирует запись в таблицу, но не может
+# выполняться внутри транзакции
+transactional = False
+
+statements = (
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_followers_following_id
+    ON followers (following_id, id)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_followers_followers_id
+    ON followers (followers_id, id)
+    """,
+)
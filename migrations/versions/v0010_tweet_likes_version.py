@@ -0,0 +1,19 @@
+"""Версия лайков твита для `ETag` ленты вместо `content_version` автора"""
+
+# `CREATE INDEX CONCURRENTLY` не может выполняться внутри транзакции,
+# остальные запросы идемпотентны
+transactional = False
+
+statements = (
+    """
+    ALTER TABLE tweets ADD COLUMN IF NOT EXISTS likes_version INTEGER DEFAULT '0' NOT NULL
+    """,
+    # заменяет `idx_tweets_author_likes`: тот же порядок плюс `likes_version`
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tweets_author_likes_version
+    ON tweets (author_id, likes_count DESC, id DESC) INCLUDE (likes_version)
+    """,
+    """
+    DROP INDEX CONCURRENTLY IF EXISTS idx_tweets_author_likes
+    """,
+)
@@ -0,0 +1,27 @@
+"""Удаление лайков и картинок вместе с твитом (`ON DELETE CASCADE`)"""
+
+# Внешний ключ пересоздаётся без проверки строк (`NOT VALID`), а проверяется
+# отдельным запросом, который не блокирует запись: запросы нельзя объединять в
+# одну транзакцию. Каждый из них идемпотентен
+transactional = False
+
+statements = (
+    """
+    ALTER TABLE likes
+        DROP CONSTRAINT IF EXISTS likes_tweet_id_fkey,
+        ADD CONSTRAINT likes_tweet_id_fkey FOREIGN KEY (tweet_id)
+            REFERENCES tweets (id) ON DELETE CASCADE NOT VALID
+    """,
+    """
+    ALTER TABLE likes VALIDATE CONSTRAINT likes_tweet_id_fkey
+    """,
+    """
+    ALTER TABLE images
+        DROP CONSTRAINT IF EXISTS images_tweet_id_fkey,
+        ADD CONSTRAINT images_tweet_id_fkey FOREIGN KEY (tweet_id)
+            REFERENCES tweets (id) ON DELETE CASCADE NOT VALID
+    """,
+    """
+    ALTER TABLE images VALIDATE CONSTRAINT images_tweet_id_fkey
+    """,
+)
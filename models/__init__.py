@@ -7,6 +7,10 @@ __all__ = (
     "ImageModel",
     "FollowerModel",
     "LikeModel",
+    "TimelineModel",
+    "LikeCounterShardModel",
+    "MediaFileModel",
+    "ImageDerivativeModel",
 )
 
 from .base import Base, DBConnect, y_blog_db
@@ -15,3 +19,8 @@ from .user import UserModel
 from .media_img import ImageModel
 from .followers import FollowerModel
 from .likes import LikeModel
+from .timeline import TimelineModel
+from .like_counter import LikeCounterShardModel
+from .media_file import MediaFileModel
+from .image_derivative import ImageDerivativeModel
+from . import versions
@@ -1,15 +1,24 @@
 """Модуль для создания: базового класса для моделей БД, асинхронного подключения к БД"""
 
 from asyncio import current_task
+from itertools import cycle
+from math import ceil
+from time import time
 
+import orjson
+from fastapi import Request, Response
+from sqlalchemy import event
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
     create_async_engine,
     async_sessionmaker,
     async_scoped_session,
 )
 
-from config import settings_db
+from config import READ_YOUR_WRITES_COOKIE, settings_db
+from .pool import InstrumentedAsyncQueuePool
 
 
 class Base(DeclarativeBase):
@@ -25,18 +34,78 @@ class Base(DeclarativeBase):
 
 
 class DBConnect:
-    """Класс для создания асинхронного подключения к БД"""
+    """
+    Класс для создания асинхронного подключения к БД.
+    Если указаны `replica_urls`, читающие endpoint`ы получают сессию одной из реплик
+    (по очереди), кроме запросов пользователей, которые недавно что-то записали:
+    они `read_your_writes_window` секунд читают с основной БД, чтобы увидеть свои изменения
+    несмотря на отставание реплик.
+    Время последней записи хранится у клиента в cookie `READ_YOUR_WRITES_COOKIE`
+    (ставится только после успешного commit), поэтому чтение своих записей работает
+    при нескольких worker`ах и серверах приложения. Клиенты без поддержки cookie
+    читают с реплик сразу после записи.
+    """
 
-    def __init__(self, url: str, echo: bool = False):
-        self.engine = create_async_engine(
-            url=url,
+    def __init__(
+        self,
+        url: str,
+        echo: bool = False,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = -1,
+        pool_pre_ping: bool = False,
+        statement_cache_size: int = 100,
+        replica_urls: list[str] | None = None,
+        read_your_writes_window: float = 5,
+    ):
+        """
+        :param url: адрес БД
+        :param echo: логировать ли SQL-запросы
+        :param pool_size: кол-во постоянных подключений в пуле
+        :param max_overflow: кол-во временных подключений сверх `pool_size`
+        :param pool_timeout: сколько секунд ждать свободное подключение
+        :param pool_recycle: через сколько секунд переоткрывать подключение (-1 - никогда)
+        :param pool_pre_ping: проверять ли подключение перед выдачей из пула
+        :param statement_cache_size: размер кэша подготовленных запросов asyncpg
+        :param replica_urls: адреса реплик БД для чтения
+        :param read_your_writes_window: сколько секунд после записи читать с основной БД
+        """
+        engine_options = dict(
             echo=echo,
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+            connect_args={"prepared_statement_cache_size": statement_cache_size},
+            json_deserializer=orjson.loads,
         )
-        self.async_session = async_sessionmaker(
-            bind=self.engine,
+        self.engine = create_async_engine(url=url, **engine_options)
+        self.async_session = self._make_sessionmaker(self.engine)
+
+        self.replica_engines = [
+            create_async_engine(url=replica_url, **engine_options)
+            for replica_url in replica_urls or []
+        ]
+        self.replica_sessions = [
+            self._make_sessionmaker(engine, replica=True)
+            for engine in self.replica_engines
+        ]
+        self._next_replica = cycle(range(len(self.replica_sessions)))
+        self.read_your_writes_window = read_your_writes_window
+
+    @staticmethod
+    def _make_sessionmaker(
+        engine: AsyncEngine, replica: bool = False
+    ) -> async_sessionmaker[AsyncSession]:
+        return async_sessionmaker(
+            bind=engine,
             autoflush=False,
             autocommit=False,
             expire_on_commit=False,
+            info={"replica": replica},
         )
 
     def get_scoped_session(self):
@@ -46,11 +115,80 @@ class DBConnect:
         )
         return session
 
-    async def session_dependency(self):
-        """Метод для создания сессии для каждого запроса"""
+    def pool_stats(self) -> dict:
+        """Состояние пула подключений: занятые и свободные подключения, ожидание, переполнения"""
+        return self.engine.pool.status_dict()
+
+    def mark_write(self, response: Response) -> None:
+        """
+        Запоминание у клиента времени записи в основную БД (cookie)
+        :param response: ответ на изменяющий запрос
+        """
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            f"{time():.3f}",
+            max_age=ceil(self.read_your_writes_window),
+            path="/api",
+            httponly=True,
+            samesite="lax",
+        )
+
+    def wrote_recently(self, request: Request) -> bool:
+        """
+        Проверка, записывал ли клиент данные за последние `read_your_writes_window` секунд
+        :param request: запрос клиента
+        """
+        try:
+            wrote_at = float(request.cookies.get(READ_YOUR_WRITES_COOKIE, ""))
+        except ValueError:
+            return False
+        return time() - wrote_at < self.read_your_writes_window
+
+    async def session_dependency(self, request: Request, response: Response):
+        """
+        Метод для создания сессии основной БД для каждого запроса.
+        После успешного commit клиент получает cookie с временем записи (см. `mark_write`)
+        """
         session = self.get_scoped_session()
-        yield session
-        await session.remove()
+        sync_session = session().sync_session
 
+        def after_commit(_):
+            self.mark_write(response)
 
-y_blog_db = DBConnect(url=settings_db.db_url, echo=settings_db.db_echo)
+        event.listen(sync_session, "after_commit", after_commit)
+        try:
+            yield session
+        finally:
+            event.remove(sync_session, "after_commit", after_commit)
+            await session.remove()
+
+    async def read_session_dependency(self, request: Request):
+        """
+        Метод для создания сессии только для чтения: сессия реплики, если реплики заданы
+        и клиент ничего не записывал за последние `read_your_writes_window` секунд,
+        иначе - сессия основной БД
+        """
+        if not self.replica_sessions or self.wrote_recently(request):
+            session = self.get_scoped_session()
+            try:
+                yield session
+            finally:
+                await session.remove()
+            return
+
+        async with self.replica_sessions[next(self._next_replica)]() as session:
+            yield session
+
+
+y_blog_db = DBConnect(
+    url=settings_db.db_url,
+    echo=settings_db.db_echo,
+    pool_size=settings_db.db_pool_size,
+    max_overflow=settings_db.db_max_overflow,
+    pool_timeout=settings_db.db_pool_timeout,
+    pool_recycle=settings_db.db_pool_recycle,
+    pool_pre_ping=settings_db.db_pool_pre_ping,
+    statement_cache_size=settings_db.db_statement_cache_size,
+    replica_urls=settings_db.db_replica_urls,
+    read_your_writes_window=settings_db.db_read_your_writes_window,
+)
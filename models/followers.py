@@ -2,7 +2,7 @@
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, UniqueConstraint
+from sqlalchemy import ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -18,6 +18,9 @@ class FollowerModel(Base):
         UniqueConstraint(
             "following_id", "followers_id", name="idx_unique_following_followers"
         ),
+        Index("idx_followers_followers_following", "followers_id", "following_id"),
+        Index("idx_followers_following_id", "following_id", "id"),
+        Index("idx_followers_followers_id", "followers_id", "id"),
     )
 
     following_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
@@ -0,0 +1,36 @@
+"""Модуль для создания модели `ImageDerivative` в БД"""
+
+from typing import TYPE_CHECKING
+
+from sqlalchemy import ForeignKey, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from .base import Base
+
+
+if TYPE_CHECKING:
+    from .media_file import MediaFileModel
+
+
+class ImageDerivativeModel(Base):
+    """
+    Уменьшенная копия файла картинки (см. `IMAGE_DERIVATIVES`), которую
+    создаёт фоновая обработка после загрузки
+    """
+
+    __tablename__ = "image_derivatives"
+    __table_args__ = (
+        UniqueConstraint("file_id", "kind", name="idx_unique_derivative_file_kind"),
+    )
+
+    file_id: Mapped[int] = mapped_column(
+        ForeignKey("media_files.id", ondelete="CASCADE")
+    )
+    kind: Mapped[str] = mapped_column(String(32))
+    filepath: Mapped[str]
+    width: Mapped[int]
+    height: Mapped[int]
+    size: Mapped[int]
+    mime_type: Mapped[str] = mapped_column(String(32))
+
+    file: Mapped["MediaFileModel"] = relationship(back_populates="derivatives")
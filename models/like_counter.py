@@ -0,0 +1,23 @@
+"""Модуль для создания модели `LikeCounterShard` в БД"""
+
+from sqlalchemy import ForeignKey, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class LikeCounterShardModel(Base):
+    """
+    Шард счётчика лайков твита. В режиме шардированных счётчиков лайк меняет
+    случайный шард вместо строки твита, а накопленные `delta` периодически
+    переносятся в `tweets.likes_count`.
+    """
+
+    __tablename__ = "like_counter_shards"
+    __table_args__ = (
+        UniqueConstraint("tweet_id", "shard", name="idx_unique_tweet_shard"),
+    )
+
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"))
+    shard: Mapped[int]
+    delta: Mapped[int] = mapped_column(default=0, server_default="0")
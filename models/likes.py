@@ -2,7 +2,7 @@
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, UniqueConstraint
+from sqlalchemy import ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -21,10 +21,11 @@ class LikeModel(Base):
             "tweet_id",
             name="idx_user_tweet",
         ),
+        Index("idx_likes_tweet_id", "tweet_id", "id"),
     )
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
-    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"))
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"))
 
     user: Mapped["UserModel"] = relationship(back_populates="users_who_liked")
     tweet: Mapped["TweetModel"] = relationship(back_populates="all_likes")
@@ -0,0 +1,33 @@
+"""Модуль для создания модели `MediaFile` в БД"""
+
+from typing import TYPE_CHECKING
+
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from .base import Base
+
+
+if TYPE_CHECKING:
+    from .image_derivative import ImageDerivativeModel
+    from .media_img import ImageModel
+
+
+class MediaFileModel(Base):
+    """
+    Файл картинки в хранилище, адресуемом по содержимому: одинаковые загрузки
+    хранятся одним файлом `<sha256>.<расширение>`, а `ref_count` - кол-во
+    картинок твитов (`ImageModel`), которые на него ссылаются.
+    """
+
+    __tablename__ = "media_files"
+
+    sha256: Mapped[str] = mapped_column(String(64), unique=True)
+    filepath: Mapped[str]
+    size: Mapped[int]
+    ref_count: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    images: Mapped[list["ImageModel"]] = relationship(back_populates="file")
+    derivatives: Mapped[list["ImageDerivativeModel"]] = relationship(
+        back_populates="file"
+    )
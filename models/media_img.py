@@ -2,21 +2,28 @@
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
 
 
 if TYPE_CHECKING:
+    from .media_file import MediaFileModel
     from .tweet import TweetModel
 
 
 class ImageModel(Base):
     __tablename__ = "images"
+    __table_args__ = (
+        Index("idx_images_tweet_id", "tweet_id"),
+        Index("idx_images_file_id", "file_id"),
+    )
 
     filename: Mapped[str]
     filepath: Mapped[str]
-    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"))
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"))
+    file_id: Mapped[int | None] = mapped_column(ForeignKey("media_files.id"))
 
     tweet: Mapped["TweetModel"] = relationship(back_populates="images")
+    file: Mapped["MediaFileModel | None"] = relationship(back_populates="images")
@@ -0,0 +1,82 @@
+"""Модуль для создания пула подключений к БД со сбором статистики"""
+
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    """Накопительная статистика пула: ожидание подключений, переполнения, таймауты"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waiting = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "waiting": self.waiting,
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+            "wait_time_total": round(self.wait_time_total, 6),
+            "wait_time_avg": (
+                round(self.wait_time_total / self.checkouts, 6)
+                if self.checkouts
+                else 0.0
+            ),
+            "wait_time_max": round(self.wait_time_max, 6),
+        }
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул подключений, который считает время ожидания свободного подключения,
+    кол-во подключений сверх `pool_size` и таймауты ожидания.
+    Используются только публичные методы и события пула SQLAlchemy: ожидание
+    измеряется вокруг `connect()`, а переполнения считаются в событии `connect`
+    (новое DBAPI-подключение при `overflow() > 0` создано сверх `pool_size`)
+    """
+
+    def __init__(self, *args, max_overflow: int = 10, **kwargs):
+        super().__init__(*args, max_overflow=max_overflow, **kwargs)
+        self.max_overflow = max_overflow
+        self.stats = PoolStats()
+        event.listen(self, "connect", self._count_overflow)
+
+    def connect(self):
+        started = perf_counter()
+        self.stats.waiting += 1
+        try:
+            connection = super().connect()
+        except TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.waiting -= 1
+            wait_time = perf_counter() - started
+            self.stats.wait_time_total += wait_time
+            self.stats.wait_time_max = max(self.stats.wait_time_max, wait_time)
+
+        self.stats.checkouts += 1
+        return connection
+
+    def _count_overflow(self, dbapi_connection, connection_record) -> None:
+        if self.overflow() > 0:
+            self.stats.overflow_events += 1
+
+    def status_dict(self) -> dict:
+        """Текущее состояние пула и накопленная статистика"""
+        return {
+            "size": self.size(),
+            "max_overflow": self.max_overflow,
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            **self.stats.as_dict(),
+        }
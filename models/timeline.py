@@ -0,0 +1,162 @@
+"""
+Модуль для создания модели `Timeline` в БД - материализованной ленты пользователя.
+
+Строка `(user_id, tweet_id)` означает, что твит уже доставлен в ленту подписчика
+(fan-out-on-write). Твиты авторов с количеством подписчиков больше
+`TIMELINE_FANOUT_LIMIT` в ленты не раскладываются - автор помечается флагом
+`fanout_on_read`, и его твиты подтягиваются при чтении ленты.
+"""
+
+from sqlalchemy import (
+    CTE,
+    Delete,
+    ForeignKey,
+    Index,
+    Insert,
+    Update,
+    UniqueConstraint,
+    delete,
+    event,
+    func,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Mapped, mapped_column
+
+from config import TIMELINE_FANOUT_LIMIT
+from .base import Base
+from .followers import FollowerModel
+from .tweet import TweetModel
+from .user import UserModel
+
+
+class TimelineModel(Base):
+    __tablename__ = "timelines"
+    __table_args__ = (
+        UniqueConstraint("user_id", "tweet_id", name="idx_unique_timeline_user_tweet"),
+        Index("idx_timelines_tweet_id", "tweet_id"),
+    )
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"))
+
+
+def mark_fanout_on_read_query(author_id: int) -> Update:
+    """
+    Запрос, помечающий автора как `fanout_on_read`, если у него слишком много подписчиков
+    :param author_id: id автора
+    """
+    followers = (
+        select(FollowerModel.id)
+        .where(FollowerModel.following_id == author_id)
+        .limit(TIMELINE_FANOUT_LIMIT + 1)
+        .subquery()
+    )
+    return (
+        update(UserModel)
+        .where(
+            UserModel.id == author_id,
+            UserModel.fanout_on_read.is_(False),
+            select(func.count()).select_from(followers).scalar_subquery()
+            > TIMELINE_FANOUT_LIMIT,
+        )
+        .values(fanout_on_read=True)
+    )
+
+
+def push_tweet_query(tweet_id: int, author_id: int) -> Insert:
+    """
+    Запрос на доставку нового твита в ленты всех подписчиков автора
+    :param tweet_id: id твита
+    :param author_id: id автора
+    """
+    followers = (
+        select(FollowerModel.followers_id, literal(tweet_id))
+        .join(UserModel, UserModel.id == FollowerModel.following_id)
+        .where(
+            FollowerModel.following_id == author_id,
+            UserModel.fanout_on_read.is_(False),
+        )
+    )
+    return (
+        insert(TimelineModel)
+        .from_select(["user_id", "tweet_id"], followers)
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+    )
+
+
+def backfill_author_query(follower_id: int, author_id: int) -> Insert:
+    """
+    Запрос на доставку уже существующих твитов автора в ленту нового подписчика
+    :param follower_id: id подписчика
+    :param author_id: id автора
+    """
+    tweets = (
+        select(literal(follower_id), TweetModel.id)
+        .join(UserModel, UserModel.id == TweetModel.author_id)
+        .where(TweetModel.author_id == author_id, UserModel.fanout_on_read.is_(False))
+    )
+    return (
+        insert(TimelineModel)
+        .from_select(["user_id", "tweet_id"], tweets)
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+    )
+
+
+def backfill_new_follows_query(new_follows: CTE) -> Insert:
+    """
+    Запрос на доставку уже существующих твитов авторов в ленты новых подписчиков,
+    когда подписки добавлены одним запросом без ORM (события модели не срабатывают)
+    :param new_follows: CTE со столбцами `followers_id` и `following_id` новых подписок
+    """
+    tweets = (
+        select(new_follows.c.followers_id, TweetModel.id)
+        .join(TweetModel, TweetModel.author_id == new_follows.c.following_id)
+        .join(UserModel, UserModel.id == TweetModel.author_id)
+        .where(UserModel.fanout_on_read.is_(False))
+    )
+    return (
+        insert(TimelineModel)
+        .from_select(["user_id", "tweet_id"], tweets)
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+    )
+
+
+def remove_author_query(follower_id: int, author_id: int) -> Delete:
+    """
+    Запрос на удаление твитов автора из ленты бывшего подписчика
+    :param follower_id: id подписчика
+    :param author_id: id автора
+    """
+    return delete(TimelineModel).where(
+        TimelineModel.user_id == follower_id,
+        TimelineModel.tweet_id.in_(
+            select(TweetModel.id).where(TweetModel.author_id == author_id)
+        ),
+    )
+
+
+@event.listens_for(TweetModel, "after_insert")
+def _fan_out_tweet(mapper, connection, target: TweetModel):
+    connection.execute(mark_fanout_on_read_query(author_id=target.author_id))
+    connection.execute(push_tweet_query(tweet_id=target.id, author_id=target.author_id))
+
+
+@event.listens_for(FollowerModel, "after_insert")
+def _fan_out_follow(mapper, connection, target: FollowerModel):
+    connection.execute(
+        backfill_author_query(
+            follower_id=target.followers_id, author_id=target.following_id
+        )
+    )
+
+
+@event.listens_for(FollowerModel, "after_delete")
+def _fan_out_unfollow(mapper, connection, target: FollowerModel):
+    connection.execute(
+        remove_author_query(
+            follower_id=target.followers_id, author_id=target.following_id
+        )
+    )
@@ -3,7 +3,7 @@
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, Text, func
+from sqlalchemy import ForeignKey, Index, Text, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -20,14 +20,28 @@ class TweetModel(Base):
     author_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     content: Mapped[str] = mapped_column(Text)
     likes_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    likes_version: Mapped[int] = mapped_column(default=0, server_default="0")
     created_at: Mapped[datetime] = mapped_column(
         server_default=func.now(), default=datetime.now
     )
 
     user: Mapped["UserModel"] = relationship(back_populates="tweets")
+    # лайки и картинки удаляются вместе с твитом внешним ключом `ON DELETE CASCADE`:
+    # ORM не загружает их перед удалением твита
     images: Mapped[list["ImageModel"]] = relationship(
-        back_populates="tweet", cascade="all, delete"
+        back_populates="tweet", cascade="all, delete", passive_deletes=True
     )
     all_likes: Mapped[list["LikeModel"]] = relationship(
-        back_populates="tweet", cascade="all, delete"
+        back_populates="tweet", cascade="all, delete", passive_deletes=True
     )
+
+
+# `likes_version` включён в индекс, чтобы версия ленты суммировалась по нему без
+# чтения строк твитов. Индекс и так меняется с каждым лайком из-за `likes_count`
+Index(
+    "idx_tweets_author_likes_version",
+    TweetModel.author_id,
+    TweetModel.likes_count.desc(),
+    TweetModel.id.desc(),
+    postgresql_include=["likes_version"],
+)
@@ -2,7 +2,7 @@
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import String
+from sqlalchemy import String, false
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -21,6 +21,12 @@ class UserModel(Base):
     nickname: Mapped[str] = mapped_column(String(15), unique=True)
     email: Mapped[str] = mapped_column(unique=True)
     token: Mapped[str] = mapped_column(unique=True)
+    fanout_on_read: Mapped[bool] = mapped_column(default=False, server_default=false())
+    followers_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    following_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    # Версии для `ETag` профиля и ленты (см. `models/versions.py`)
+    follow_version: Mapped[int] = mapped_column(default=0, server_default="0")
+    content_version: Mapped[int] = mapped_column(default=0, server_default="0")
 
     tweets: Mapped[list["TweetModel"]] = relationship(back_populates="user")
     following_list: Mapped[list["FollowerModel"]] = relationship(
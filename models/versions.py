@@ -0,0 +1,107 @@
+"""
+Модуль для описания денормализованных счётчиков пользователя.
+
+`users.followers_count`/`users.following_count` - кол-во подписчиков и подписок,
+меняются в той же транзакции, что и строки `followers`.
+
+Версии данных пользователя, из которых строятся `ETag` ответов:
+`users.follow_version` увеличивается при любой подписке/отписке пользователя или на
+пользователя - от неё зависит профиль. `users.content_version` увеличивается при новом
+или удалённом твите автора и изменении картинок его твитов. Лайки меняют
+`tweets.likes_version` (см. `Y_blog/tweets/counters.py`), а не версию автора, чтобы
+лайки разных твитов популярного автора не ждали блокировку одной строки `users`.
+Версия ленты - `follow_version` пользователя, сумма `content_version` всех авторов,
+на которых он подписан, и сумма `likes_version` их твитов: версии только растут,
+поэтому любое изменение меняет версию (см. `Y_blog/conditional.py`).
+"""
+
+from sqlalchemy import (
+    CTE,
+    Integer,
+    ScalarSelect,
+    Select,
+    Update,
+    Values,
+    column,
+    event,
+    func,
+    select,
+    union,
+    update,
+    values,
+)
+
+from .followers import FollowerModel
+from .tweet import TweetModel
+from .user import UserModel
+
+
+def change_follow_counts_query(follows: Values | CTE, delta: int) -> Update:
+    """
+    Запрос на изменение `followers_count`/`following_count` и увеличение
+    `follow_version` пользователей, попавших в подписки `follows`.
+    Счётчики меняются выражением `count + n` под блокировкой строки, поэтому
+    одновременные подписки не теряют изменения
+    :param follows: подписки со столбцами `followers_id` и `following_id`
+    :param delta: на сколько изменить счётчики за каждую подписку (+1 или -1)
+    """
+
+    def count(column) -> ScalarSelect:
+        return (
+            select(func.count())
+            .select_from(follows)
+            .where(column == UserModel.id)
+            .scalar_subquery()
+        )
+
+    return (
+        update(UserModel)
+        .where(
+            UserModel.id.in_(
+                union(select(follows.c.followers_id), select(follows.c.following_id))
+            )
+        )
+        .values(
+            followers_count=UserModel.followers_count
+            + delta * count(follows.c.following_id),
+            following_count=UserModel.following_count
+            + delta * count(follows.c.followers_id),
+            follow_version=UserModel.follow_version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_content_version_query(author_ids: Select | list[int]) -> Update:
+    """
+    Запрос на увеличение `content_version` авторов
+    :param author_ids: id авторов или подзапрос с ними
+    """
+    return (
+        update(UserModel)
+        .where(UserModel.id.in_(author_ids))
+        .values(content_version=UserModel.content_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+@event.listens_for(TweetModel, "after_insert")
+@event.listens_for(TweetModel, "after_delete")
+def _bump_tweet_author(mapper, connection, target: TweetModel):
+    connection.execute(bump_content_version_query([target.author_id]))
+
+
+def _follow_values(target: FollowerModel) -> Values:
+    return values(
+        column("followers_id", Integer), column("following_id", Integer), name="follows"
+    ).data([(target.followers_id, target.following_id)])
+
+
+@event.listens_for(FollowerModel, "after_insert")
+def _count_follow(mapper, connection, target: FollowerModel):
+    connection.execute(change_follow_counts_query(_follow_values(target), delta=1))
+
+
+@event.listens_for(FollowerModel, "after_delete")
+def _count_unfollow(mapper, connection, target: FollowerModel):
+    connection.execute(change_follow_counts_query(_follow_values(target), delta=-1))
@@ -1,6 +1,7 @@
 import asyncio
 from typing import AsyncGenerator
 
+import pytest
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
 
@@ -8,10 +9,28 @@ from config import TEST_DB_PATH
 from main import app
 from models.base import Base, DBConnect, y_blog_db
 from models.user import UserModel
+from Y_blog import query_budget
+from Y_blog.query_budget import instrument_engine
 
 
 test_db = DBConnect(url=TEST_DB_PATH, echo=False)
 app.dependency_overrides[y_blog_db.session_dependency] = test_db.session_dependency
+app.dependency_overrides[y_blog_db.read_session_dependency] = (
+    test_db.read_session_dependency
+)
+instrument_engine(test_db.engine)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def raise_on_query_budget():
+    """
+    Превышение бюджета SQL-запросов и N+1 в любом endpoint`е роняют тест.
+    Режим читается из модуля при каждой проверке, поэтому не зависит от того,
+    когда был импортирован `config`
+    """
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(query_budget, "QUERY_BUDGET_MODE", "raise")
+        yield
 
 
 @pytest_asyncio.fixture(autouse=True, scope="session")
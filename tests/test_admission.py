@@ -0,0 +1,121 @@
+"""Модуль для тестов контроля нагрузки"""
+
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from Y_blog import admission
+from Y_blog.admission import READ_PRIORITY, WRITE_PRIORITY, AdmissionController
+
+
+FEED = ("GET", "/api/tweets/")
+NEW_TWEET = ("POST", "/api/tweets/")
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_admission_queue_and_shedding():
+    """Тест на очередь с ограничением длины и времени ожидания"""
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+    assert await controller.acquire(FEED, READ_PRIORITY)
+
+    assert not await controller.acquire(FEED, READ_PRIORITY)
+    assert controller.shed["timeout"] == 1
+
+    waiting = asyncio.create_task(controller.acquire(FEED, READ_PRIORITY))
+    await asyncio.sleep(0.01)
+    assert controller.queued == 1
+    assert not await controller.acquire(FEED, READ_PRIORITY)
+    assert controller.shed["queue_full"] == 1
+
+    controller.release(FEED)
+    assert await waiting
+    controller.release(FEED)
+    stats = controller.stats()
+    assert stats["in_flight"] == 0
+    assert stats["queued"] == {"write": 0, "read": 0}
+    assert stats["admitted"] == 2
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_admission_priorities_and_route_limits():
+    """Тест на приоритет изменяющих запросов и лимиты отдельных endpoint`ов"""
+    controller = AdmissionController(
+        max_concurrency=2, max_queue=10, queue_timeout=1, route_limits={FEED: 1}
+    )
+    assert await controller.acquire(FEED, READ_PRIORITY)
+    assert await controller.acquire(NEW_TWEET, WRITE_PRIORITY)
+
+    admitted = []
+
+    async def request(route, priority):
+        await controller.acquire(route, priority)
+        admitted.append(route)
+
+    tasks = [
+        asyncio.create_task(request(FEED, READ_PRIORITY)),
+        asyncio.create_task(request(NEW_TWEET, WRITE_PRIORITY)),
+    ]
+    await asyncio.sleep(0.01)
+    assert controller.stats()["queued"] == {"write": 1, "read": 1}
+
+    # освободившееся место достаётся записи, хотя чтение ждёт дольше
+    controller.release(NEW_TWEET)
+    await asyncio.sleep(0.01)
+    assert admitted == [NEW_TWEET]
+
+    # лимит ленты занят, поэтому место в общем лимите ей не достаётся
+    controller.release(NEW_TWEET)
+    await asyncio.sleep(0.01)
+    assert admitted == [NEW_TWEET]
+    assert controller.in_flight == 1
+
+    controller.release(FEED)
+    await asyncio.gather(*tasks)
+    assert admitted == [NEW_TWEET, FEED]
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_admission_middleware(ac: AsyncClient, monkeypatch):
+    """Тест на ответ `503` с `Retry-After`, когда очередь заполнена"""
+    controller = admission.admission_controller
+    monkeypatch.setattr(controller, "max_concurrency", 1)
+    monkeypatch.setattr(controller, "max_queue", 0)
+    shed = controller.shed["queue_full"]
+
+    assert await controller.acquire(FEED, READ_PRIORITY)
+    response = await ac.get("/api/tweets/?api_key=vvv")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    response = await ac.get("/api/service/admission")
+    assert response.status_code == 200
+    stats = response.json()["admission"]
+    assert stats["shed"]["queue_full"] == shed + 1
+    assert stats["routes"] == {"GET /api/tweets/": 1}
+
+    controller.release(FEED)
+    response = await ac.get("/api/users/100500")
+    assert response.status_code == 404
+    assert controller.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_admission_middleware_queue_timeout(ac: AsyncClient, monkeypatch):
+    """Тест на ответ `503`, когда запрос не дождался места в очереди"""
+    controller = admission.admission_controller
+    monkeypatch.setattr(controller, "max_concurrency", 1)
+    monkeypatch.setattr(controller, "max_queue", 1)
+    monkeypatch.setattr(controller, "queue_timeout", 0.05)
+    shed = controller.shed["timeout"]
+
+    assert await controller.acquire(FEED, READ_PRIORITY)
+    try:
+        response = await ac.get("/api/tweets/?api_key=vvv")
+    finally:
+        controller.release(FEED)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert controller.shed["timeout"] == shed + 1
+    assert controller.stats()["queued"] == {"write": 0, "read": 0}
+    assert controller.stats()["in_flight"] == 0
@@ -0,0 +1,476 @@
+"""Модуль для тестов endpoint`ов связанных с моделью `Image`"""
+
+import asyncio
+import hashlib
+import os
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from PIL import Image
+
+from .conftest import test_db
+from models.followers import FollowerModel
+from models.image_derivative import ImageDerivativeModel
+from models.likes import LikeModel
+from models.media_file import MediaFileModel
+from models.media_img import ImageModel
+from models.tweet import TweetModel
+from models.user import UserModel
+from Y_blog.check_user_token import token_cache
+from Y_blog.images import cleanup, crud, derivatives
+
+
+@pytest.fixture
+def media_path(tmp_path, monkeypatch):
+    monkeypatch.setattr("Y_blog.images.crud.MEDIA_PATH", str(tmp_path))
+    monkeypatch.setattr("Y_blog.images.cleanup.MEDIA_PATH", str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_save_image(ac: AsyncClient, user_for_tweets, media_path, monkeypatch):
+    """Тест на загрузку картинки кусками"""
+    monkeypatch.setattr("Y_blog.images.crud.UPLOAD_CHUNK_SIZE", 3)
+    async with test_db.async_session() as session:
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        session.add(test_tweet)
+        await session.commit()
+
+    response = await ac.post(
+        f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+        files={"image_file": ("../foo.png", b"0123456789", "image/png")},
+    )
+
+    assert response.status_code == 201
+    async with test_db.async_session() as session:
+        image = await session.get(ImageModel, response.json()["media_id"])
+    assert image.filename == "foo.png"
+    assert image.file_id is not None
+    assert os.path.dirname(image.filepath).startswith(str(media_path / "store"))
+    with open(image.filepath, "rb") as file:
+        assert file.read() == b"0123456789"
+    assert os.listdir(os.path.dirname(image.filepath)) == [
+        os.path.basename(image.filepath)
+    ]
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_save_too_large_image(
+    ac: AsyncClient, user_for_tweets, media_path, monkeypatch
+):
+    """Тест на прерывание загрузки слишком большой картинки"""
+    monkeypatch.setattr("Y_blog.images.crud.MAX_UPLOAD_SIZE", 5)
+    monkeypatch.setattr("Y_blog.images.crud.UPLOAD_CHUNK_SIZE", 2)
+    async with test_db.async_session() as session:
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        session.add(test_tweet)
+        await session.commit()
+
+    response = await ac.post(
+        f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+        files={"image_file": ("big.png", b"0123456789", "image/png")},
+    )
+
+    assert response.status_code == 413
+    assert not (media_path / "store").exists()
+
+    with pytest.raises(HTTPException) as error:
+        await crud._hash_upload(UploadFile(BytesIO(b"0123456789")))
+    assert error.value.status_code == 413
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_reject_too_large_upload_body(
+    ac: AsyncClient, user_for_tweets, media_path, monkeypatch
+):
+    """Тест на отклонение слишком большого тела загрузки до разбора формы"""
+    monkeypatch.setattr("Y_blog.upload_limit.MAX_UPLOAD_BODY_SIZE", 100)
+    url = f"/api/medias/?tweet_id=1&api_key={user_for_tweets.token}"
+    parsed_forms = []
+    monkeypatch.setattr(
+        "Y_blog.images.crud.save_image",
+        lambda **kwargs: parsed_forms.append(kwargs),
+    )
+
+    response = await ac.post(
+        url, files={"image_file": ("big.png", b"0" * 200, "image/png")}
+    )
+    assert response.status_code == 413
+    assert response.json() == {"detail": "The request body is larger than 100 bytes!"}
+
+    async def chunked_body():
+        yield (
+            b"--boundary\r\n"
+            b'Content-Disposition: form-data; name="image_file"; filename="big.png"'
+            b"\r\n\r\n"
+        )
+        for _ in range(10):
+            yield b"0" * 50
+
+    response = await ac.post(
+        url,
+        content=chunked_body(),
+        headers={"content-type": "multipart/form-data; boundary=boundary"},
+    )
+    assert response.status_code == 413
+    assert parsed_forms == []
+    assert not (media_path / "store").exists()
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_save_image_error(
+    ac: AsyncClient, user_for_tweets, media_path, monkeypatch
+):
+    """Тест на то, что ошибка при сохранении картинки не отдаётся как успешный ответ"""
+
+    def broken_query(user_ids):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr("Y_blog.images.crud.bump_content_version_query", broken_query)
+    async with test_db.async_session() as session:
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        session.add(test_tweet)
+        await session.commit()
+
+    with pytest.raises(RuntimeError):
+        await ac.post(
+            f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+            files={"image_file": ("foo.png", b"never saved", "image/png")},
+        )
+
+    sha256 = hashlib.sha256(b"never saved").hexdigest()
+    async with test_db.async_session() as session:
+        assert (
+            await session.scalar(
+                select(ImageModel).where(ImageModel.tweet_id == test_tweet.id)
+            )
+            is None
+        )
+        assert (
+            await session.scalar(
+                select(MediaFileModel).where(MediaFileModel.sha256 == sha256)
+            )
+            is None
+        )
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_deduplicated_images(ac: AsyncClient, user_for_tweets, media_path):
+    """Тест на хранение одинаковых картинок в одном файле и его удаление"""
+    async with test_db.async_session() as session:
+        test_tweets = [
+            TweetModel(author_id=user_for_tweets.id, content="FooBar") for _ in range(2)
+        ]
+        session.add_all(test_tweets)
+        await session.commit()
+
+    media_ids = []
+    for test_tweet, filename in zip(test_tweets, ("foo.png", "bar.png")):
+        response = await ac.post(
+            f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+            files={"image_file": (filename, b"same picture", "image/png")},
+        )
+        assert response.status_code == 201
+        media_ids.append(response.json()["media_id"])
+
+    async with test_db.async_session() as session:
+        images = [await session.get(ImageModel, media_id) for media_id in media_ids]
+        media_file = await session.get(MediaFileModel, images[0].file_id)
+    sha256 = hashlib.sha256(b"same picture").hexdigest()
+    assert images[0].file_id == images[1].file_id
+    assert images[0].filepath == images[1].filepath == media_file.filepath
+    assert media_file.sha256 == sha256
+    assert media_file.ref_count == 2
+    assert media_file.size == len(b"same picture")
+    assert media_file.filepath == str(
+        media_path / "store" / sha256[:2] / sha256[2:4] / f"{sha256}.png"
+    )
+
+    response = await ac.delete(
+        f"/api/tweets/{test_tweets[0].id}/?api_key={user_for_tweets.token}"
+    )
+    assert response.status_code == 200
+    async with test_db.async_session() as session:
+        media_file = await session.get(MediaFileModel, media_file.id)
+    assert media_file.ref_count == 1
+    assert os.path.exists(media_file.filepath)
+
+    response = await ac.delete(
+        f"/api/tweets/{test_tweets[1].id}/?api_key={user_for_tweets.token}"
+    )
+    assert response.status_code == 200
+    async with test_db.async_session() as session:
+        assert await session.get(MediaFileModel, media_file.id) is None
+    # файл удаляется фоновой задачей, а не во время запроса
+    assert os.path.exists(media_file.filepath)
+    async with test_db.async_session() as session:
+        assert await cleanup.delete_queued_files(session) == [media_file.filepath]
+    assert not os.path.exists(media_file.filepath)
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_delete_tweet_with_images_and_likes(
+    ac: AsyncClient, user_for_tweets, media_path
+):
+    """Тест на удаление твита с картинками и лайками в пределах бюджета SQL-запросов"""
+    async with test_db.async_session() as session:
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        test_fan = UserModel(
+            name="Gill", nickname="Emperor", email="Gi@capcom.com", token="gil"
+        )
+        session.add_all((test_tweet, test_fan))
+        await session.commit()
+
+    for content in (b"first picture", b"second picture"):
+        response = await ac.post(
+            f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+            files={"image_file": ("foo.png", content, "image/png")},
+        )
+        assert response.status_code == 201
+    for token in (user_for_tweets.token, test_fan.token):
+        await ac.post(f"/api/tweets/{test_tweet.id}/likes/?api_key={token}")
+
+    # самый длинный путь: `api_key` проверяется по БД, а не по кэшу
+    token_cache.clear()
+    response = await ac.delete(
+        f"/api/tweets/{test_tweet.id}/?api_key={user_for_tweets.token}"
+    )
+    assert response.status_code == 200
+    async with test_db.async_session() as session:
+        assert await session.get(TweetModel, test_tweet.id) is None
+        for model in (ImageModel, LikeModel):
+            query = select(model.id).where(model.tweet_id == test_tweet.id)
+            assert (await session.scalars(query)).all() == []
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_upload_while_file_is_deleted(
+    ac: AsyncClient, user_for_tweets, media_path
+):
+    """Тест на повторную загрузку картинки, файл которой как раз удаляется"""
+    async with test_db.async_session() as session:
+        test_tweets = [
+            TweetModel(author_id=user_for_tweets.id, content="FooBar") for _ in range(2)
+        ]
+        session.add_all(test_tweets)
+        await session.commit()
+
+    def upload(test_tweet):
+        return ac.post(
+            f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+            files={"image_file": ("foo.png", b"deleted picture", "image/png")},
+        )
+
+    assert (await upload(test_tweets[0])).status_code == 201
+    await ac.delete(f"/api/tweets/{test_tweets[0].id}/?api_key={user_for_tweets.token}")
+    filepath = crud.content_path(hashlib.sha256(b"deleted picture").hexdigest(), "png")
+
+    # удаление файла уже проверило ссылки на него, но ещё не удалило его с диска
+    async with test_db.async_session() as gc_session:
+        await gc_session.execute(select(crud.file_lock(filepath)))
+        uploading = asyncio.create_task(upload(test_tweets[1]))
+        await asyncio.sleep(0.1)
+        assert not uploading.done()
+        await crud.delete_img(filepath)
+        await gc_session.commit()
+
+    response = await uploading
+    assert response.status_code == 201
+    with open(filepath, "rb") as file:
+        assert file.read() == b"deleted picture"
+    async with test_db.async_session() as session:
+        assert await cleanup.delete_unreferenced(session, [filepath]) == []
+    assert os.path.exists(filepath)
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_image_derivatives(ac: AsyncClient, user_for_tweets, media_path):
+    """Тест на создание уменьшенных копий картинки и их выдачу в ленте"""
+    async with test_db.async_session() as session:
+        test_follower = UserModel(
+            name="Rose", nickname="Soul", email="Rose@capcom.com", token="rose"
+        )
+        session.add(test_follower)
+        await session.commit()
+        session.add(
+            FollowerModel(
+                following_id=user_for_tweets.id, followers_id=test_follower.id
+            )
+        )
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        session.add(test_tweet)
+        await session.commit()
+
+    picture = BytesIO()
+    Image.new("RGBA", (2000, 1000), "red").save(picture, "PNG")
+    response = await ac.post(
+        f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+        files={"image_file": ("big.png", picture.getvalue(), "image/png")},
+    )
+    assert response.status_code == 201
+
+    async with test_db.async_session() as session:
+        image = await session.get(ImageModel, response.json()["media_id"])
+        derivatives = {
+            derivative.kind: derivative
+            for derivative in await session.scalars(
+                select(ImageDerivativeModel).where(
+                    ImageDerivativeModel.file_id == image.file_id
+                )
+            )
+        }
+    assert set(derivatives) == {"small", "medium", "medium_jpeg"}
+    assert (derivatives["small"].width, derivatives["small"].height) == (320, 160)
+    assert derivatives["medium"].mime_type == "image/webp"
+    assert derivatives["medium_jpeg"].mime_type == "image/jpeg"
+    for derivative in derivatives.values():
+        assert os.path.getsize(derivative.filepath) == derivative.size
+        with Image.open(derivative.filepath) as rendered:
+            assert rendered.size == (derivative.width, derivative.height)
+
+    response = await ac.get(f"/api/tweets/?api_key={test_follower.token}")
+    tweets = {tweet["id"]: tweet for tweet in response.json()["tweets"]}
+    tweet = tweets[test_tweet.id]
+    assert tweet["attachments"] == [f"/api/medias/{image.id}?kind=medium"]
+    assert tweet["attachments_info"][0]["width"] == 1280
+    assert tweet["attachments_info"][0]["height"] == 640
+
+    await ac.delete(f"/api/tweets/{test_tweet.id}/?api_key={user_for_tweets.token}")
+    async with test_db.async_session() as session:
+        await cleanup.delete_queued_files(session)
+    for derivative in derivatives.values():
+        assert not os.path.exists(derivative.filepath)
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_derivatives_of_deleted_file(media_path):
+    """Тест на то, что копии не создаются для файла, удалённого во время ожидания блокировки"""
+    picture = BytesIO()
+    Image.new("RGB", (400, 200), "red").save(picture, "PNG")
+    sha256 = hashlib.sha256(picture.getvalue()).hexdigest()
+    filepath = crud.content_path(sha256, "png")
+    os.makedirs(os.path.dirname(filepath))
+    with open(filepath, "wb") as file:
+        file.write(picture.getvalue())
+
+    async with test_db.async_session() as session:
+        media_file = MediaFileModel(
+            sha256=sha256, filepath=filepath, size=len(picture.getvalue())
+        )
+        session.add(media_file)
+        await session.commit()
+
+        # как `cleanup.delete_unreferenced`: файл заблокирован, пока его удаляют
+        await session.execute(select(crud.file_lock(filepath)))
+        task = asyncio.create_task(
+            derivatives.create_derivatives(test_db.engine, media_file.id)
+        )
+        await asyncio.sleep(0.2)
+        assert not task.done()
+        await session.delete(media_file)
+        await session.commit()
+
+    await task
+    assert os.listdir(os.path.dirname(filepath)) == [os.path.basename(filepath)]
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_get_media(ac: AsyncClient, user_for_tweets, media_path, monkeypatch):
+    """Тест на отдачу картинки: кэширование, условные запросы и диапазоны байт"""
+    async with test_db.async_session() as session:
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        session.add(test_tweet)
+        await session.commit()
+    response = await ac.post(
+        f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+        files={"image_file": ("foo.png", b"0123456789abcdef", "image/png")},
+    )
+    media_id = response.json()["media_id"]
+    sha256 = hashlib.sha256(b"0123456789abcdef").hexdigest()
+
+    response = await ac.get(f"/api/medias/{media_id}")
+    assert response.status_code == 200
+    assert response.content == b"0123456789abcdef"
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{sha256}"'
+    assert "immutable" in response.headers["cache-control"]
+    last_modified = response.headers["last-modified"]
+
+    response = await ac.get(
+        f"/api/medias/{media_id}", headers={"If-None-Match": f'"{sha256}"'}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    response = await ac.get(
+        f"/api/medias/{media_id}", headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+
+    response = await ac.get(f"/api/medias/{media_id}", headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206
+    assert response.content == b"2345"
+    assert response.headers["content-range"] == "bytes 2-5/16"
+    response = await ac.get(f"/api/medias/{media_id}", headers={"Range": "bytes=-3"})
+    assert response.content == b"def"
+    response = await ac.get(
+        f"/api/medias/{media_id}", headers={"Range": "bytes=2-5", "If-Range": '"old"'}
+    )
+    assert response.status_code == 200
+    response = await ac.get(f"/api/medias/{media_id}", headers={"Range": "bytes=20-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */16"
+
+    response = await ac.get(f"/api/medias/{media_id}?kind=huge")
+    assert response.status_code == 404
+    response = await ac.get("/api/medias/0")
+    assert response.status_code == 404
+
+    monkeypatch.setattr("Y_blog.images.responses.MEDIA_PATH", str(media_path))
+    monkeypatch.setattr(
+        "Y_blog.images.responses.MEDIA_ACCEL_REDIRECT_PREFIX", "/protected_media/"
+    )
+    response = await ac.get(f"/api/medias/{media_id}")
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["x-accel-redirect"] == (
+        f"/protected_media/store/{sha256[:2]}/{sha256[2:4]}/{sha256}.png"
+    )
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_sweep_media(ac: AsyncClient, user_for_tweets, media_path):
+    """Тест на удаление осиротевших файлов и сохранение используемых"""
+    async with test_db.async_session() as session:
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        session.add(test_tweet)
+        await session.commit()
+    response = await ac.post(
+        f"/api/medias/?tweet_id={test_tweet.id}&api_key={user_for_tweets.token}",
+        files={"image_file": ("foo.png", b"still in use", "image/png")},
+    )
+    async with test_db.async_session() as session:
+        image = await session.get(ImageModel, response.json()["media_id"])
+
+    orphan = media_path / "store" / "orphan.png"
+    orphan.write_bytes(b"orphan")
+    interrupted = media_path / "store" / "interrupted.png.0a1b.part"
+    interrupted.write_bytes(b"interrupted")
+    fresh = media_path / "store" / "uploading.png.2c3d.part"
+    fresh.write_bytes(b"uploading")
+    for old_file in (orphan, interrupted, image.filepath):
+        os.utime(old_file, (0, 0))
+
+    async with test_db.async_session() as session:
+        swept = await cleanup.sweep_media(session, grace_period=60)
+        assert sorted(swept) == sorted([str(orphan), str(interrupted)])
+    assert os.path.exists(image.filepath)
+    assert fresh.exists()
+
+    cleanup.schedule_deletion([image.filepath])
+    async with test_db.async_session() as session:
+        assert await cleanup.delete_queued_files(session) == []
+    assert os.path.exists(image.filepath)
@@ -0,0 +1,82 @@
+"""Модуль для тестов миграций схемы БД"""
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import migrations
+from config import TEST_DB_PATH
+from models.base import Base
+from .conftest import test_db
+
+
+def describe_schema(conn) -> dict:
+    """Описание таблиц схемы: столбцы, индексы, уникальные и внешние ключи"""
+    inspector = inspect(conn)
+    return {
+        table: {
+            "columns": sorted(
+                (column["name"], str(column["type"]), column["nullable"])
+                for column in inspector.get_columns(table)
+            ),
+            "indexes": sorted(
+                (index["name"], tuple(index["column_names"]))
+                for index in inspector.get_indexes(table)
+            ),
+            "unique": sorted(
+                tuple(constraint["column_names"])
+                for constraint in inspector.get_unique_constraints(table)
+            ),
+            "foreign_keys": sorted(
+                (
+                    tuple(key["constrained_columns"]),
+                    key["referred_table"],
+                    key["options"].get("ondelete"),
+                )
+                for key in inspector.get_foreign_keys(table)
+            ),
+        }
+        for table in inspector.get_table_names()
+        if table != migrations.SCHEMA_VERSION_TABLE
+    }
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_migrations_match_models():
+    """Тест на совпадение схемы после всех миграций со схемой моделей"""
+    async with test_db.engine.begin() as conn:
+        await conn.execute(text("DROP SCHEMA IF EXISTS migration_check CASCADE"))
+        await conn.execute(text("CREATE SCHEMA migration_check"))
+
+    engine = create_async_engine(
+        TEST_DB_PATH,
+        connect_args={"server_settings": {"search_path": "migration_check"}},
+    )
+    try:
+        with pytest.raises(RuntimeError):
+            await migrations.check_schema_version(engine)
+
+        applied = await migrations.upgrade(engine)
+        assert [migration.version for migration in applied] == [
+            migration.version for migration in migrations.MIGRATIONS
+        ]
+        assert await migrations.upgrade(engine) == []
+        assert (
+            await migrations.check_schema_version(engine) == migrations.LATEST_VERSION
+        )
+
+        async with engine.connect() as conn:
+            migrated = await conn.run_sync(describe_schema)
+        async with test_db.engine.connect() as conn:
+            expected = await conn.run_sync(describe_schema)
+            expected = {
+                table: description
+                for table, description in expected.items()
+                if table in Base.metadata.tables
+            }
+
+        assert migrated == expected
+    finally:
+        await engine.dispose()
+        async with test_db.engine.begin() as conn:
+            await conn.execute(text("DROP SCHEMA migration_check CASCADE"))
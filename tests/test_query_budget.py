@@ -0,0 +1,66 @@
+"""Модуль для тестов бюджета SQL-запросов endpoint`ов"""
+
+import logging
+
+import pytest
+from fastapi.routing import APIRoute
+from httpx import AsyncClient
+
+from config import QUERY_BUDGETS
+from main import app
+from Y_blog import query_budget
+from Y_blog.query_budget import QueryBudgetExceeded, QueryLog, statement_shape
+
+
+def test_every_endpoint_has_budget():
+    """Тест на наличие бюджета SQL-запросов у каждого endpoint`а"""
+    missing = [
+        f"{method} {route.path}"
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        for method in route.methods
+        if (method, route.path) not in QUERY_BUDGETS
+    ]
+    assert not missing, f"Add QUERY_BUDGETS for: {missing}"
+
+
+def test_statement_shape():
+    """Тест на приведение запросов с разным кол-вом параметров к одному виду"""
+    assert statement_shape(
+        "SELECT users.id\nFROM users WHERE users.id IN ($1, $2,  $3)"
+    ) == statement_shape("SELECT users.id FROM users WHERE users.id IN ($1)")
+
+
+def test_query_budget_and_n_plus_one():
+    """Тест на превышение бюджета и повторяющиеся запросы (N+1)"""
+    query_log = QueryLog(("GET", "/api/users/{id}/followers/"))
+    query_log.record("SELECT 1", 0.001)
+    query_log.record("SELECT 2", 0.001)
+    with pytest.raises(QueryBudgetExceeded, match="budget is 2"):
+        query_log.record("SELECT 3", 0.001)
+
+    query_log = QueryLog(("DELETE", "/api/tweets/{tweet_id}/"))
+    with pytest.raises(QueryBudgetExceeded, match="N\\+1"):
+        for image_id in range(query_budget.N_PLUS_ONE_THRESHOLD):
+            query_log.record(f"SELECT images.id FROM images WHERE id = ${image_id}", 0)
+
+
+def test_query_budget_log_mode(monkeypatch, caplog):
+    """Тест на запись нарушений бюджета в лог вместо исключения"""
+    monkeypatch.setattr(query_budget, "QUERY_BUDGET_MODE", "log")
+    query_log = QueryLog(("GET", "/metrics"))
+    query_log.record("SELECT 1", 0.001)
+
+    with caplog.at_level(logging.WARNING, logger=query_budget.__name__):
+        query_log.finish()
+        query_log.finish()
+    assert len(caplog.records) == 1
+    assert "budget is 0" in caplog.records[0].getMessage()
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_query_budget_in_endpoint(ac: AsyncClient, monkeypatch):
+    """Тест на прерывание запроса endpoint`а, превысившего бюджет"""
+    monkeypatch.setitem(QUERY_BUDGETS, ("GET", "/api/users/{id}"), 1)
+    with pytest.raises(QueryBudgetExceeded):
+        await ac.get("/api/users/100500")
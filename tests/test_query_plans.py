@@ -0,0 +1,207 @@
+"""
+Модуль для проверки планов горячих запросов.
+
+Тест вызывает endpoint`ы, запоминает все выполненные ими SQL-запросы и выводит
+`EXPLAIN` каждого (видно с `pytest -s`). При `enable_seqscan = off` Postgres выбирает
+последовательное чтение таблицы только тогда, когда подходящего индекса нет,
+поэтому `Seq Scan` в плане означает, что запросу не хватает индекса. Вместо него
+Postgres может прочитать целиком чужой индекс, поэтому индексное чтение без условия
+на первый столбец индекса тоже считается ошибкой.
+"""
+
+import json
+import re
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from .conftest import test_db
+from models.followers import FollowerModel
+from models.tweet import TweetModel
+from models.user import UserModel
+from Y_blog.check_user_token import token_cache
+from Y_blog.tweets.crud import read_timeline_version
+
+
+async def explain(statement: str, parameters) -> tuple[str, list[str]]:
+    """
+    Получение плана запроса с запретом последовательного чтения таблиц
+    :param statement: SQL-запрос
+    :param parameters: параметры запроса
+    :return: текст плана и список найденных в нём полных чтений таблиц/индексов
+    """
+    async with test_db.engine.connect() as conn:
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        plan = "\n".join(row[0] for row in result)
+        result = await conn.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters
+        )
+        json_plan = result.scalar()
+        result = await conn.exec_driver_sql(
+            "SELECT i.indexrelid::regclass::text, a.attname FROM pg_index i "
+            "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]"
+        )
+        leading_columns = dict(result.all())
+        await conn.rollback()
+
+    if isinstance(json_plan, str):
+        json_plan = json.loads(json_plan)
+    return plan, list(full_scans(json_plan[0]["Plan"], leading_columns))
+
+
+def full_scans(node: dict, leading_columns: dict[str, str]):
+    """
+    Поиск в плане чтений без подходящего индекса
+    :param node: узел плана в формате JSON
+    :param leading_columns: словарь `имя индекса -> первый столбец индекса`
+    """
+    if node["Node Type"] == "Seq Scan":
+        yield f"Seq Scan on {node['Relation Name']}"
+    elif "Index Name" in node:
+        column = leading_columns.get(node["Index Name"])
+        condition = node.get("Index Cond", "")
+        if column and not re.search(rf"\b{column}\b", condition):
+            yield f"Full scan of {node['Index Name']} ({condition or 'no condition'})"
+
+    for child in node.get("Plans", []):
+        yield from full_scans(child, leading_columns)
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_hot_queries_use_indexes(ac: AsyncClient):
+    """Тест на отсутствие `Seq Scan` в планах запросов endpoint`ов лент, лайков и подписок"""
+    async with test_db.async_session() as session:
+        test_author = UserModel(
+            name="Blanka", nickname="Electric", email="Bl@capcom.com", token="bla"
+        )
+        test_follower = UserModel(
+            name="Dan", nickname="Saikyo", email="Dan@capcom.com", token="dan"
+        )
+        session.add_all([test_author, test_follower])
+        await session.commit()
+        session.add(
+            FollowerModel(following_id=test_author.id, followers_id=test_follower.id)
+        )
+        test_tweet = TweetModel(author_id=test_author.id, content="FooBar")
+        session.add(test_tweet)
+        await session.commit()
+
+    statements = {}
+
+    def remember(conn, cursor, statement, parameters, context, executemany):
+        statements.setdefault(statement, parameters)
+
+    token_cache.clear()
+    event.listen(test_db.engine.sync_engine, "before_cursor_execute", remember)
+
+    async def call(method: str, url: str, status_code: int, **kwargs) -> dict:
+        # ответ с ошибкой не выполнит проверяемые запросы, и проверка планов
+        # прошла бы впустую
+        response = await ac.request(method, url, **kwargs)
+        assert response.status_code == status_code, response.text
+        body = response.json()
+        assert body.get("result", True) is True, body
+        return body
+
+    try:
+        author, follower = test_author.token, test_follower.token
+        new_tweet = await call(
+            "POST",
+            f"/api/tweets/?api_key={author}",
+            201,
+            json={"content": "Foo", "tweet_media_ids": []},
+        )
+        tweet_id = new_tweet["tweet_id"]
+        await call("POST", f"/api/tweets/{tweet_id}/likes/?api_key={follower}", 201)
+        await call("GET", f"/api/tweets/?api_key={follower}", 200)
+        await call("GET", f"/api/tweets/{tweet_id}/likes/?api_key={follower}", 200)
+        await call("DELETE", f"/api/tweets/{tweet_id}/likes/?api_key={follower}", 200)
+        await call("DELETE", f"/api/tweets/{tweet_id}/?api_key={author}", 200)
+        await call("GET", f"/api/users/me?api_key={follower}", 200)
+        await call("GET", f"/api/users/{test_author.id}", 200)
+        await call("GET", f"/api/users/{test_author.id}/followers/?limit=1", 200)
+        await call(
+            "GET", f"/api/users/{test_follower.id}/following/?cursor=MTAwNTAw", 200
+        )
+        await call(
+            "DELETE", f"/api/users/{test_author.id}/follow/?api_key={follower}", 200
+        )
+        await call(
+            "POST", f"/api/users/{test_author.id}/follow/?api_key={follower}", 201
+        )
+        await call(
+            "DELETE", f"/api/users/{test_author.id}/follow/?api_key={follower}", 200
+        )
+        bulk_likes = await call(
+            "POST",
+            f"/api/tweets/likes/?api_key={follower}",
+            201,
+            json={"tweet_ids": [test_tweet.id]},
+        )
+        assert bulk_likes["likes"] == [{"tweet_id": test_tweet.id, "result": True}]
+        bulk_follows = await call(
+            "POST",
+            f"/api/users/follow/?api_key={follower}",
+            201,
+            json={"user_ids": [test_author.id]},
+        )
+        assert bulk_follows["follows"] == [{"user_id": test_author.id, "result": True}]
+    finally:
+        event.remove(test_db.engine.sync_engine, "before_cursor_execute", remember)
+
+    problems = []
+    for statement, parameters in statements.items():
+        plan, scans = await explain(statement, parameters)
+        print(f"\n{statement}\n{plan}")
+        if scans:
+            problems.append(f"{statement}\n -> {'; '.join(scans)}")
+
+    assert statements
+    assert not problems, "Queries without index:\n" + "\n\n".join(problems)
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_timeline_version_reads_only_indexes():
+    """
+    Тест на стоимость версии ленты: `likes_version` суммируется по индексу
+    `idx_tweets_author_likes_version` без чтения строк твитов
+    """
+    async with test_db.async_session() as session:
+        test_author = UserModel(
+            name="Gouken", nickname="Master", email="Gk@capcom.com", token="gou"
+        )
+        test_follower = UserModel(
+            name="Oro", nickname="Hermit", email="Or@capcom.com", token="oro"
+        )
+        session.add_all([test_author, test_follower])
+        await session.commit()
+        session.add(
+            FollowerModel(following_id=test_author.id, followers_id=test_follower.id)
+        )
+        session.add_all(
+            TweetModel(author_id=test_author.id, content="FooBar") for _ in range(3)
+        )
+        await session.commit()
+
+    statements = {}
+
+    def remember(conn, cursor, statement, parameters, context, executemany):
+        statements.setdefault(statement, parameters)
+
+    event.listen(test_db.engine.sync_engine, "before_cursor_execute", remember)
+    try:
+        async with test_db.async_session() as session:
+            version = await read_timeline_version(session, test_follower.id)
+            assert version == (1, 3, 0)
+    finally:
+        event.remove(test_db.engine.sync_engine, "before_cursor_execute", remember)
+
+    [(statement, parameters)] = statements.items()
+    plan, scans = await explain(statement, parameters)
+    print(f"\n{statement}\n{plan}")
+    assert not scans
+    tweet_scans = [line for line in plan.splitlines() if " on tweets" in line]
+    assert len(tweet_scans) == 1, plan
+    assert "Index Only Scan using idx_tweets_author_likes_version" in tweet_scans[0]
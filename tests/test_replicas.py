@@ -0,0 +1,128 @@
+"""Модуль для тестов распределения запросов между основной БД и репликами"""
+
+from time import time
+
+import pytest
+from fastapi import Request
+from httpx import AsyncClient
+
+from config import READ_YOUR_WRITES_COOKIE, TEST_DB_PATH
+from main import app
+from models.base import DBConnect, y_blog_db
+from models.user import UserModel
+from Y_blog.check_user_token import read_token_user_id, token_cache
+from .conftest import test_db
+
+
+def make_request(method: str, last_write: float | None = None) -> Request:
+    """Создание объекта запроса с cookie времени последней записи клиента"""
+    headers = []
+    if last_write is not None:
+        headers.append((b"cookie", f"{READ_YOUR_WRITES_COOKIE}={last_write}".encode()))
+    return Request({"type": "http", "method": method, "headers": headers})
+
+
+async def session_engine(dependency, request: Request):
+    """Получение движка, к которому привязана сессия из зависимости"""
+    sessions = dependency(request)
+    session = await anext(sessions)
+    engine = session.bind
+    await sessions.aclose()
+    return engine
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_read_session_routing():
+    """Тест на чтение с реплик по очереди и чтение своих записей с основной БД"""
+    # вместо реплик используется та же тестовая БД через отдельные подключения
+    db = DBConnect(url=TEST_DB_PATH, replica_urls=[TEST_DB_PATH, TEST_DB_PATH])
+    try:
+        read = db.read_session_dependency
+        assert await session_engine(read, make_request("GET")) is db.replica_engines[0]
+        assert await session_engine(read, make_request("GET")) is db.replica_engines[1]
+
+        assert await session_engine(read, make_request("GET", time())) is db.engine
+        assert (
+            await session_engine(read, make_request("GET", time() - 10))
+            is db.replica_engines[0]
+        )
+        assert (
+            await session_engine(read, make_request("GET", "garbage"))
+            is db.replica_engines[1]
+        )
+    finally:
+        for engine in (db.engine, *db.replica_engines):
+            await engine.dispose()
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_read_your_writes_cookie(ac: AsyncClient):
+    """Тест на cookie времени записи: ставится только после успешного commit"""
+    async with test_db.async_session() as session:
+        test_user = UserModel(
+            name="Vega", nickname="Cookie", email="Vc@capcom.com", token="vck"
+        )
+        session.add(test_user)
+        await session.commit()
+
+    response = await ac.post(
+        "/api/tweets/?api_key=wrong", json={"content": "x", "tweet_media_ids": None}
+    )
+    assert response.status_code == 401
+    assert READ_YOUR_WRITES_COOKIE not in response.cookies
+
+    response = await ac.delete("/api/tweets/100500/?api_key=vck")
+    assert response.status_code == 404
+    assert READ_YOUR_WRITES_COOKIE not in response.cookies
+
+    response = await ac.post(
+        "/api/tweets/?api_key=vck", json={"content": "x", "tweet_media_ids": None}
+    )
+    assert response.status_code == 201
+    assert time() - float(response.cookies[READ_YOUR_WRITES_COOKIE]) < 5
+    ac.cookies.clear()
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_get_user_from_replica(ac: AsyncClient):
+    """Тест на получение профиля пользователя с реплики"""
+    async with test_db.async_session() as session:
+        test_user = UserModel(
+            name="Vega", nickname="Claw", email="Vg@capcom.com", token="vcl"
+        )
+        session.add(test_user)
+        await session.commit()
+
+    db = DBConnect(url=TEST_DB_PATH, replica_urls=[TEST_DB_PATH])
+    app.dependency_overrides[y_blog_db.read_session_dependency] = (
+        db.read_session_dependency
+    )
+    try:
+        response = await ac.get(f"api/users/{test_user.id}")
+        assert response.status_code == 200
+        assert db.replica_engines[0].pool.status_dict()["checkouts"] == 1
+        assert db.engine.pool.status_dict()["checkouts"] == 0
+    finally:
+        app.dependency_overrides[y_blog_db.read_session_dependency] = (
+            test_db.read_session_dependency
+        )
+        for engine in (db.engine, *db.replica_engines):
+            await engine.dispose()
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_replica_miss_not_cached():
+    """Тест на то, что отсутствие токена на реплике не попадает в кэш"""
+    db = DBConnect(url=TEST_DB_PATH, replica_urls=[TEST_DB_PATH])
+    try:
+        async with db.replica_sessions[0]() as session:
+            assert await read_token_user_id(session, "lagging") is None
+        assert token_cache.get("lagging") == (False, None)
+
+        async with db.async_session() as session:
+            assert await read_token_user_id(session, "lagging") is None
+        assert token_cache.get("lagging") == (True, None)
+    finally:
+        token_cache.invalidate("lagging")
+        for engine in (db.engine, *db.replica_engines):
+            await engine.dispose()
@@ -0,0 +1,95 @@
+"""Модуль для тестов служебных endpoint`ов"""
+
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import exc, text
+
+from config import TEST_DB_PATH
+from models.base import DBConnect
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_get_pool_stats(ac: AsyncClient):
+    """Тест на получение состояния пула подключений"""
+    response = await ac.get("/api/service/pool")
+
+    assert response.status_code == 200
+    assert {"checked_out", "idle", "overflow", "wait_time_max"} <= set(
+        response.json()["pool"]
+    )
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_pool_stats_overflow_and_timeouts():
+    """Тест на учёт переполнения пула и таймаутов ожидания подключения"""
+    db = DBConnect(url=TEST_DB_PATH, pool_size=1, max_overflow=1, pool_timeout=0.1)
+    try:
+        async with db.engine.connect() as first, db.engine.connect() as second:
+            await first.execute(text("SELECT 1"))
+            await second.execute(text("SELECT 1"))
+            assert db.pool_stats()["checked_out"] == 2
+            with pytest.raises(exc.TimeoutError):
+                async with db.engine.connect() as third:
+                    await third.execute(text("SELECT 1"))
+
+        await asyncio.sleep(0)
+        stats = db.pool_stats()
+        assert stats["checked_out"] == 0
+        assert stats["idle"] == 1
+        assert stats["overflow_events"] == 1
+        assert stats["timeouts"] == 1
+        assert stats["checkouts"] == 2
+        assert stats["wait_time_max"] >= 0.1
+    finally:
+        await db.engine.dispose()
+
+
+async def read_metrics(ac: AsyncClient) -> dict[str, float]:
+    """Значения метрик из `/metrics`: `имя{метки} -> значение`"""
+    response = await ac.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    samples = {}
+    for line in response.text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_metrics(ac: AsyncClient):
+    """Тест на метрики endpoint`ов в формате Prometheus"""
+    route = 'method="GET",route="/api/users/{id}"'
+    unmatched = (
+        'yblog_http_responses_total{method="GET",route="unmatched",status="404"}'
+    )
+    before = await read_metrics(ac)
+    await ac.get("/api/users/100500")
+    await ac.get("/api/users/100500")
+    await ac.get("/api/no-such-endpoint")
+    after = await read_metrics(ac)
+
+    def delta(name: str) -> float:
+        return after[name] - before.get(name, 0)
+
+    assert delta(f'yblog_http_responses_total{{{route},status="404"}}') == 2
+    assert (
+        delta(f'yblog_http_request_duration_seconds_bucket{{{route},le="+Inf"}}') == 2
+    )
+    # версия профиля и сам профиль - два запроса к БД на каждый HTTP-запрос
+    assert delta(f"yblog_db_queries_per_request_sum{{{route}}}") == 4
+    assert delta(f'yblog_db_queries_per_request_bucket{{{route},le="2"}}') == 2
+    assert delta(f"yblog_db_time_per_request_seconds_sum{{{route}}}") > 0
+    assert after[f"yblog_http_requests_in_flight{{{route}}}"] == 0
+    assert delta(unmatched) == 1
+    assert 'yblog_admission_queued{priority="read"}' in after
+    assert 'yblog_db_pool_connections{state="checked_out"}' in after
+    assert 'yblog_admission_shed_total{reason="timeout"}' in after
+    assert 'yblog_token_cache_lookups_total{result="miss"}' in after
+    assert "yblog_token_cache_evictions_total" in after
+
+    response = await ac.get("/metrics")
+    assert "# TYPE yblog_admission_shed_total counter" in response.text
@@ -1,5 +1,7 @@
 """Модуль для тестов endpoint`ов связанных с моделью `Tweet`"""
 
+import asyncio
+
 import pytest
 from httpx import AsyncClient
 from sqlalchemy import select, desc
@@ -9,6 +11,9 @@ from models.tweet import TweetModel
 from models.user import UserModel
 from models.followers import FollowerModel
 from models.likes import LikeModel
+from models.timeline import TimelineModel
+from models.like_counter import LikeCounterShardModel
+from Y_blog.tweets.counters import fold_like_counters
 
 
 @pytest.mark.asyncio(scope="session")
@@ -137,3 +142,344 @@ async def test_delete_like(ac: AsyncClient, user_for_tweets):
     assert response.status_code == 200
     assert response.json()["result"] is True
     assert result.likes_count == test_tweet.likes_count - 1
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_get_tweets_pages(ac: AsyncClient):
+    """Тест на постраничное получение ленты по курсору"""
+    async with test_db.async_session() as session:
+        test_author = UserModel(
+            name="Guile", nickname="Sonic_Boom", email="G@capcom.com", token="ggg"
+        )
+        test_follower = UserModel(
+            name="Chun-Li", nickname="Kikoken", email="CL@capcom.com", token="chl"
+        )
+        session.add_all([test_author, test_follower])
+        await session.commit()
+
+        session.add_all(
+            [
+                TweetModel(
+                    author_id=test_author.id, content=f"Foo{i}", likes_count=i % 2
+                )
+                for i in range(5)
+            ]
+        )
+        session.add(
+            FollowerModel(following_id=test_author.id, followers_id=test_follower.id)
+        )
+        await session.commit()
+
+    tweet_ids = []
+    cursor = None
+    for _ in range(3):
+        params = {"api_key": test_follower.token, "limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = await ac.get("/api/tweets/", params=params)
+        assert response.status_code == 200
+        tweet_ids.extend(tweet["id"] for tweet in response.json()["tweets"])
+        cursor = response.json()["next_cursor"]
+
+    assert cursor is None
+    assert len(tweet_ids) == len(set(tweet_ids)) == 5
+
+    response = await ac.get(
+        "/api/tweets/", params={"api_key": test_follower.token, "cursor": "foo"}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_timeline_fanout(ac: AsyncClient, monkeypatch):
+    """Тест на доставку твитов в материализованные ленты подписчиков"""
+    async with test_db.async_session() as session:
+        test_author = UserModel(
+            name="Zangief", nickname="Red_Cyclone", email="Z@capcom.com", token="zzz"
+        )
+        test_follower = UserModel(
+            name="Dhalsim", nickname="Yoga", email="D@capcom.com", token="ddd"
+        )
+        session.add_all([test_author, test_follower])
+        await session.commit()
+        session.add(
+            FollowerModel(following_id=test_author.id, followers_id=test_follower.id)
+        )
+        await session.commit()
+
+    response = await ac.post(
+        f"/api/tweets/?api_key={test_author.token}",
+        json={"content": "Foo", "tweet_media_ids": []},
+    )
+    tweet_id = response.json()["tweet_id"]
+
+    async with test_db.async_session() as session:
+        query = select(TimelineModel.tweet_id).where(
+            TimelineModel.user_id == test_follower.id
+        )
+        assert list(await session.scalars(query)) == [tweet_id]
+
+    await ac.delete(f"api/users/{test_author.id}/follow/?api_key={test_follower.token}")
+    async with test_db.async_session() as session:
+        assert list(await session.scalars(query)) == []
+
+    monkeypatch.setattr("models.timeline.TIMELINE_FANOUT_LIMIT", 0)
+    await ac.post(f"api/users/{test_author.id}/follow/?api_key={test_follower.token}")
+    response = await ac.post(
+        f"/api/tweets/?api_key={test_author.token}",
+        json={"content": "Bar", "tweet_media_ids": []},
+    )
+    async with test_db.async_session() as session:
+        assert list(await session.scalars(query)) == [tweet_id]
+        author = await session.get(UserModel, test_author.id)
+        assert author.fanout_on_read is True
+
+    response = await ac.get(f"/api/tweets/?api_key={test_follower.token}")
+    assert {tweet["content"] for tweet in response.json()["tweets"]} == {"Foo", "Bar"}
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_concurrent_likes(ac: AsyncClient, user_for_tweets):
+    """Тест на корректность `likes_count` при одновременных лайках"""
+    async with test_db.async_session() as session:
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        fans = [
+            UserModel(
+                name=f"Fan{i}",
+                nickname=f"Fan_{i}",
+                email=f"F{i}@capcom.com",
+                token=f"f{i}",
+            )
+            for i in range(8)
+        ]
+        session.add(test_tweet)
+        session.add_all(fans)
+        await session.commit()
+
+    responses = await asyncio.gather(
+        *(
+            ac.post(f"/api/tweets/{test_tweet.id}/likes/?api_key={fan.token}")
+            for fan in fans + fans
+        )
+    )
+    results = [response.json()["result"] for response in responses]
+
+    async with test_db.async_session() as session:
+        result = await session.get(TweetModel, test_tweet.id)
+
+    assert results.count(True) == len(fans)
+    assert result.likes_count == len(fans)
+
+    response = await ac.post(f"/api/tweets/100500/likes/?api_key={fans[0].token}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_sharded_like_counters(ac: AsyncClient, user_for_tweets, monkeypatch):
+    """Тест на лайки в режиме шардированных счётчиков и их перенос в `likes_count`"""
+    monkeypatch.setattr("Y_blog.tweets.counters.LIKES_COUNTER_SHARDS", 4)
+    async with test_db.async_session() as session:
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        fans = [
+            UserModel(
+                name=f"Shard{i}",
+                nickname=f"Shard_{i}",
+                email=f"S{i}@capcom.com",
+                token=f"s{i}",
+            )
+            for i in range(6)
+        ]
+        session.add(test_tweet)
+        session.add_all(fans)
+        await session.commit()
+
+    await asyncio.gather(
+        *(
+            ac.post(f"/api/tweets/{test_tweet.id}/likes/?api_key={fan.token}")
+            for fan in fans
+        )
+    )
+    response = await ac.delete(
+        f"/api/tweets/{test_tweet.id}/likes/?api_key={fans[0].token}"
+    )
+    assert response.json()["result"] is True
+
+    async with test_db.async_session() as session:
+        result = await session.get(TweetModel, test_tweet.id)
+        assert result.likes_count == 0
+
+        await fold_like_counters(session)
+        await session.refresh(result)
+        assert result.likes_count == len(fans) - 1
+        assert await session.scalar(select(LikeCounterShardModel)) is None
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_tweet_likes(ac: AsyncClient, monkeypatch):
+    """Тест на ограниченный список лайкнувших в ленте и постраничный список лайков"""
+    monkeypatch.setattr("Y_blog.tweets.crud.TIMELINE_LIKERS_LIMIT", 2)
+    async with test_db.async_session() as session:
+        test_author = UserModel(
+            name="Akuma", nickname="Gou", email="A@capcom.com", token="aaa"
+        )
+        test_follower = UserModel(
+            name="Gen", nickname="Assassin", email="Gen@capcom.com", token="gen"
+        )
+        fans = [
+            UserModel(
+                name=f"Like{i}",
+                nickname=f"Like_{i}",
+                email=f"L{i}@capcom.com",
+                token=f"l{i}",
+            )
+            for i in range(4)
+        ]
+        session.add_all([test_author, test_follower, *fans])
+        await session.commit()
+        test_tweet = TweetModel(author_id=test_author.id, content="FooBar")
+        session.add(test_tweet)
+        session.add(
+            FollowerModel(following_id=test_author.id, followers_id=test_follower.id)
+        )
+        await session.commit()
+
+    for user in (test_follower, *fans):
+        await ac.post(f"/api/tweets/{test_tweet.id}/likes/?api_key={user.token}")
+
+    response = await ac.get(f"/api/tweets/?api_key={test_follower.token}")
+    tweet = response.json()["tweets"][0]
+    assert tweet["likes_count"] == 5
+    assert [like["user_id"] for like in tweet["likes"]] == [
+        fans[3].id,
+        fans[2].id,
+        test_follower.id,
+    ]
+
+    liker_ids = []
+    cursor = None
+    for _ in range(3):
+        params = {"api_key": test_follower.token, "limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = await ac.get(f"/api/tweets/{test_tweet.id}/likes/", params=params)
+        assert response.status_code == 200
+        liker_ids.extend(like["user_id"] for like in response.json()["likes"])
+        cursor = response.json()["next_cursor"]
+
+    assert cursor is None
+    assert liker_ids == [user.id for user in reversed((test_follower, *fans))]
+
+    response = await ac.get(f"/api/tweets/100500/likes/?api_key={test_follower.token}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_bulk_likes(ac: AsyncClient, user_for_tweets):
+    """Тест на лайки нескольких твитов одним запросом"""
+    async with test_db.async_session() as session:
+        test_fan = UserModel(
+            name="Juri", nickname="Spider", email="J@capcom.com", token="jjj"
+        )
+        test_tweets = [
+            TweetModel(author_id=user_for_tweets.id, content=f"Foo{i}")
+            for i in range(3)
+        ]
+        session.add(test_fan)
+        session.add_all(test_tweets)
+        await session.commit()
+        session.add(LikeModel(user_id=test_fan.id, tweet_id=test_tweets[0].id))
+        await session.commit()
+
+    tweet_ids = [tweet.id for tweet in test_tweets]
+    response = await ac.post(
+        f"/api/tweets/likes/?api_key={test_fan.token}",
+        json={"tweet_ids": tweet_ids + [tweet_ids[1], 100500]},
+    )
+
+    assert response.status_code == 201
+    likes = response.json()["likes"]
+    assert [like["tweet_id"] for like in likes] == tweet_ids + [100500]
+    assert [like["result"] for like in likes] == [False, True, True, False]
+    assert "already" in likes[0]["message"]
+    assert likes[1] == {"tweet_id": tweet_ids[1], "result": True}
+    assert "not found" in likes[3]["ERROR"]
+    async with test_db.async_session() as session:
+        likes_counts = await session.scalars(
+            select(TweetModel.likes_count)
+            .where(TweetModel.id.in_(tweet_ids))
+            .order_by(TweetModel.id)
+        )
+        assert list(likes_counts) == [0, 1, 1]
+
+    response = await ac.post(
+        f"/api/tweets/likes/?api_key={test_fan.token}",
+        json={"tweet_ids": list(range(1, 102))},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_get_tweets_not_modified(ac: AsyncClient, user_for_tweets):
+    """Тест на ответ `304` на ленту, которая не менялась с прошлого запроса"""
+    async with test_db.async_session() as session:
+        test_follower = UserModel(
+            name="Sakura", nickname="Schoolgirl", email="Sa@capcom.com", token="sak"
+        )
+        test_tweet = TweetModel(author_id=user_for_tweets.id, content="FooBar")
+        session.add_all((test_follower, test_tweet))
+        await session.commit()
+        session.add(
+            FollowerModel(
+                following_id=user_for_tweets.id, followers_id=test_follower.id
+            )
+        )
+        await session.commit()
+
+    url = f"/api/tweets/?api_key={test_follower.token}"
+    response = await ac.get(url)
+    etag = response.headers["etag"]
+    assert response.status_code == 200
+
+    response = await ac.get(url, headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = await ac.get(f"{url}&limit=1", headers={"if-none-match": etag})
+    assert response.status_code == 200
+
+    # лайк, отмена лайка, новый твит и удаление твита автора меняют ленту
+    async with test_db.async_session() as session:
+        content_version = await session.scalar(
+            select(UserModel.content_version).where(UserModel.id == user_for_tweets.id)
+        )
+    likes_url = f"/api/tweets/{test_tweet.id}/likes/?api_key={test_follower.token}"
+    await ac.post(likes_url)
+    response = await ac.get(url, headers={"if-none-match": etag})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    # лайк меняет версию твита, а не строку автора в `users`
+    async with test_db.async_session() as session:
+        tweet = await session.get(TweetModel, test_tweet.id)
+        author = await session.get(UserModel, user_for_tweets.id)
+        assert tweet.likes_version == 1
+        assert author.content_version == content_version
+
+    await ac.delete(likes_url)
+    response = await ac.get(url, headers={"if-none-match": etag})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    await ac.post(
+        f"/api/tweets/?api_key={user_for_tweets.token}",
+        json={"content": "Foo", "tweet_media_ids": None},
+    )
+    response = await ac.get(url, headers={"if-none-match": etag})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    await ac.delete(f"/api/tweets/{test_tweet.id}/?api_key={user_for_tweets.token}")
+    response = await ac.get(url, headers={"if-none-match": etag})
+    assert response.status_code == 200
+    assert test_tweet.id not in [tweet["id"] for tweet in response.json()["tweets"]]
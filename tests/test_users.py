@@ -5,8 +5,10 @@ from httpx import AsyncClient
 from sqlalchemy import select
 
 from .conftest import test_db
+from models.tweet import TweetModel
 from models.user import UserModel
 from models.followers import FollowerModel
+from Y_blog.check_user_token import TokenCache, token_cache
 
 
 @pytest.mark.asyncio(scope="session")
@@ -123,3 +125,207 @@ async def test_unfollow(ac: AsyncClient):
 
     assert response.status_code == 200
     assert response.json()["result"] is True
+
+
+def test_token_cache_evictions():
+    """Тест на вытеснение старых записей из заполненного кэша `api_key`"""
+    cache = TokenCache(maxsize=2, ttl=60, negative_ttl=1)
+    for number, token in enumerate(("a", "b", "c")):
+        cache.set(token, number)
+
+    assert cache.get("a") == (False, None)
+    assert cache.get("c") == (True, 2)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_token_cache(ac: AsyncClient):
+    """Тест на кэширование `api_key` и сброс отрицательной записи после регистрации"""
+    stats = token_cache.stats()
+
+    response = await ac.get("api/users/me?api_key=sss")
+    assert response.status_code == 401
+    response = await ac.get("api/users/me?api_key=sss")
+    assert response.status_code == 401
+    assert token_cache.stats()["hits"] == stats["hits"] + 1
+    assert token_cache.stats()["misses"] == stats["misses"] + 1
+
+    await ac.post(
+        "api/users/?api_key=sss",
+        json={"name": "Sagat", "nickname": "Tiger", "email": "S@capcom.com"},
+    )
+    response = await ac.get("api/users/me?api_key=sss")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_bulk_follow(ac: AsyncClient):
+    """Тест на подписку на нескольких пользователей одним запросом"""
+    async with test_db.async_session() as session:
+        test_follower = UserModel(
+            name="Cody", nickname="Travers", email="Co@capcom.com", token="cod"
+        )
+        test_authors = [
+            UserModel(
+                name=f"Mad{i}",
+                nickname=f"Gear_{i}",
+                email=f"Mg{i}@capcom.com",
+                token=f"mg{i}",
+            )
+            for i in range(3)
+        ]
+        session.add(test_follower)
+        session.add_all(test_authors)
+        await session.commit()
+        session.add(
+            FollowerModel(
+                following_id=test_authors[0].id, followers_id=test_follower.id
+            )
+        )
+        session.add(TweetModel(author_id=test_authors[1].id, content="FooBar"))
+        await session.commit()
+
+    author_ids = [author.id for author in test_authors]
+    response = await ac.post(
+        f"/api/users/follow/?api_key={test_follower.token}",
+        json={"user_ids": author_ids + [test_follower.id, 100500]},
+    )
+
+    assert response.status_code == 201
+    follows = response.json()["follows"]
+    assert [follow["user_id"] for follow in follows] == author_ids + [
+        test_follower.id,
+        100500,
+    ]
+    assert [follow["result"] for follow in follows] == [
+        False,
+        True,
+        True,
+        False,
+        False,
+    ]
+    async with test_db.async_session() as session:
+        following = await session.scalars(
+            select(FollowerModel.following_id).where(
+                FollowerModel.followers_id == test_follower.id
+            )
+        )
+        assert sorted(following) == author_ids
+
+    response = await ac.get(f"/api/tweets/?api_key={test_follower.token}")
+    assert [tweet["content"] for tweet in response.json()["tweets"]] == ["FooBar"]
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_get_user_info_not_modified(ac: AsyncClient):
+    """Тест на ответ `304` на профиль, который не менялся с прошлого запроса"""
+    async with test_db.async_session() as session:
+        test_user = UserModel(
+            name="Rolento", nickname="Soldier", email="Ro@capcom.com", token="rol"
+        )
+        test_fan = UserModel(
+            name="Sodom", nickname="Samurai", email="So@capcom.com", token="sod"
+        )
+        session.add_all((test_user, test_fan))
+        await session.commit()
+
+    url = f"/api/users/me?api_key={test_user.token}"
+    response = await ac.get(url)
+    etag = response.headers["etag"]
+    assert response.status_code == 200
+
+    response = await ac.get(url, headers={"if-none-match": etag})
+    assert response.status_code == 304
+    response = await ac.get(
+        f"/api/users/{test_user.id}", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 304
+
+    await ac.post(f"/api/users/{test_user.id}/follow/?api_key={test_fan.token}")
+    response = await ac.get(url, headers={"if-none-match": etag})
+    assert response.status_code == 200
+    assert response.json()["user"]["followers"] == [
+        {"id": test_fan.id, "name": test_fan.nickname}
+    ]
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_follow_counts(ac: AsyncClient, monkeypatch):
+    """Тест на счётчики подписок и постраничные списки подписчиков и подписок"""
+    monkeypatch.setattr("Y_blog.users.crud.PROFILE_FOLLOWS_LIMIT", 2)
+    async with test_db.async_session() as session:
+        test_user = UserModel(
+            name="Birdie", nickname="Chain", email="Bi@capcom.com", token="bir"
+        )
+        test_fans = [
+            UserModel(
+                name=f"Guy{i}",
+                nickname=f"Bushin_{i}",
+                email=f"Guy{i}@capcom.com",
+                token=f"guy{i}",
+            )
+            for i in range(3)
+        ]
+        session.add(test_user)
+        session.add_all(test_fans)
+        await session.commit()
+
+    for test_fan in test_fans[:2]:
+        await ac.post(f"/api/users/{test_user.id}/follow/?api_key={test_fan.token}")
+    await ac.post(
+        f"/api/users/follow/?api_key={test_fans[2].token}",
+        json={"user_ids": [test_user.id, test_fans[0].id]},
+    )
+    await ac.delete(f"/api/users/{test_user.id}/follow/?api_key={test_fans[0].token}")
+    await ac.post(f"/api/users/{test_fans[0].id}/follow/?api_key={test_user.token}")
+
+    async with test_db.async_session() as session:
+        counts = await session.execute(
+            select(UserModel.followers_count, UserModel.following_count)
+            .where(UserModel.id.in_([test_user.id, test_fans[0].id, test_fans[2].id]))
+            .order_by(UserModel.id)
+        )
+        assert counts.all() == [(2, 1), (2, 0), (0, 2)]
+
+    response = await ac.get(f"/api/users/{test_user.id}")
+    profile = response.json()["user"]
+    assert profile["followers_count"] == 2
+    assert profile["following_count"] == 1
+    assert [fan["id"] for fan in profile["followers"]] == [
+        test_fans[2].id,
+        test_fans[1].id,
+    ]
+    assert profile["followers_next_cursor"] is None
+    assert profile["following"] == [{"id": test_fans[0].id, "name": "Bushin_0"}]
+
+    # подписка смотрящего видна, даже если его нет среди встроенных подписчиков
+    monkeypatch.setattr("Y_blog.users.crud.PROFILE_FOLLOWS_LIMIT", 1)
+    response = await ac.get(f"/api/users/{test_user.id}?api_key={test_fans[1].token}")
+    profile = response.json()["user"]
+    assert profile["followers"] == [{"id": test_fans[2].id, "name": "Bushin_2"}]
+    assert profile["is_following"] is True
+    response = await ac.get(f"/api/users/{test_user.id}?api_key={test_fans[0].token}")
+    assert response.json()["user"]["is_following"] is False
+    response = await ac.get(f"/api/users/{test_user.id}?api_key=nobody")
+    assert response.status_code == 401
+
+    response = await ac.get(f"/api/users/{test_user.id}/followers/?limit=1")
+    page = response.json()
+    assert response.status_code == 200
+    assert [fan["id"] for fan in page["users"]] == [test_fans[2].id]
+    response = await ac.get(
+        f"/api/users/{test_user.id}/followers/?limit=1&cursor={page['next_cursor']}"
+    )
+    page = response.json()
+    assert [fan["id"] for fan in page["users"]] == [test_fans[1].id]
+    assert page["next_cursor"] is None
+
+    response = await ac.get(f"/api/users/{test_fans[2].id}/following/")
+    assert {user["id"] for user in response.json()["users"]} == {
+        test_fans[0].id,
+        test_user.id,
+    }
+    response = await ac.get("/api/users/100500/followers/")
+    assert response.status_code == 404